@@ -1,35 +1,63 @@
 from langgraph.prebuilt import create_react_agent
-from tools import tavily_tool, scrape_webpages, write_document, edit_document, read_document, create_outline, python_repl_tool
-from llm import llm
+from lazy import lazy_attributes
 
-# 搜索
-search_agent = create_react_agent(llm, tools=[tavily_tool])
+# 各智能体在首次使用时创建，只用到调研团队的请求不会创建写作团队的智能体
+# 每个智能体按自身角色取模型（见 llm.ROLE_PARENTS），可单独配置模型与参数
 
+# 搜索
+def _search_agent():
+    from llm import get_model
+    from tools import tavily_tool
+    return create_react_agent(get_model("search"), tools=[tavily_tool])
 
 # 爬虫
-web_scraper_agent = create_react_agent(llm, tools=[scrape_webpages])
+def _web_scraper_agent():
+    from llm import get_model
+    from tools import scrape_webpages, search_passages, read_artifact
+    return create_react_agent(get_model("web_scraper"), tools=[scrape_webpages, search_passages, read_artifact])
 
 # 写文档
-doc_writer_agent = create_react_agent(
-    llm,
-    tools=[write_document, edit_document, read_document],
-    prompt=(
-        "你可以根据记录员的大纲读取、撰写和编辑文档。"
-        "无需提出后续问题。"
-    ),
-)
+def _doc_writer_agent():
+    from llm import get_model
+    from tools import write_document, edit_document, read_document, search_passages, read_artifact
+    return create_react_agent(
+        get_model("doc_writer"),
+        tools=[write_document, edit_document, read_document, search_passages, read_artifact],
+        prompt=(
+            "你可以根据记录员的大纲读取、撰写和编辑文档。"
+            "需要调研资料的原文细节时，用 search_passages 检索段落，并在文中注明段落编号。"
+            "无需提出后续问题。"
+        ),
+    )
 
 # 写大纲
-note_taking_agent = create_react_agent(
-    llm,
-    tools=[create_outline, read_document],
-    prompt=(
-        "你可以读取文档并为文档撰写者创建大纲。"
-        "无需提出后续问题。"
-    ),
-)
+def _note_taking_agent():
+    from llm import get_model
+    from tools import create_outline, read_document, search_passages, read_artifact
+    return create_react_agent(
+        get_model("note_taker"),
+        tools=[create_outline, read_document, search_passages, read_artifact],
+        prompt=(
+            "你可以读取文档并为文档撰写者创建大纲。"
+            "需要调研资料的原文细节时，用 search_passages 检索段落。"
+            "无需提出后续问题。"
+        ),
+    )
 
 # 生成图表python代码
-chart_generating_agent = create_react_agent(
-    llm, tools=[read_document, python_repl_tool]
-)
\ No newline at end of file
+def _chart_generating_agent():
+    from llm import get_model
+    from tools import read_document, python_repl_tool, read_artifact
+    return create_react_agent(
+        get_model("chart_generator"), tools=[read_document, python_repl_tool, read_artifact]
+    )
+
+AGENTS = {
+    "search_agent": _search_agent,
+    "web_scraper_agent": _web_scraper_agent,
+    "doc_writer_agent": _doc_writer_agent,
+    "note_taking_agent": _note_taking_agent,
+    "chart_generating_agent": _chart_generating_agent,
+}
+
+__getattr__ = lazy_attributes(globals(), AGENTS)
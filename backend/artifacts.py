@@ -0,0 +1,178 @@
+"""按内容哈希存放的大段工具输出。
+
+超过 ARTIFACT_INLINE_CHARS 的工具结果不再原样进入消息历史，而是存入本存储，
+消息中只保留 <Artifact> 句柄与开头的预览；工具（read_artifact）或最终回答在需要时再按 id 取回全文。
+全文始终写入共享的运行数据目录（按内容哈希命名），运行被其他执行进程接手时仍能读取；
+内存中只缓存最近使用的内容。相同内容只存一份，引用按会话记录在同目录的 SQLite 中，
+只有引用过某内容的会话能读取它，最后一个引用它的会话结束时删除。
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+from metrics import registry
+from runlog import RUN_DATA_DIR
+
+# 超过该字符数的工具输出存入本存储；句柄中预览的字符数
+ARTIFACT_INLINE_CHARS = int(os.environ.get("ARTIFACT_INLINE_CHARS", 4000))
+ARTIFACT_PREVIEW_CHARS = int(os.environ.get("ARTIFACT_PREVIEW_CHARS", 500))
+# 内存中缓存的内容总字节数（全文始终写入磁盘目录）
+ARTIFACT_MEMORY_BYTES = int(os.environ.get("ARTIFACT_MEMORY_BYTES", 64 * 1024 * 1024))
+ARTIFACT_DIRECTORY = Path(os.environ.get("ARTIFACT_DIRECTORY", str(RUN_DATA_DIR / "artifacts")))
+# 最终回答的提示词中最多展开的句柄内容字符数
+ARTIFACT_ANSWER_CHARS = int(os.environ.get("ARTIFACT_ANSWER_CHARS", 8000))
+
+ARTIFACT_BYTES_TOTAL = registry.counter(
+    "artifact_bytes_total", "工具输出字节数：stored 为存入存储的全文，inline 为留在消息中的内容（含句柄与预览）", ("placement",)
+)
+ARTIFACT_WRITTEN_BYTES_TOTAL = registry.counter("artifact_written_bytes_total", "写入磁盘的内容字节数（相同内容只写一次）")
+
+_HANDLE_PATTERN = re.compile(r'<Artifact id="([0-9a-f]{16})" chars="\d+">.*?</Artifact>', re.S)
+
+def content_id(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+def make_handle(artifact_id: str, text: str, preview_chars: int = ARTIFACT_PREVIEW_CHARS) -> str:
+    return (
+        f'<Artifact id="{artifact_id}" chars="{len(text)}">\n{text[:preview_chars]}\n'
+        f"…[已折叠，共 {len(text)} 字，可用 read_artifact 读取全文]\n</Artifact>"
+    )
+
+class ArtifactStore:
+    def __init__(self, directory: Path = ARTIFACT_DIRECTORY, memory_bytes: int = ARTIFACT_MEMORY_BYTES):
+        self.directory = Path(directory)
+        self.memory_bytes = memory_bytes
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._in_memory = 0
+        self._usage: Dict[str, Dict[str, int]] = {}  # 会话 -> 本进程中的字节统计
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # 多个进程共用同一个库，写锁冲突时等待而不是立即失败
+        self._db = sqlite3.connect(str(self.directory / "refs.sqlite"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS refs (artifact_id TEXT, session_id TEXT, PRIMARY KEY (artifact_id, session_id))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS refs_session ON refs (session_id)")
+        self._db.commit()
+
+    def _path(self, artifact_id: str) -> Path:
+        return self.directory / artifact_id[:2] / artifact_id
+
+    def _cache(self, artifact_id: str, text: str) -> None:
+        # 调用方持有锁；最近存入或读取的条目始终留在内存中
+        if artifact_id in self._memory:
+            self._memory.move_to_end(artifact_id)
+            return
+        self._memory[artifact_id] = text
+        self._in_memory += len(text.encode())
+        while self._in_memory > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._in_memory -= len(evicted.encode())
+
+    def _record(self, session_id: str, key: str, size: int) -> None:
+        usage = self._usage.setdefault(session_id, {"stored_bytes": 0, "inline_bytes": 0, "artifacts": 0})
+        usage[key] += size
+
+    def put(self, session_id: str, text: str) -> str:
+        """存入内容并返回内容 id，相同内容只写一次磁盘"""
+        artifact_id = content_id(text)
+        size = len(text.encode())
+        with self._lock:
+            self._cache(artifact_id, text)
+            added = self._db.execute(
+                "INSERT OR IGNORE INTO refs VALUES (?, ?)", (artifact_id, session_id)
+            ).rowcount
+            self._db.commit()
+            if added:
+                self._record(session_id, "artifacts", 1)
+            self._record(session_id, "stored_bytes", size)
+        # 引用提交之后再检查文件：其他进程的 release 在同一事务内删除无引用的文件，不会删掉这里要用的内容
+        path = self._path(artifact_id)
+        if not path.exists():
+            # 先写临时文件再改名，其他进程不会读到写了一半的内容
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{artifact_id}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(text)
+            os.replace(tmp, path)
+            ARTIFACT_WRITTEN_BYTES_TOTAL.inc(size)
+        ARTIFACT_BYTES_TOTAL.inc(size, "stored")
+        return artifact_id
+
+    def get(self, session_id: str, artifact_id: str) -> Optional[str]:
+        """读取本会话引用过的内容；其他会话的内容、已删除或不存在的 id 返回 None"""
+        with self._lock:
+            if self._db.execute(
+                "SELECT 1 FROM refs WHERE artifact_id = ? AND session_id = ?", (artifact_id, session_id)
+            ).fetchone() is None:
+                return None
+            if artifact_id in self._memory:
+                self._memory.move_to_end(artifact_id)
+                return self._memory[artifact_id]
+        try:
+            text = self._path(artifact_id).read_text()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._cache(artifact_id, text)
+        return text
+
+    def offload(self, session_id: str, text: str) -> str:
+        """工具输出的统一出口：短内容原样返回，长内容存入后返回句柄与预览"""
+        if len(text) > ARTIFACT_INLINE_CHARS:
+            text = make_handle(self.put(session_id, text), text)
+        size = len(text.encode())
+        with self._lock:
+            self._record(session_id, "inline_bytes", size)
+        ARTIFACT_BYTES_TOTAL.inc(size, "inline")
+        return text
+
+    def expand(self, session_id: str, text: str, budget: int = ARTIFACT_ANSWER_CHARS) -> str:
+        """按出现顺序把本会话的句柄替换为全文，累计不超过 budget 字符；超出预算或无法读取的保留句柄"""
+        remaining = budget
+
+        def replace(match: re.Match) -> str:
+            nonlocal remaining
+            content = self.get(session_id, match.group(1))
+            if content is None or len(content) > remaining:
+                return match.group(0)
+            remaining -= len(content)
+            return content
+
+        return _HANDLE_PATTERN.sub(replace, text)
+
+    def stats(self, session_id: str) -> Dict[str, int]:
+        """本进程中该会话存入存储的字节数、留在消息中的字节数与存储条目数"""
+        with self._lock:
+            return dict(self._usage.get(session_id) or {"stored_bytes": 0, "inline_bytes": 0, "artifacts": 0})
+
+    def suspend(self, session_id: str) -> None:
+        """会话中断：只丢弃本进程的字节统计，引用与内容保留以便恢复"""
+        with self._lock:
+            self._usage.pop(session_id, None)
+
+    def release(self, session_id: str) -> None:
+        """会话结束：删除该会话的引用，以及不再被任何会话引用的内容"""
+        with self._lock:
+            self._usage.pop(session_id, None)
+            artifact_ids = [
+                row[0] for row in self._db.execute("SELECT artifact_id FROM refs WHERE session_id = ?", (session_id,))
+            ]
+            self._db.execute("DELETE FROM refs WHERE session_id = ?", (session_id,))
+            orphaned = [
+                artifact_id for artifact_id in artifact_ids
+                if self._db.execute("SELECT 1 FROM refs WHERE artifact_id = ?", (artifact_id,)).fetchone() is None
+            ]
+            # 在提交前删除文件：其他进程同时存入相同内容时，其引用要等本事务提交后才能写入，随后会重新写出文件
+            for artifact_id in orphaned:
+                self._path(artifact_id).unlink(missing_ok=True)
+                text = self._memory.pop(artifact_id, None)
+                if text is not None:
+                    self._in_memory -= len(text.encode())
+            self._db.commit()
+
+artifact_store = ArtifactStore()
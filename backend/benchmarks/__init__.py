@@ -0,0 +1,51 @@
+# 离线基准测试：用本地替身驱动 super_graph 与 api_app
+import dataclasses
+import os
+import sys
+import tempfile
+from typing import Dict, Optional
+
+from .fakes import FakeChatModel, Script, make_fake_tavily
+from .fixtures import FakeOpenAIServer, FixtureServer
+
+# 替身必须在这些模块首次导入前安装，编译图、创建智能体时会绑定 llm / tavily_tool
+_BOUND_MODULES = ("agents", "graph", "main")
+
+
+def install_fakes(
+    script: Script, fixture_base_url: str, tiers: Optional[Dict[str, dict]] = None, search_delay: float = 0.05
+) -> FakeChatModel:
+    """用假模型和假 Tavily 工具替换 llm.llm 与 tools.tavily_tool，返回假模型。
+
+    LLM_CACHE=1 时假模型同样套上响应缓存，可测量缓存命中的效果。
+    tiers 按角色（见 llm.ROLE_PARENTS）给出剧本字段的覆盖值（如更小的延迟），
+    为这些角色单独安装假模型，调用统计与主假模型合并。
+    search_delay 为假搜索工具每次调用的延迟（秒）。
+    """
+    loaded = [name for name in _BOUND_MODULES if name in sys.modules]
+    if loaded:
+        raise RuntimeError(f"替身须在导入 {loaded} 之前安装")
+
+    # llm.py / TavilySearch 在首次使用时校验环境变量，这里给出占位值
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    os.environ.setdefault("DEEPSEEK_BASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("TAVILY_API_KEY", "bench")
+    os.environ.setdefault("USER_AGENT", "hierarchical-agent-bench")
+    # 搜索缓存只用内存层、网页不落盘，保证各次运行互不影响
+    os.environ.setdefault("SEARCH_CACHE_PATH", "")
+    os.environ.setdefault("SCRAPE_CACHE_PATH", "")
+    os.environ.setdefault("LLM_CACHE_PATH", "")
+    os.environ.setdefault("RUN_DATA_DIR", tempfile.mkdtemp(prefix="bench-runs-"))
+
+    import llm
+    import tools
+
+    fake = FakeChatModel(script=script)
+    llm.llm = llm.with_llm_cache(fake)
+    for role, overrides in (tiers or {}).items():
+        tier = FakeChatModel(script=dataclasses.replace(script, **overrides), stats=fake.stats)
+        llm.set_model(role, llm.with_llm_cache(tier))
+    tools.tavily_tool = tools.IndexedSearchTool(
+        tools.CachedSearchTool(make_fake_tavily(fixture_base_url, delay=search_delay), tools.search_cache)
+    )
+    return fake
@@ -0,0 +1,281 @@
+"""离线基准测试用的本地替身：假聊天模型、假 Tavily 工具。
+
+假模型按提示词判断调用类型（监督者路由 / 规划 / 最终回答 / 工作智能体），
+按剧本输出路由 JSON、计划 JSON、回答 token 流和工具调用，不访问任何外部服务。
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolMessage, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import StructuredTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict, Field
+
+# 监督者系统提示词中成员列表的位置，见 graph/notes.py 的 make_supervisor_node
+_MEMBERS_PATTERN = re.compile(r"协作：(.+?)。")
+_SUPERVISOR_MARK = "你是监督者"
+_PLANNER_MARK = "你是规划者"
+_ANSWER_MARK = "基于以下对话历史"
+
+# 工作智能体绑定多个工具时，按此优先级选择要调用的工具
+PREFERRED_TOOLS = [
+    "tavily_search",
+    "scrape_webpages",
+    "create_outline",
+    "write_document",
+    "python_repl_tool",
+    "read_document",
+]
+
+
+@dataclass
+class Script:
+    """假模型的剧本。
+
+    routes 以监督者的第一个成员名为键（如 "research_team"、"search"、"doc_writer"），
+    值为依次给出的路由决策（成员名，或并行模式下的成员名列表）；
+    决策序号 = 历史中已由该监督者成员产生的消息数，因此剧本与并发请求无关。
+    剧本用尽后返回 FINISH。
+    plan 为先规划后执行模式下规划调用返回的步骤列表（格式见 graph/planner.py）。
+    """
+    routes: Dict[str, List[Union[str, List[str]]]] = field(default_factory=dict)
+    plan: List[dict] = field(default_factory=list)
+    answer_tokens: int = 200
+    worker_tokens: int = 40
+    token_delay: float = 0.005
+    first_token_delay: float = 0.05
+    chars_per_token: int = 4
+    scrape_urls: List[str] = field(default_factory=list)
+
+
+class CallStats:
+    """按调用类型统计假模型的调用次数、输出 token 数与提示词字符数（线程安全）。"""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.tokens: Dict[str, int] = {}
+        self.prompt_chars: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, tokens: int, prompt_chars: int = 0) -> None:
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            self.tokens[kind] = self.tokens.get(kind, 0) + tokens
+            self.prompt_chars[kind] = self.prompt_chars.get(kind, 0) + prompt_chars
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"calls": dict(self.calls), "tokens": dict(self.tokens), "prompt_chars": dict(self.prompt_chars)}
+
+
+def classify(messages: Sequence[BaseMessage]) -> str:
+    """根据提示词判断调用类型：route / plan / answer / worker。"""
+    if messages and isinstance(messages[0], SystemMessage) and _SUPERVISOR_MARK in messages[0].content:
+        return "route"
+    if messages and isinstance(messages[0], SystemMessage) and _PLANNER_MARK in messages[0].content:
+        return "plan"
+    if (
+        len(messages) == 1
+        and isinstance(messages[0], HumanMessage)
+        and messages[0].content.strip().startswith(_ANSWER_MARK)
+    ):
+        return "answer"
+    return "worker"
+
+
+def _split_tokens(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _question(messages: Sequence[BaseMessage]) -> str:
+    return next(
+        (m.content for m in messages if isinstance(m, HumanMessage) and not m.name and isinstance(m.content, str)),
+        "基准测试问题",
+    )
+
+
+def _prompt_chars(messages: Sequence[BaseMessage]) -> int:
+    return sum(len(m.content) if isinstance(m.content, str) else len(str(m.content)) for m in messages)
+
+
+def _tool_name(tool: dict) -> str:
+    return tool.get("function", {}).get("name") or tool.get("name", "")
+
+
+class FakeChatModel(BaseChatModel):
+    """按 Script 输出的确定性聊天模型，可替换 llm.py 中的 llm。"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    script: Script
+    stats: CallStats = Field(default_factory=CallStats)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-bench-chat"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    # ---- 剧本 ----
+
+    def _route(self, messages: Sequence[BaseMessage]) -> str:
+        match = _MEMBERS_PATTERN.search(messages[0].content)
+        members = [m.strip() for m in match.group(1).split(",")] if match else []
+        plan = self.script.routes.get(members[0], []) if members else []
+        done = sum(1 for msg in messages[1:] if getattr(msg, "name", None) in members)
+        goto = plan[done] if done < len(plan) else "FINISH"
+        return json.dumps({"next": goto}, ensure_ascii=False)
+
+    def _tool_call(self, tools: List[dict], messages: Sequence[BaseMessage]) -> Optional[dict]:
+        # 已经拿到工具结果则直接给出总结
+        if not tools or any(isinstance(msg, ToolMessage) for msg in messages):
+            return None
+        names = [_tool_name(t) for t in tools]
+        name = next((n for n in PREFERRED_TOOLS if n in names), names[0])
+        args = {
+            # 与真实智能体一样以用户问题作为首个查询
+            "tavily_search": {"query": _question(messages)},
+            "scrape_webpages": {"urls": list(self.script.scrape_urls)},
+            "create_outline": {"points": ["背景", "方法", "结论"], "file_name": "outline.md"},
+            "write_document": {"content": "基准测试文档\n" * 20, "file_name": "report.md"},
+            "python_repl_tool": {"code": "print(sum(range(1000)))"},
+            "read_document": {"file_name": "outline.md"},
+            "search_passages": {"query": "推理加速方法"},
+        }.get(name, {})
+        return {"name": name, "args": args, "id": f"call_{name}_{len(messages)}"}
+
+    def _plan(self, messages: Sequence[BaseMessage], tools: List[dict]):
+        """返回 (调用类型, 文本 token 列表, 工具调用)。"""
+        kind = classify(messages)
+        size = self.script.chars_per_token
+        if kind == "route":
+            return kind, _split_tokens(self._route(messages), size), None
+        if kind == "plan":
+            plan = json.dumps({"steps": self.script.plan}, ensure_ascii=False)
+            return kind, _split_tokens(plan, size), None
+        if kind == "answer":
+            return kind, [f"答{i % 10}" for i in range(self.script.answer_tokens)], None
+        tool_call = self._tool_call(tools, messages)
+        if tool_call:
+            return kind, [], tool_call
+        return kind, [f"结果{i % 10}" for i in range(self.script.worker_tokens)], None
+
+    # ---- BaseChatModel 接口 ----
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        chunks = list(self._stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+        message = chunks[0].message
+        for chunk in chunks[1:]:
+            message = message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=message_chunk_to_message(message))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        kind, tokens, tool_call = self._plan(messages, kwargs.get("tools") or [])
+        self.stats.record(kind, len(tokens), _prompt_chars(messages))
+        time.sleep(self.script.first_token_delay)
+        for chunk in self._chunks(tokens, tool_call):
+            yield chunk
+            time.sleep(self.script.token_delay)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = None
+        async for chunk in self._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            message = chunk.message if message is None else message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=message_chunk_to_message(message))])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ):
+        kind, tokens, tool_call = self._plan(messages, kwargs.get("tools") or [])
+        self.stats.record(kind, len(tokens), _prompt_chars(messages))
+        await asyncio.sleep(self.script.first_token_delay)
+        for chunk in self._chunks(tokens, tool_call):
+            if run_manager and chunk.message.content:
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(self.script.token_delay)
+
+    @staticmethod
+    def _chunks(tokens: List[str], tool_call: Optional[dict]) -> Iterator[ChatGenerationChunk]:
+        if tool_call:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[{
+                    "name": tool_call["name"],
+                    "args": json.dumps(tool_call["args"], ensure_ascii=False),
+                    "id": tool_call["id"],
+                    "index": 0,
+                }],
+            ))
+            return
+        for token in tokens:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def make_fake_tavily(base_url: str, max_results: int = 5, delay: float = 0.05) -> StructuredTool:
+    """与 TavilySearch 同名、同返回结构的假搜索工具，结果链接指向本地夹具服务器。"""
+
+    def _results(query: str) -> dict:
+        return {
+            "query": query,
+            "follow_up_questions": None,
+            "answer": None,
+            "images": [],
+            "results": [
+                {
+                    "url": f"{base_url}/page/{i}",
+                    "title": f"Fixture page {i}",
+                    "content": f"关于「{query}」的摘要 {i}。" * 5,
+                    "score": round(1 - i * 0.1, 2),
+                    "raw_content": None,
+                }
+                for i in range(max_results)
+            ],
+            "response_time": delay,
+        }
+
+    def search(query: str) -> dict:
+        time.sleep(delay)
+        return _results(query)
+
+    async def asearch(query: str) -> dict:
+        await asyncio.sleep(delay)
+        return _results(query)
+
+    return StructuredTool.from_function(
+        func=search,
+        coroutine=asearch,
+        name="tavily_search",
+        description="A search engine optimized for comprehensive, accurate, and trusted results.",
+    )
@@ -0,0 +1,220 @@
+"""本地 HTTP 夹具服务器：为 scrape_webpages 提供固定内容的网页，以及 OpenAI 兼容的模型接口替身。"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_BOILERPLATE = (
+    "<nav><a href='/'>首页</a> | <a href='/about'>关于</a> | <a href='/login'>登录</a></nav>"
+    "<script>window.analytics = {};</script>"
+)
+_FOOTER = "<footer>© Fixture Inc. 隐私政策 | 联系我们</footer>"
+
+
+def render_page(index: int, size_kb: int) -> bytes:
+    paragraph = f"<p>第 {index} 页的正文段落，用于测量抓取与上下文开销。Lorem ipsum dolor sit amet.</p>"
+    body = paragraph * max(1, size_kb * 1024 // len(paragraph.encode()))
+    return (
+        f"<html><head><title>Fixture page {index}</title></head><body>"
+        f"{_BOILERPLATE}<article><h1>Fixture page {index}</h1>{body}</article>{_FOOTER}"
+        "</body></html>"
+    ).encode()
+
+
+class FixtureServer:
+    """在后台线程运行的网页夹具服务器。
+
+    Args:
+        page_kb: 每个页面正文的大约大小（KB）
+        delay: 每个请求的响应延迟（秒），模拟慢站点
+    """
+
+    def __init__(self, page_kb: int = 20, delay: float = 0.05):
+        self.page_kb = page_kb
+        self.delay = delay
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def urls(self, count: int) -> list[str]:
+        return [f"{self.base_url}/page/{i}" for i in range(count)]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.delay)
+                try:
+                    index = int(self.path.rstrip("/").rsplit("/", 1)[-1])
+                except ValueError:
+                    index = 0
+                payload = render_page(index, server.page_kb)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeOpenAIServer:
+    """在后台线程运行的 OpenAI 兼容 /chat/completions 替身，用于测试传输层。
+
+    Args:
+        ttft: 首个分块前的延迟（秒）
+        tokens: 每次响应的输出分块数
+        token_delay: 分块之间的延迟（秒）
+        slow_rate: 首个分块额外变慢的请求比例，模拟长尾
+        slow_ttft: 长尾请求的首个分块延迟（秒）
+        error_rate: 直接返回 429 的请求比例
+        retry_after: 429 响应的 Retry-After（秒）
+    """
+
+    def __init__(
+        self,
+        ttft: float = 0.05,
+        tokens: int = 8,
+        token_delay: float = 0.005,
+        slow_rate: float = 0.0,
+        slow_ttft: float = 1.0,
+        error_rate: float = 0.0,
+        retry_after: float = 0.1,
+        seed: int = 0,
+    ):
+        import random
+
+        self.ttft = ttft
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.slow_rate = slow_rate
+        self.slow_ttft = slow_ttft
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.stats = {"requests": 0, "rate_limited": 0, "slow": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _draw(self) -> str:
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._random.random()
+            if roll < self.error_rate:
+                self.stats["rate_limited"] += 1
+                return "rate_limited"
+            if roll < self.error_rate + self.slow_rate:
+                self.stats["slow"] += 1
+                return "slow"
+            return "ok"
+
+    def _handler(self):
+        import json
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                outcome = server._draw()
+                if outcome == "rate_limited":
+                    self._send_json(
+                        429,
+                        {"error": {"message": "rate limited", "type": "rate_limit_error"}},
+                        {"Retry-After": f"{server.retry_after:g}"},
+                    )
+                    return
+                time.sleep(server.slow_ttft if outcome == "slow" else server.ttft)
+
+                base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request.get("model", "fake")}
+                tokens = min(server.tokens, request.get("max_tokens") or server.tokens)
+                usage = {"prompt_tokens": 32, "completion_tokens": tokens, "total_tokens": 32 + tokens}
+                if not request.get("stream"):
+                    self._send_json(200, {
+                        **base,
+                        "object": "chat.completion",
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "tok " * tokens},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                def send(choices, extra=None):
+                    chunk = {**base, "object": "chat.completion.chunk", "choices": choices, **(extra or {})}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+
+                try:
+                    for i in range(tokens):
+                        delta = {"role": "assistant", "content": "tok "} if i == 0 else {"content": "tok "}
+                        send([{"index": 0, "delta": delta, "finish_reason": None}])
+                        time.sleep(server.token_delay)
+                    send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                    if (request.get("stream_options") or {}).get("include_usage"):
+                        send([], {"usage": usage})
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # 对冲请求落败后客户端会主动断开
+                    pass
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,483 @@
+"""离线端到端基准测试。
+
+在 backend 目录下运行：
+    python -m benchmarks.run                    # 运行全部场景
+    python -m benchmarks.run -s graph_full -s api_chat_full --token-delay 0.01
+    python -m benchmarks.run --json results.json
+
+每个场景在独立子进程中运行，以便单独统计峰值 RSS。报告指标：
+首 token 时间（ttft）、总耗时、监督者 LLM 调用次数、事件/帧数量、峰值 RSS。
+API 场景额外依赖 httpx。
+graph_cached 开启模型响应缓存（LLM_CACHE=1）并将同一问题运行两次，extra 中的 route_calls_per_run
+为每次运行实际到达模型的路由调用数，第二次为 0 表示监督者路由全部命中缓存。
+graph_speculative 开启监督者推测预取，与抓取延迟相同的 graph_slow_fetch 对比总耗时，
+extra 中给出预测正确（routed）、预取结果被读取（hit）、未命中（miss）次数与被取消的预取耗时。
+graph_full_raw 关闭段落索引（PASSAGE_INDEX=0），工具结果为完整正文；与 graph_full 对比
+result.llm 中的 prompt_chars（各类调用的提示词字符数）与 extra 中的 prompt_chars 合计。
+extra 中的 artifact_bytes 给出大段工具输出存入存储（stored）与留在消息中（inline）的字节数。
+graph_plan / api_chat_plan 使用先规划后执行模式（graph_mode=plan），完成与 *_full 相同的工作，
+extra 中的 llm_round_trips 为全部模型调用次数，与监督者模式对比调用次数和总耗时。
+graph_tiered 为路由角色单独安装更快的假模型，与 graph_full 对比按节点分档模型的端到端收益。
+路由模式通过环境变量 SUPERVISOR_ROUTING_MODE（stream / early_exit）切换，每跳路由耗时写入结果的 extra 字段。
+startup 场景在全新解释器中导入 main 并预热，按顶层包统计导入耗时（python -X importtime）。
+transport 场景让真实的 llm.llm 经传输层访问本地 OpenAI 兼容替身（注入 429 与长尾），
+并发发出路由式短调用，报告延迟分位数与重试、对冲、限流等待次数。
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from . import FakeOpenAIServer, FixtureServer, Script, install_fakes
+
+QUESTION = "请调研大语言模型推理加速的主要方法，并写一份简短报告。"
+
+RESEARCH_ROUTES = {
+    "research_team": ["research_team", "FINISH"],
+    "search": ["search", "web_scraper", "FINISH"],
+}
+# 并行模式下决策序号按已产生的成员消息数计，一轮并行会产生多条消息
+PARALLEL_ROUTES = {
+    "research_team": ["research_team", "writing_team", "FINISH"],
+    "search": [["search", "web_scraper"], "FINISH", "FINISH"],
+    "doc_writer": ["note_taker", ["doc_writer", "chart_generator"], "FINISH", "FINISH"],
+}
+FULL_ROUTES = {
+    "research_team": ["research_team", "writing_team", "FINISH"],
+    "search": ["search", "web_scraper", "FINISH"],
+    "doc_writer": ["note_taker", "doc_writer", "chart_generator", "FINISH"],
+}
+
+# 与 FULL_ROUTES 相同的工作：搜索、抓取后整理大纲，写文档与生成图表互不依赖，并行执行
+FULL_PLAN = [
+    {"id": "s1", "worker": "search", "task": "搜索推理加速方法", "depends_on": []},
+    {"id": "s2", "worker": "web_scraper", "task": "抓取相关网页", "depends_on": ["s1"]},
+    {"id": "s3", "worker": "note_taker", "task": "整理报告大纲", "depends_on": ["s2"]},
+    {"id": "s4", "worker": "doc_writer", "task": "撰写报告", "depends_on": ["s3"]},
+    {"id": "s5", "worker": "chart_generator", "task": "生成对比图表", "depends_on": ["s3"]},
+]
+
+
+# 路由用的小模型：首 token 与逐 token 延迟都远小于默认假模型（代表写作用的大模型）
+_FAST_TIER = {"first_token_delay": 0.01, "token_delay": 0.0005}
+
+# 5% 的请求返回 429，另有 5% 首个分块慢 1 秒
+_FLAKY_SERVER = {"error_rate": 0.05, "slow_rate": 0.05, "slow_ttft": 1.0}
+_TRANSPORT_ENV = {"LLM_RPS": "50", "LLM_BURST": "20", "LLM_RETRY_BASE": "0.05"}
+
+
+@dataclass
+class Scenario:
+    """一个基准场景。target: graph（直接驱动 super_graph，options 中 graph_mode=plan 时驱动 planned_graph）、chat（/api/chat）、stream（/api/stream）、
+    startup（冷启动导入与预热耗时）、transport（模型传输层）。"""
+    name: str
+    target: str
+    routes: Dict[str, list] = field(default_factory=dict)
+    concurrency: int = 1
+    distinct: bool = False  # 并发请求各自使用不同的问题，不触发相同问题的合并
+    answer_tokens: int = 200
+    pages: int = 3
+    page_kb: int = 20
+    options: dict = field(default_factory=dict)  # 透传给 /api/chat 请求体的额外字段
+    env: dict = field(default_factory=dict)  # 子进程导入图之前设置的环境变量
+    executors: int = 0  # 队列模式下在后台线程中运行的执行循环数
+    server: dict = field(default_factory=dict)  # transport 场景中 FakeOpenAIServer 的参数
+    tiers: dict = field(default_factory=dict)  # 角色 -> 剧本覆盖值，模拟按节点分档的模型
+    plan: list = field(default_factory=list)  # 规划调用返回的步骤
+    fetch_delay: float = 0.05  # 网页夹具与假搜索工具的响应延迟（秒）
+    repeat: int = 1  # graph 场景中相同问题依次运行的次数，用于测量跨运行的缓存命中
+
+
+SCENARIOS = {
+    s.name: s
+    for s in [
+        Scenario("graph_research", "graph", RESEARCH_ROUTES),
+        Scenario("graph_full", "graph", FULL_ROUTES),
+        Scenario("graph_full_raw", "graph", FULL_ROUTES, env={"PASSAGE_INDEX": "0"}),
+        Scenario("graph_tiered", "graph", FULL_ROUTES, tiers={"router": _FAST_TIER}),
+        Scenario("graph_slow_fetch", "graph", FULL_ROUTES, fetch_delay=0.5),
+        Scenario("graph_speculative", "graph", FULL_ROUTES, fetch_delay=0.5, env={"SUPERVISOR_SPECULATION": "1"}),
+        Scenario("graph_parallel", "graph", PARALLEL_ROUTES, env={"SUPERVISOR_PARALLEL": "1"}),
+        Scenario("graph_cached", "graph", FULL_ROUTES, env={"LLM_CACHE": "1"}, repeat=2),
+        Scenario("graph_plan", "graph", plan=FULL_PLAN, options={"graph_mode": "plan"}),
+        Scenario("api_chat_full", "chat", FULL_ROUTES),
+        Scenario("api_chat_plan", "chat", plan=FULL_PLAN, options={"graph_mode": "plan"}),
+        Scenario("api_chat_verbose", "chat", FULL_ROUTES, options={"stream_mode": "verbose"}),
+        # 所有请求来自同一客户端：放宽准入额度，使 8 个运行同时执行而不是被 429 拒绝
+        Scenario("api_chat_concurrent", "chat", FULL_ROUTES, concurrency=8, distinct=True,
+                 env={"MAX_RUNS_PER_CLIENT": "8", "MAX_CONCURRENT_RUNS": "8"}),
+        Scenario("api_chat_coalesced", "chat", FULL_ROUTES, concurrency=8),
+        Scenario("api_chat_queue", "chat", FULL_ROUTES, concurrency=2, distinct=True,
+                 env={"EXECUTION_MODE": "queue"}, executors=2),
+        Scenario("api_stream", "stream"),
+        Scenario("startup", "startup"),
+        Scenario("transport", "transport", concurrency=64, server=_FLAKY_SERVER, env=_TRANSPORT_ENV),
+        Scenario("transport_hedged", "transport", concurrency=64, server=_FLAKY_SERVER,
+                 env={**_TRANSPORT_ENV, "LLM_HEDGE": "1", "LLM_HEDGE_DELAY": "0.2"}),
+    ]
+}
+
+
+@dataclass
+class Result:
+    scenario: str
+    ttft_ms: Optional[float] = None
+    wall_ms: float = 0.0
+    supervisor_calls: int = 0
+    events: int = 0
+    bytes: int = 0
+    peak_rss_mb: float = 0.0
+    llm: dict = field(default_factory=dict)
+    extra: dict = field(default_factory=dict)
+
+
+async def drive_graph(scenario: Scenario, result: Result, fake=None) -> None:
+    """直接消费所选图的 astream_events，ttft 为顶层最终回答首个增量事件到达的时间。
+    repeat > 1 时依次运行多次，ttft 与总耗时取最后一次。"""
+    from langchain_core.messages import HumanMessage
+    from graph import FINAL_ANSWER_EVENT
+    from runner import graph_for
+
+    app = graph_for(scenario.options.get("graph_mode", "supervisor"))
+    route_calls = []
+    for _ in range(scenario.repeat):
+        before = fake.stats.snapshot()["calls"].get("route", 0) if fake else 0
+        result.ttft_ms = None
+        start = time.perf_counter()
+        async for event in app.astream_events(
+            {"messages": [HumanMessage(content=QUESTION)]},
+            version="v2",
+            config={"recursion_limit": 150},
+        ):
+            result.events += 1
+            if (
+                result.ttft_ms is None
+                and event["event"] == "on_custom_event"
+                and event["name"] == FINAL_ANSWER_EVENT
+            ):
+                result.ttft_ms = (time.perf_counter() - start) * 1000
+        result.wall_ms = (time.perf_counter() - start) * 1000
+        if fake:
+            route_calls.append(fake.stats.snapshot()["calls"].get("route", 0) - before)
+    if scenario.repeat > 1:
+        result.extra["route_calls_per_run"] = route_calls
+
+
+class _ApiServer:
+    """在后台线程中运行 uvicorn，以便按真实 SSE 分块测量首 token 时间。"""
+
+    def __init__(self):
+        import uvicorn
+        from main import api_app
+
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self.base_url = "http://127.0.0.1:%d" % self._sock.getsockname()[1]
+        self._server = uvicorn.Server(uvicorn.Config(api_app, log_level="warning", lifespan="on"))
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._sock]}, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+async def _consume_sse(client, url: str, body: dict) -> dict:
+    """读取一条 SSE 流，返回帧数、字节数、首个工作智能体输出片段与首个回答片段的到达时间，以及终帧的状态。"""
+    stats = {"frames": 0, "bytes": 0, "ttft": None, "first_progress": None, "status": None, "final": None}
+    start = time.perf_counter()
+    async with client.stream("POST", url, json=body) as response:
+        stats["status"] = response.status_code
+        async for line in response.aiter_lines():
+            stats["bytes"] += len(line.encode()) + 1
+            if not line.startswith("data: "):
+                continue
+            stats["frames"] += 1
+            if '"is_final": true' in line:
+                stats["final"] = json.loads(line[6:]).get("status")
+            if stats["ttft"] is None:
+                frame = json.loads(line[6:])
+                if frame.get("status") == "streaming" and not frame.get("tool_name") and frame.get("content"):
+                    stats["ttft"] = time.perf_counter() - start
+                elif stats["first_progress"] is None and frame.get("status") == "agent_delta":
+                    stats["first_progress"] = time.perf_counter() - start
+    return stats
+
+
+async def drive_api(scenario: Scenario, result: Result) -> None:
+    """通过 HTTP 驱动 /api/chat 或 /api/stream；并发场景下 ttft 取各请求的中位数。"""
+    import httpx
+
+    path = "/api/chat" if scenario.target == "chat" else "/api/stream"
+    with _ApiServer() as server, _Executors(scenario.executors):
+        async with httpx.AsyncClient(base_url=server.base_url, timeout=None) as client:
+            start = time.perf_counter()
+            runs = await asyncio.gather(*[
+                _consume_sse(client, path, {"question": f"{QUESTION} #{i}" if scenario.distinct else QUESTION, **scenario.options})
+                for i in range(scenario.concurrency)
+            ])
+            result.wall_ms = (time.perf_counter() - start) * 1000
+    result.events = sum(r["frames"] for r in runs)
+    result.bytes = sum(r["bytes"] for r in runs)
+    ttfts = sorted(r["ttft"] for r in runs if r["ttft"] is not None)
+    if ttfts:
+        result.ttft_ms = ttfts[len(ttfts) // 2] * 1000
+    # 首个可见的工作智能体输出（首个有用字节），对比 ttft 体现感知延迟的改善
+    progress = sorted(r["first_progress"] for r in runs if r["first_progress"] is not None)
+    if progress:
+        result.extra["first_progress_ms"] = round(progress[len(progress) // 2] * 1000, 1)
+    result.extra["http_status"] = sorted({r["status"] for r in runs})
+    # 任一请求被拒绝或运行出错时场景失败，避免把出错的运行计入耗时对比
+    failed = [r for r in runs if r["status"] != 200 or r["final"] != "success"]
+    if failed:
+        raise RuntimeError(
+            f"{scenario.name}: {len(failed)}/{len(runs)} 个请求未成功完成："
+            f"{sorted({(r['status'], r['final']) for r in failed}, key=str)}"
+        )
+
+
+async def drive_transport(scenario: Scenario, result: Result) -> None:
+    """并发发出路由式短调用（max_tokens 小、开启 hedge），ttft 与各分位数均为单次调用的首分块时间。"""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    import llm
+    from transport import LLM_HEDGES_TOTAL, LLM_RETRIES_TOTAL, LLM_THROTTLE_SECONDS, hedged, start_retry_budget
+
+    routing = hedged(llm.llm.bind(max_tokens=16))
+    messages = [SystemMessage(content="只回答下一步的成员名"), HumanMessage(content=QUESTION)]
+
+    async def call() -> float:
+        start_retry_budget()
+        start = time.perf_counter()
+        async for _ in routing.astream(messages):
+            return time.perf_counter() - start
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*[call() for _ in range(scenario.concurrency)], return_exceptions=True)
+    result.wall_ms = (time.perf_counter() - start) * 1000
+    latencies = sorted(o for o in outcomes if not isinstance(o, BaseException))
+    if latencies:
+        for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            result.extra[name] = round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 1)
+        result.ttft_ms = result.extra["p50_ms"]
+    result.supervisor_calls = len(outcomes)
+    result.extra["failed"] = len(outcomes) - len(latencies)
+    result.extra["retries"] = LLM_RETRIES_TOTAL.total()
+    result.extra["hedges"] = LLM_HEDGES_TOTAL.total()
+    result.extra["throttled"] = LLM_THROTTLE_SECONDS.count()
+
+
+# 冷启动探针：导入 main 后预热，两阶段之间向 stderr 写入分隔行
+_STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+sys.stderr.write("--- warm_up\\n")
+import graph
+graph.warm_up()
+print(json.dumps({"import_ms": (imported - start) * 1000, "warm_up_ms": (time.perf_counter() - imported) * 1000}))
+"""
+
+
+def _import_breakdown(lines: List[str], top: int) -> Dict[str, float]:
+    """按顶层包汇总 -X importtime 输出中最外层导入的累计耗时（毫秒）。"""
+    totals: Dict[str, float] = {}
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        # 名称前的缩进表示嵌套层级，只统计最外层
+        if not cumulative.strip().isdigit() or name[1:2] == " ":
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0.0) + int(cumulative) / 1000
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {name: round(ms, 1) for name, ms in ranked}
+
+
+def measure_startup(result: Result) -> Result:
+    """在全新解释器中测量导入 main 与 graph.warm_up() 的耗时，不访问外部服务。"""
+    env = {
+        **os.environ,
+        "DEEPSEEK_API_KEY": "bench",
+        "DEEPSEEK_BASE_URL": "http://127.0.0.1:9",
+        "TAVILY_API_KEY": "bench",
+        "SEARCH_CACHE_PATH": "",
+        "SCRAPE_CACHE_PATH": "",
+        "LLM_CACHE_PATH": "",
+        "RUN_DATA_DIR": tempfile.mkdtemp(prefix="bench-runs-"),
+    }
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _STARTUP_PROBE],
+        capture_output=True, text=True, check=True, env=env,
+    )
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    import_lines, _, warm_lines = proc.stderr.partition("--- warm_up\n")
+    result.wall_ms = timings["import_ms"] + timings["warm_up_ms"]
+    result.extra["import_ms"] = round(timings["import_ms"], 1)
+    result.extra["warm_up_ms"] = round(timings["warm_up_ms"], 1)
+    result.extra["import_breakdown_ms"] = _import_breakdown(import_lines.splitlines(), top=12)
+    result.extra["warm_up_breakdown_ms"] = _import_breakdown(warm_lines.splitlines(), top=8)
+    result.peak_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return result
+
+
+class _Executors:
+    """在后台线程中运行 executor.serve，使队列模式的执行循环与假模型处于同一进程；执行循环异常退出时场景失败。"""
+
+    def __init__(self, count: int):
+        self._threads = []
+        self._loops = []
+        self._errors: List[BaseException] = []
+        for i in range(count):
+            self._threads.append(threading.Thread(target=self._run, args=(f"bench-{i}",), daemon=True))
+
+    def _run(self, worker: str) -> None:
+        from executor import serve
+
+        loop = asyncio.new_event_loop()
+        self._loops.append(loop)
+        task = loop.create_task(serve(worker, concurrency=1))
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        except BaseException as exc:
+            self._errors.append(exc)
+        finally:
+            loop.close()
+
+    def __enter__(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        for loop in self._loops:
+            loop.call_soon_threadsafe(lambda l=loop: [t.cancel() for t in asyncio.all_tasks(l)])
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self._errors and exc[0] is None:
+            raise RuntimeError(f"执行循环异常退出：{self._errors[0]!r}") from self._errors[0]
+
+
+def run_scenario(scenario: Scenario, token_delay: float) -> Result:
+    """在当前进程内运行单个场景（须在全新进程中调用）。"""
+    result = Result(scenario=scenario.name)
+    if scenario.target == "startup":
+        return measure_startup(result)
+    os.environ.update(scenario.env)
+    if scenario.target == "transport":
+        with FakeOpenAIServer(**scenario.server) as server:
+            os.environ.update({"DEEPSEEK_API_KEY": "bench", "DEEPSEEK_BASE_URL": server.base_url})
+            asyncio.run(drive_transport(scenario, result))
+            result.extra["server"] = dict(server.stats)
+        result.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return result
+    with FixtureServer(page_kb=scenario.page_kb, delay=scenario.fetch_delay) as fixture:
+        script = Script(
+            routes=scenario.routes,
+            plan=scenario.plan,
+            answer_tokens=scenario.answer_tokens,
+            token_delay=token_delay,
+            scrape_urls=fixture.urls(scenario.pages),
+        )
+        fake = install_fakes(script, fixture.base_url, scenario.tiers, search_delay=scenario.fetch_delay)
+        if scenario.target == "graph":
+            asyncio.run(drive_graph(scenario, result, fake))
+        else:
+            asyncio.run(drive_api(scenario, result))
+        result.extra["fixture_requests"] = fixture.requests
+    result.llm = fake.stats.snapshot()
+    from tools import search_cache
+    result.extra["search_cache"] = search_cache.stats()
+    from llm import llm_cache
+    result.extra["llm_cache"] = llm_cache.stats()
+    from graph.notes import routing_timings
+    hops = [t["latency_ms"] for t in routing_timings]
+    if hops:
+        result.extra["routing_mode"] = routing_timings[0]["mode"]
+        result.extra["routing_ms_mean"] = round(sum(hops) / len(hops), 2)
+        result.extra["routing_ms_max"] = round(max(hops), 2)
+    from graph.speculation import SPECULATION_TOTAL, SPECULATION_WASTED_SECONDS
+    outcomes: Dict[str, float] = {}
+    for (node, outcome), count in SPECULATION_TOTAL.snapshot().items():
+        outcomes[outcome] = outcomes.get(outcome, 0) + count
+    if outcomes:
+        result.extra["speculation"] = outcomes
+        result.extra["speculation_wasted_s"] = round(SPECULATION_WASTED_SECONDS.sum(), 3)
+    result.supervisor_calls = result.llm["calls"].get("route", 0)
+    result.extra["llm_round_trips"] = sum(result.llm["calls"].values())
+    result.extra["prompt_chars"] = sum(result.llm["prompt_chars"].values())
+    from artifacts import ARTIFACT_BYTES_TOTAL
+    result.extra["artifact_bytes"] = {placement: int(n) for (placement,), n in ARTIFACT_BYTES_TOTAL.snapshot().items()}
+    result.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def _spawn(name: str, args) -> Result:
+    with tempfile.NamedTemporaryFile(suffix=".json") as out:
+        cmd = [
+            sys.executable, "-m", "benchmarks.run", "--child", name,
+            "--token-delay", str(args.token_delay), "--result-file", out.name,
+        ]
+        subprocess.run(
+            cmd,
+            check=True,
+            stdout=None if args.verbose else subprocess.DEVNULL,
+        )
+        return Result(**json.load(open(out.name)))
+
+
+def _print_table(results: List[Result]) -> None:
+    header = f"{'scenario':<24}{'ttft_ms':>10}{'wall_ms':>10}{'sup_calls':>11}{'events':>9}{'bytes':>10}{'rss_mb':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        ttft = f"{r.ttft_ms:.1f}" if r.ttft_ms is not None else "-"
+        print(
+            f"{r.scenario:<24}{ttft:>10}{r.wall_ms:>10.1f}{r.supervisor_calls:>11}"
+            f"{r.events:>9}{r.bytes:>10}{r.peak_rss_mb:>9.1f}"
+        )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="离线端到端基准测试")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="要运行的场景，可重复")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="假模型每个 token 的延迟（秒）")
+    parser.add_argument("--json", help="将结果写入该 JSON 文件")
+    parser.add_argument("-v", "--verbose", action="store_true", help="显示子进程输出")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = run_scenario(SCENARIOS[args.child], args.token_delay)
+        with open(args.result_file, "w") as f:
+            json.dump(asdict(result), f, ensure_ascii=False)
+        return
+
+    results = [_spawn(name, args) for name in (args.scenario or list(SCENARIOS))]
+    _print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([asdict(r) for r in results], f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# 缓存目录：默认位于 backend/.cache
+CACHE_DIRECTORY = Path(__file__).parent / ".cache"
+
+# 磁盘层过期条目的清理间隔（秒）
+CACHE_PRUNE_INTERVAL = float(os.environ.get("CACHE_PRUNE_INTERVAL", 300))
+
+MISSING = object()
+
+def normalize_query(query: str) -> str:
+    """统一全半角、大小写与空白，使改写格式的重复查询命中同一条缓存"""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return re.sub(r"\s+", " ", query).strip()
+
+class TTLCache:
+    """两级缓存：内存 LRU + 可选的 SQLite 磁盘层，带过期时间、单飞合并与命中统计。
+
+    值必须可 JSON 序列化；磁盘层在进程重启后依然有效。
+
+    Args:
+        name: 缓存名称，同时作为 SQLite 表名
+        ttl: 条目有效期（秒）
+        max_entries: 内存层最多保留的条目数
+        db_path: SQLite 文件路径，None 表示只用内存层
+        max_disk_bytes: 磁盘层值的总字节数上限，超出时按写入先后淘汰，None 表示不限
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        max_entries: int = 1024,
+        db_path: Optional[Path] = None,
+        max_disk_bytes: Optional[int] = None,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evicted": 0}
+        # 进行中的计算：键 -> asyncio.Task / threading.Event
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._inflight_sync: Dict[str, threading.Event] = {}
+
+        self._db = None
+        # 磁盘层的连接单独加锁，内存层的读写不会等待磁盘 I/O
+        self._db_lock = threading.Lock()
+        self._last_prune = 0.0
+        if db_path is not None:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" (key TEXT PRIMARY KEY, value TEXT, expires REAL)'
+            )
+            self._db.execute(f'CREATE INDEX IF NOT EXISTS "{name}_expires" ON "{name}" (expires)')
+            self._db.commit()
+        # 磁盘层大小的估计值，只在超过上限时才精确统计
+        self._disk_bytes = self._disk_size() if self._db is not None else 0
+
+    def _disk_size(self) -> int:
+        return self._db.execute(f'SELECT COALESCE(SUM(LENGTH(value)), 0) FROM "{self.name}"').fetchone()[0]
+
+    # ---- 读写 ----
+
+    def _memory_get(self, key: str, now: float) -> Any:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return value
+                del self._memory[key]
+        return MISSING
+
+    def _disk_get(self, key: str, now: float) -> Any:
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    f'SELECT value, expires FROM "{self.name}" WHERE key = ?', (key,)
+                ).fetchone()
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._remember(key, row[1], value)
+                    self._counters["disk_hits"] += 1
+                return value
+        with self._lock:
+            self._counters["misses"] += 1
+        return MISSING
+
+    def get(self, key: str) -> Any:
+        """返回缓存值，未命中或已过期返回 MISSING"""
+        now = time.time()
+        value = self._memory_get(key, now)
+        return value if value is not MISSING else self._disk_get(key, now)
+
+    async def aget(self, key: str) -> Any:
+        """异步版本：内存层未命中时在线程中查询磁盘层，不阻塞事件循环"""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not MISSING or self._db is None:
+            return value if value is not MISSING else self._disk_get(key, now)
+        return await asyncio.to_thread(self._disk_get, key, now)
+
+    def _remember_new(self, key: str, value: Any) -> float:
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires, value)
+        return expires
+
+    def set(self, key: str, value: Any) -> None:
+        expires = self._remember_new(key, value)
+        if self._db is not None:
+            self._disk_set(key, value, expires)
+
+    async def aset(self, key: str, value: Any) -> None:
+        """异步版本：内存层立即可见，磁盘层在线程中写入"""
+        expires = self._remember_new(key, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_set, key, value, expires)
+
+    def _disk_set(self, key: str, value: Any, expires: float) -> None:
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        with self._db_lock:
+            self._db.execute(
+                f'INSERT OR REPLACE INTO "{self.name}" (key, value, expires) VALUES (?, ?, ?)',
+                (key, payload, expires),
+            )
+            self._disk_bytes += len(payload)
+            # 过期条目按间隔批量清理，不在每次写入时扫描
+            now = time.time()
+            if now - self._last_prune >= CACHE_PRUNE_INTERVAL:
+                self._last_prune = now
+                self._db.execute(f'DELETE FROM "{self.name}" WHERE expires <= ?', (now,))
+            if self.max_disk_bytes is not None and self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        """磁盘层超出容量时淘汰最早写入的条目，直到降到上限的 90%（调用方持有磁盘层的锁）"""
+        total = self._disk_size()
+        if total <= self.max_disk_bytes:
+            self._disk_bytes = total
+            return
+        target = self.max_disk_bytes * 0.9
+        rows = self._db.execute(f'SELECT key, LENGTH(value) FROM "{self.name}" ORDER BY expires').fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+        self._db.executemany(f'DELETE FROM "{self.name}" WHERE key = ?', evicted)
+        with self._lock:
+            self._counters["evicted"] += len(evicted)
+        self._disk_bytes = total
+
+    def _remember(self, key: str, expires: float, value: Any) -> None:
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # ---- 单飞合并 ----
+
+    async def aget_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        """命中则直接返回；相同键的并发请求只计算一次，其余等待同一结果。
+
+        计算在缓存持有的独立任务中进行，所有调用方（包括发起者）只等待其结果：
+        某个调用方被取消（如客户端断开）时计算继续完成并写入缓存，其他等待者不受影响；
+        计算失败时所有等待者收到同一个异常，可自行重试。
+        """
+        value = await self.aget(key)
+        if value is not MISSING:
+            return value
+
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(key)
+        if task is not None and task.get_loop() is loop:
+            self._counters["coalesced"] += 1
+        else:
+            # 其他事件循环（如同进程内多个执行循环）中的计算无法跨循环等待，各自计算
+            task = loop.create_task(self._compute(key, compute, cacheable))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._computed(key, done))
+        return await asyncio.shield(task)
+
+    async def _compute(
+        self, key: str, compute: Callable[[], Awaitable[Any]], cacheable: Callable[[Any], bool]
+    ) -> Any:
+        value = await compute()
+        if cacheable(value):
+            await self.aset(key, value)
+        return value
+
+    def _computed(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 等待者都已取消时避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        cacheable: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        """同步版本：相同键的并发线程只计算一次"""
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        with self._lock:
+            event = self._inflight_sync.get(key)
+            owner = event is None
+            if owner:
+                event = self._inflight_sync[key] = threading.Event()
+
+        if not owner:
+            self._counters["coalesced"] += 1
+            event.wait()
+            value = self.get(key)
+            if value is not MISSING:
+                return value
+            # 首个调用失败或结果不可缓存时自行计算
+            return compute()
+
+        try:
+            value = compute()
+            if cacheable(value):
+                self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight_sync[key]
+            event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._counters["hits"] + self._counters["disk_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                "name": self.name,
+                "entries": len(self._memory),
+                **self._counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,119 @@
+import asyncio
+import io
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+def _split_lines(data: bytes) -> List[bytes]:
+    # 与 readlines() 一致，只按 \n 分行并保留换行符
+    return io.BytesIO(data).readlines()
+
+def _offsets(lines: List[bytes], start: int = 0) -> List[int]:
+    offsets = [start]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+def _scan(path: Path) -> List[int]:
+    # 逐行扫描建立索引，不把整个文件读入内存
+    offsets = [0]
+    with path.open("rb") as f:
+        for line in f:
+            offsets.append(offsets[-1] + len(line))
+    return offsets
+
+class Document:
+    """按行偏移索引的文档：内存中只保存每行在文件中的起始字节偏移（末尾为文件长度）。
+    区间读取只读取相关的字节；插入只重写第一个插入点之后的部分，在末尾追加时只写入新增的行。"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.offsets: Optional[List[int]] = None
+        self.lock = asyncio.Lock()
+
+    def _load(self) -> List[int]:
+        if self.offsets is None:
+            if not self.path.exists():
+                raise FileNotFoundError(f"文档不存在：{self.path.name}")
+            self.offsets = _scan(self.path)
+        return self.offsets
+
+    def _write(self, content: str) -> None:
+        data = content.encode("utf-8")
+        self.path.write_bytes(data)
+        self.offsets = _offsets(_split_lines(data))
+
+    def _read(self, start: int, end: Optional[int]) -> List[str]:
+        offsets = self._load()
+        span = range(len(offsets) - 1)[start:end]
+        if not span:
+            return []
+        with self.path.open("rb") as f:
+            f.seek(offsets[span.start])
+            data = f.read(offsets[span.stop] - offsets[span.start])
+        return [line.decode("utf-8") for line in _split_lines(data)]
+
+    def _insert(self, inserts: Dict[int, str]) -> Optional[int]:
+        offsets = self._load()
+        count = len(offsets) - 1
+        sorted_inserts = sorted(inserts.items())
+        # 先整体校验，第 i 次插入时文档已增加 i 行
+        for i, (line_number, _) in enumerate(sorted_inserts):
+            if not 1 <= line_number <= count + i + 1:
+                return line_number
+        if not sorted_inserts:
+            return None
+        first = sorted_inserts[0][0] - 1
+        with self.path.open("r+b") as f:
+            f.seek(offsets[first])
+            tail = _split_lines(f.read())
+            for line_number, text in sorted_inserts:
+                tail.insert(line_number - 1 - first, (text + "\n").encode("utf-8"))
+            f.seek(offsets[first])
+            f.write(b"".join(tail))
+        self.offsets = offsets[:first] + _offsets(tail, offsets[first])
+        return None
+
+class DocumentStore:
+    """按会话隔离的文档存储，每个会话一个子目录，会话结束时整体删除"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._documents: Dict[Tuple[str, str], Document] = {}
+
+    def _document(self, session_id: str, file_name: str) -> Document:
+        # 只取文件名，避免跨会话或越出工作目录
+        name = Path(file_name).name
+        key = (session_id, name)
+        if key not in self._documents:
+            directory = self.root / session_id
+            directory.mkdir(parents=True, exist_ok=True)
+            self._documents[key] = Document(directory / name)
+        return self._documents[key]
+
+    async def write(self, session_id: str, file_name: str, content: str) -> None:
+        doc = self._document(session_id, file_name)
+        async with doc.lock:
+            await asyncio.to_thread(doc._write, content)
+
+    async def read(self, session_id: str, file_name: str, start: int = 0, end: Optional[int] = None) -> List[str]:
+        doc = self._document(session_id, file_name)
+        async with doc.lock:
+            return await asyncio.to_thread(doc._read, start, end)
+
+    async def insert(self, session_id: str, file_name: str, inserts: Dict[int, str]) -> Optional[int]:
+        """按行号（从 1 开始）插入文本；有行号越界时不做任何修改并返回该行号"""
+        doc = self._document(session_id, file_name)
+        async with doc.lock:
+            return await asyncio.to_thread(doc._insert, inserts)
+
+    def suspend(self, session_id: str) -> None:
+        """会话中断：丢弃内存中的行索引，编辑都已写入文件，恢复时重新扫描建立索引"""
+        for key in [key for key in self._documents if key[0] == session_id]:
+            del self._documents[key]
+
+    def release(self, session_id: str) -> None:
+        """删除会话的全部文档"""
+        for key in [key for key in self._documents if key[0] == session_id]:
+            del self._documents[key]
+        shutil.rmtree(self.root / session_id, ignore_errors=True)
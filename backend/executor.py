@@ -0,0 +1,123 @@
+"""图执行进程：从运行队列领取运行并执行，事件写入运行日志，由 API 进程读取后推送给客户端。
+
+API 以 EXECUTION_MODE=queue 启动时只负责入队与推送，图的执行全部在这里完成：
+    python executor.py --processes 2 --concurrency 2
+API 进程与执行进程可分别扩缩；同一台机器上通过 RUN_DATA_DIR 下的 SQLite 文件共享队列、事件与检查点。
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+from typing import Dict, Set
+
+from runlog import RUN_DATA_DIR, RUN_LEASE_SECONDS
+
+# 会话文档放在共享目录中，运行被其他执行进程接手时仍能读到
+os.environ.setdefault("DOCUMENT_DIRECTORY", str(RUN_DATA_DIR / "documents"))
+
+# 执行进程数、每个进程同时执行的运行数、空闲时轮询队列的间隔（秒）
+EXECUTOR_PROCESSES = int(os.environ.get("EXECUTOR_PROCESSES", 2))
+EXECUTOR_CONCURRENCY = int(os.environ.get("EXECUTOR_CONCURRENCY", 2))
+EXECUTOR_POLL_INTERVAL = float(os.environ.get("EXECUTOR_POLL_INTERVAL", 0.2))
+# 续约并检查取消请求的间隔，须明显小于租约时长
+HEARTBEAT_INTERVAL = min(1.0, RUN_LEASE_SECONDS / 3)
+
+logger = logging.getLogger(__name__)
+
+async def _execute(run: dict) -> None:
+    from runner import execute_run
+
+    try:
+        # 执行进程内没有订阅者，事件只写入日志
+        await execute_run(run["run_id"], run["question"], run["stream_mode"], lambda chunk: None, run["graph_mode"])
+    except asyncio.CancelledError:
+        # 所有订阅者都已断开：execute_run 已标记为 interrupted 并保留检查点，客户端带 run_id 重连时重新排队继续
+        pass
+
+async def serve(worker: str, concurrency: int) -> None:
+    import graph
+    from runner import open_checkpointer, run_log, sweep_interrupted_runs
+    from sandbox import repl_pool
+    from logs import fields
+
+    conn = await open_checkpointer()
+    await asyncio.to_thread(repl_pool.warm)
+    await asyncio.to_thread(graph.warm_up)
+    logger.info("执行进程就绪", extra=fields(worker=worker, concurrency=concurrency))
+
+    # 中断超时的运行由各执行进程定期清理（同一运行只会被一个进程领到）
+    sweeper = asyncio.create_task(sweep_interrupted_runs())
+    tasks: Dict[str, asyncio.Task] = {}
+    # 因订阅者全部断开而取消的运行，退出时不重新排队
+    cancelled: Set[str] = set()
+    loop = asyncio.get_running_loop()
+    next_heartbeat = loop.time()
+    try:
+        while True:
+            for run_id in [run_id for run_id, task in tasks.items() if task.done()]:
+                del tasks[run_id]
+                cancelled.discard(run_id)
+
+            if loop.time() >= next_heartbeat:
+                next_heartbeat = loop.time() + HEARTBEAT_INTERVAL
+                for run_id in run_log.heartbeat(worker, list(tasks)):
+                    cancelled.add(run_id)
+                    tasks[run_id].cancel()
+
+            claimed = False
+            while len(tasks) < concurrency:
+                run = run_log.claim(worker)
+                if run is None:
+                    break
+                claimed = True
+                tasks[run["run_id"]] = asyncio.create_task(_execute(run))
+
+            if not claimed:
+                await asyncio.sleep(EXECUTOR_POLL_INTERVAL)
+    finally:
+        sweeper.cancel()
+        unfinished = [run_id for run_id, task in tasks.items() if not task.done() and run_id not in cancelled]
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        # 执行进程退出时未完成的运行重新排队，由其他执行进程从检查点继续
+        for run_id in unfinished:
+            run_log.requeue(run_id)
+        repl_pool.shutdown()
+        await conn.close()
+
+def _process_main(worker: str, concurrency: int) -> None:
+    from logs import configure_logging
+
+    configure_logging()
+    try:
+        asyncio.run(serve(worker, concurrency))
+    except KeyboardInterrupt:
+        pass
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="从运行队列领取并执行图的工作进程")
+    parser.add_argument("--processes", type=int, default=EXECUTOR_PROCESSES, help="执行进程数")
+    parser.add_argument("--concurrency", type=int, default=EXECUTOR_CONCURRENCY, help="每个进程同时执行的运行数")
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context("spawn")
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    processes = [
+        context.Process(target=_process_main, args=(f"{prefix}-{i}", args.concurrency))
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,76 @@
-# 构造流程图
-from .index import super_graph
-from .research_graph import research_graph
-from .paper_writing_graph import paper_writing_graph
\ No newline at end of file
+# 构造流程图：图在首次访问 super_graph 等属性时编译，导入本包不加载模型与工具
+import asyncio
+import threading
+import weakref
+from .events import FINAL_ANSWER_EVENT, TEAM_KEY, WORKER_KEY, WORKER_STREAM_TAG
+
+_GRAPHS = ("super_graph", "research_graph", "paper_writing_graph", "planned_graph")
+_lock = threading.Lock()
+_compiled = False
+# 事件循环 -> 检查点存储；事件循环 -> {图名: 挂载了该存储的图副本}
+_checkpointers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = weakref.WeakKeyDictionary()
+_bound: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+def _compile() -> None:
+    global _compiled
+    from .index import super_graph
+    from .research_graph import research_graph
+    from .paper_writing_graph import paper_writing_graph
+    from .planner import planned_graph
+
+    # 导入子模块时会把同名模块对象绑定到包上，这里改为编译好的图
+    globals().update(
+        super_graph=super_graph,
+        research_graph=research_graph,
+        paper_writing_graph=paper_writing_graph,
+        planned_graph=planned_graph,
+    )
+    _compiled = True
+
+def __getattr__(name: str):
+    if name not in _GRAPHS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _lock:
+        if not _compiled:
+            _compile()
+    return globals()[name]
+
+def attach_checkpointer(checkpointer) -> None:
+    """为当前事件循环挂载检查点存储（须在事件循环内调用）。
+    异步 SQLite 连接只能在创建它的事件循环中使用，同一进程内的多个事件循环（如在线程中运行的多个执行循环）
+    各自挂载，通过 bound_graph 取得挂载了本循环存储的图。
+    研究/写作子图在团队节点内调用，以 checkpointer=None 编译，运行时自动继承顶层的检查点存储，
+    按各自的命名空间保存进度。"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        _checkpointers[loop] = checkpointer
+        _bound.pop(loop, None)
+
+def current_checkpointer():
+    """当前事件循环挂载的检查点存储，未挂载时返回 None（不会触发图的编译）"""
+    with _lock:
+        return _checkpointers.get(asyncio.get_running_loop())
+
+def bound_graph(name: str):
+    """返回挂载了当前事件循环检查点存储的顶层图；当前循环未挂载时返回不带检查点的图"""
+    app = __getattr__(name)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return app
+    with _lock:
+        checkpointer = _checkpointers.get(loop)
+        if checkpointer is None:
+            return app
+        graphs = _bound.setdefault(loop, {})
+        if name not in graphs:
+            graphs[name] = app.copy(update={"checkpointer": checkpointer})
+        return graphs[name]
+
+def warm_up() -> None:
+    """编译全部图并创建所有智能体、模型与工具，使首个请求无需等待初始化"""
+    import agents
+
+    __getattr__("super_graph")
+    for name in agents.AGENTS:
+        getattr(agents, name)
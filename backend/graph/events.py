@@ -0,0 +1,8 @@
+# 顶层最终回答的增量 token 事件名，astream_events(version="v2") 中以 on_custom_event 出现
+FINAL_ANSWER_EVENT = "final_answer_delta"
+
+# 工作智能体内部调用带此标签，其模型 token 与工具事件会转发给前端；
+# 所属团队与节点记录在运行元数据的 TEAM_KEY / WORKER_KEY 下
+WORKER_STREAM_TAG = "worker_stream"
+TEAM_KEY = "team"
+WORKER_KEY = "worker"
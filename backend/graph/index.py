@@ -12,4 +12,4 @@ super_builder.add_node("writing_team", call_paper_writing_team)  # 写作团队
 
 super_builder.add_edge(START, "supervisor")  # 起始节点为顶层监督者
 
-super_graph = super_builder.compile()  # 编译顶层图
\ No newline at end of file
+super_graph = super_builder.compile()  # 编译顶层图
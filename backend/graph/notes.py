@@ -1,21 +1,115 @@
-from llm import llm
-from typing import List, Literal, AsyncGenerator
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from llm import LLM_CACHE, get_model
+from typing import Callable, Dict, List, Literal, AsyncGenerator, Optional, Union
+from langchain_core.callbacks.manager import adispatch_custom_event
 from langchain_core.language_models.chat_models import BaseChatModel
 from langgraph.graph import END
-from langgraph.types import Command
+from langgraph.types import Command, Send
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from agents import search_agent, web_scraper_agent, doc_writer_agent, note_taking_agent, chart_generating_agent
-from utils import execute_agent_node
+from langchain_core.runnables import RunnableConfig
+import agents
+from utils import execute_agent_node, ContextPolicy, build_context
 from graph.state import State
+from graph.events import FINAL_ANSWER_EVENT
+from graph.speculation import SUPERVISOR_SPECULATION, Speculation, route_predictor
+from utils.context import find_user_question
+from logs import fields
+from artifacts import artifact_store
+from transport import hedged
+from session import get_session_id
+
+logger = logging.getLogger(__name__)
+
+# 路由模式：stream 完整生成后再解析；early_exit 增量解析，拿到合法决策即取消生成
+ROUTING_MODE = os.environ.get("SUPERVISOR_ROUTING_MODE", "early_exit")
+# early_exit 模式下路由调用的最大输出 token 数，{"next": "..."} 远小于该值
+ROUTING_MAX_TOKENS = int(os.environ.get("SUPERVISOR_ROUTING_MAX_TOKENS", "32"))
+
+# 并行模式：监督者可一次选择多个互不依赖的成员，经 Send 并发执行后在下一次决策前合并
+PARALLEL_FANOUT = os.environ.get("SUPERVISOR_PARALLEL", "0") == "1"
+# 单次并行派发的最大成员数
+MAX_PARALLEL = int(os.environ.get("SUPERVISOR_MAX_PARALLEL", "3"))
+
+_NEXT_PATTERN = re.compile(r'"next"\s*:\s*"([^"]*)"')
+_NEXT_LIST_PATTERN = re.compile(r'"next"\s*:\s*\[([^\]]*)\]')
+_ITEM_PATTERN = re.compile(r'"([^"]*)"')
+
+# 最近若干跳的路由耗时记录，供基准测试对比不同模式
+routing_timings: deque = deque(maxlen=1000)
+
+def _match_next(text: str) -> Union[str, List[str], None]:
+    match = _NEXT_PATTERN.search(text)
+    if match:
+        return match.group(1)
+    match = _NEXT_LIST_PATTERN.search(text)
+    if match:
+        return _ITEM_PATTERN.findall(match.group(1))
+    return None
+
+async def route_next(llm: BaseChatModel, messages: list, mode: str = ROUTING_MODE) -> Union[str, List[str], None]:
+    """调用监督者模型并返回原始的 next 值（成员名或成员列表），无法解析时返回 None"""
+    if mode == "early_exit":
+        buffer = ""
+        goto = None
+        # 路由调用短且处在关键路径上，开启对冲（LLM_HEDGE=1 时生效）
+        stream = hedged(llm.bind(max_tokens=ROUTING_MAX_TOKENS)).with_config(run_name="route").astream(messages)
+        try:
+            async for chunk in stream:
+                if chunk.content:
+                    buffer += chunk.content
+                    goto = _match_next(buffer)
+                    if goto is not None:
+                        break
+            # 响应缓存只写入完整的流：开启缓存时读完剩余部分（决策匹配时 JSON 只差收尾，且受 max_tokens 限制），
+            # 使相同的路由请求下次命中缓存
+            if goto is not None and LLM_CACHE:
+                async for _ in stream:
+                    pass
+            return goto
+        finally:
+            # 提前退出时关闭流，取消剩余生成
+            await stream.aclose()
+
+    full_response = []
+    async for chunk in hedged(llm).with_config(run_name="route").astream(messages):
+        if chunk.content:
+            full_response.append(chunk.content)
+    response = ''.join(full_response).strip()
+    logger.debug("监督者响应: %s", response)
+    try:
+        return json.loads(response)["next"]
+    except Exception as e:
+        logger.warning("JSON解析失败: %s", e)
+        return None
 
 # 创建监督节点
 def make_supervisor_node(
     llm: BaseChatModel, 
     members: list[str], 
-    is_top_level: bool = False  # 标记是否为顶层监督者
+    is_top_level: bool = False,  # 标记是否为顶层监督者
+    routing_mode: str = ROUTING_MODE,
+    context_policy: Optional[ContextPolicy] = None,  # 路由时的上下文预算，None 表示发送完整历史
+    parallel: bool = PARALLEL_FANOUT,  # 是否允许一次派发多个成员并行执行
+    max_parallel: int = MAX_PARALLEL,
+    answer_llm: Optional[BaseChatModel] = None,  # 生成最终回答/团队总结的模型，None 时与路由共用 llm
+    speculative: Optional[Dict[str, Callable]] = None,  # 可推测预取的成员 -> 工具预取函数
 ) -> str:
+    speculative = speculative if SUPERVISOR_SPECULATION else None
+    answer_llm = answer_llm or llm
     options = ["FINISH"] + members
 
+    output_note = (
+        "4. 输出格式：仅返回JSON {{\"next\": \"成员名或FINISH\"}}；"
+        "若多个成员的任务互不依赖，可返回 {{\"next\": [\"成员名\", ...]}} 让它们并行执行，无其他内容。\n"
+        if parallel else
+        "4. 输出格式：仅返回JSON {{\"next\": \"成员名或FINISH\"}}，无其他内容。\n"
+    )
+
     # 系统提示词差异化：子监督者FINISH后返回上级，顶层监督者FINISH后生成最终答案
     system_prompt = (
         "你是监督者，负责管理以下工作智能体工具或团队之间的协作：{members}。\n"
@@ -25,7 +119,7 @@ def make_supervisor_node(
         "   - 若信息已充分，返回FINISH。\n"
         "2. 选择逻辑：优先匹配能力最匹配的成员，避免重复调用同一成员，无需调用所有成员。\n"
         "3. 必须从可用列表[{members}]中选择，或返回FINISH。\n"
-        "4. 输出格式：仅返回JSON {{\"next\": \"成员名或FINISH\"}}，无其他内容。\n"
+        + output_note +
         "{finish_note}"  # FINISH行为说明（根据层级差异化）
     ).format(
         members=", ".join(members),
@@ -34,9 +128,8 @@ def make_supervisor_node(
         else "若返回FINISH，代表当前团队任务已完成，请将结果返回给上级监督者。"
     )
 
-    async def supervisor_node(state: State) -> Command[Literal[*members, "__end__"]]:
+    async def supervisor_node(state: State, config: RunnableConfig) -> Command[Literal[*members, "__end__"]]:
         history = state["messages"]
-        full_response = []
         last_node = None
 
         if history:
@@ -44,165 +137,219 @@ def make_supervisor_node(
             if hasattr(last_msg, "name"):
                 last_node = last_msg.name
                 
-        messages = [SystemMessage(content=system_prompt), *history]
-        
-        async for chunk in llm.astream(messages):
-            if chunk.content:
-                full_response.append(chunk.content)
+        context = await build_context(history, context_policy, llm)
+        messages = [SystemMessage(content=system_prompt), *context]
 
-        response = ''.join(full_response).strip()
-        print('监督者响应:', response)
+        # 推测预取：路由调用期间先执行最可能的下一跳要用到的工具抓取
+        speculation = None
+        if speculative:
+            predicted = route_predictor.predict(members, last_node)
+            if predicted in speculative and predicted != last_node:
+                speculation = Speculation(predicted, speculative[predicted], state)
 
         try:
-            import json
-            result = json.loads(response)
-            goto = result["next"]
-            
-            # 验证工具名是否在可用列表中
-            if goto not in members and goto != "FINISH":
-                print(f"⚠️ 工具名 '{goto}' 不在可用列表中，使用默认工具")
-                goto = members[0] if members else "FINISH"
-                
+            start = time.perf_counter()
+            goto = await route_next(llm, messages, routing_mode)
+            latency_ms = (time.perf_counter() - start) * 1000
+            routing_timings.append({
+                "members": members,
+                "mode": routing_mode,
+                "latency_ms": latency_ms,
+                "next": goto,
+            })
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("路由决策", extra=fields(members=",".join(members), mode=routing_mode,
+                                                  latency_ms=round(latency_ms, 1), next=goto))
+
+            # 并行派发：按成员列表顺序去重，保证合并顺序确定
+            if isinstance(goto, list):
+                selected = [m for m in members if m in goto and m != last_node]
+                selected = selected[:max_parallel] if parallel else selected[:1]
+                if len(selected) > 1:
+                    logger.info("并行派发: %s", selected)
+                    yield Command(
+                        goto=[Send(member, state) for member in selected],
+                        update={"next": ",".join(selected)},
+                    )
+                    return
+                goto = selected[0] if selected else "FINISH"
+
+            # 仅接受可用列表中的成员，无法识别时结束当前流程，避免误派给其他团队
+            if goto not in options:
+                logger.warning("路由结果 %r 不在可用列表中，返回FINISH", goto)
+                goto = "FINISH"
+
             # 避免重复调用同一节点
             if goto == last_node and goto in members:
                 next_idx = members.index(goto) + 1
                 goto = members[next_idx] if next_idx < len(members) else "FINISH"
-                
-        except Exception as e:
-            print(f"JSON解析失败: {e}, 使用默认工具")
-            goto = members[0] if members else "FINISH"
-
-        if goto == "FINISH":
-            print(f"🎯 监督者决定{('生成最终回答' if is_top_level else '结束当前团队任务')}")
-            if is_top_level:
-                print("🎯 进入顶层监督者的FINISH分支 - 使用消息流式更新")
-                
-                final_answer = ""
-                
-                # 先创建一个初始消息
-                initial_update = {
-                    "messages": [*history, AIMessage(content="")],
-                    "final_answer": ""
-                }
-                yield Command(goto=None, update=initial_update)
-                
-                print("🔴 开始真正的流式生成...")
-                
-                # 流式更新消息内容
-                async for chunk in generate_final_answer_stream(llm, history):
-                    print(f"🟢 实时chunk: '{chunk}'")
-                    final_answer += chunk
-                    
-                    # 实时更新最后一个消息的内容
+
+            if speculative:
+                route_predictor.record(members, last_node, goto)
+            if speculation is not None:
+                # 命中时预取继续完成，成员的工具调用复用其结果；未命中时立即取消
+                await speculation.settle(goto)
+
+            if goto == "FINISH":
+                logger.info("监督者决定%s", "生成最终回答" if is_top_level else "结束当前团队任务")
+                if is_top_level:
+                    # 每个 token 只通过自定义事件发送增量，历史在结束时一次性提交到状态
+                    answer_parts = []
+                    async for chunk in generate_final_answer_stream(answer_llm, history, get_session_id(config)):
+                        answer_parts.append(chunk)
+                        await adispatch_custom_event(FINAL_ANSWER_EVENT, {"delta": chunk})
+
+                    final_answer = "".join(answer_parts)
                     yield Command(
-                        goto=None,
+                        goto=END,
                         update={
-                            "messages": [*history, AIMessage(content=chunk)],
+                            "messages": [AIMessage(content=final_answer)],
                             "final_answer": final_answer,
-                            "is_top_level": True,
                         }
                     )
-                
-                # 完成后跳转
-                yield Command(
-                    goto=END,
-                    update={
-                        "messages": [*history, AIMessage(content='')],
-                        "final_answer": final_answer,
-                        "is_top_level": True
-                    }
-                )
+                else:
+                    # 团队总结由 call_team 与子图中记录的文档、链接一起组成结构化结果交回上级
+                    final_answer = await generate_final_answer(answer_llm, history, get_session_id(config))
+                    yield Command(
+                        goto=END,
+                        update={
+                            "messages": [AIMessage(content=final_answer)],
+                            "final_answer": final_answer,
+                        }
+                    )
+                return
             else:
-                final_answer = await generate_final_answer(llm, history)
-                yield Command(
-                    goto=END,
-                    update={
-                        "messages": [*history, AIMessage(content=final_answer)],
-                        "final_answer": final_answer,
-                        "is_top_level": False
-                    }
-                )
-            return
-        else:
-            print(f"✅ 监督者决定下一步: {goto}")
-            yield Command(goto=goto, update={"next": goto})
+                logger.info("监督者决定下一步: %s", goto)
+                yield Command(goto=goto, update={"next": goto})
+        finally:
+            if speculation is not None:
+                await speculation.cancel()
 
     return supervisor_node
 
-def _build_answer_prompt(history: list) -> str:
+def _build_answer_prompt(history: list, session_id: str) -> str:
     """构建回答提示词"""
-    user_question = ""
-    for msg in history:
-        if isinstance(msg, HumanMessage) and not hasattr(msg, 'name'):
-            user_question = msg.content
-            break
+    question = find_user_question(history)
+    user_question = question.content if question is not None else ""
     
+    # 历史中折叠的大段工具输出按预算展开，回答时能看到原文
+    history_text = artifact_store.expand(
+        session_id,
+        chr(10).join([f"- {type(msg).__name__}: {msg.content}" for msg in history if hasattr(msg, 'content')])
+    )
     return f"""
         基于以下对话历史，请直接、完整地回答用户的原始问题。
         用户原始问题：{user_question}
         对话历史：
-        {chr(10).join([f"- {type(msg).__name__}: {msg.content}" for msg in history if hasattr(msg, 'content')])}
+        {history_text}
         请提供完整、准确的最终答案：
     """
 
-async def generate_final_answer(llm: BaseChatModel, history: list) -> str:
+async def generate_final_answer(llm: BaseChatModel, history: list, session_id: str) -> str:
     """生成最终回答并返回内容"""
-    answer_prompt = _build_answer_prompt(history)
+    answer_prompt = _build_answer_prompt(history, session_id)
     messages = [HumanMessage(content=answer_prompt)]
 
     response = ""
     
-    print("🤖 生成最终回答...")
-    async for chunk in llm.astream(messages):
+    async for chunk in llm.with_config(run_name="final_answer").astream(messages):
         if chunk.content:
             response += chunk.content
-            print(chunk.content, end="", flush=True)
     
-    print("\n✅ 最终回答生成完成")
+    logger.debug("最终回答生成完成", extra=fields(chars=len(response)))
     return response.strip()
     
 async def generate_final_answer_stream(
     llm: BaseChatModel,
-    history: list
+    history: list,
+    session_id: str,
 ) -> AsyncGenerator[str, None]:
-    answer_prompt = _build_answer_prompt(history)
+    answer_prompt = _build_answer_prompt(history, session_id)
     messages = [HumanMessage(content=answer_prompt)]
 
-    print("🤖 生成最终回答...")
-    async for chunk in llm.astream(messages):
+    async for chunk in llm.with_config(run_name="final_answer").astream(messages):
         if chunk.content:
             yield chunk.content
 
+# 各节点的上下文预算：路由只需要摘要，写作智能体需要更完整的素材
+RESEARCH_SUPERVISOR_CONTEXT = ContextPolicy(max_tokens=3000, keep_recent=2, digest_chars=400)
+WRITING_SUPERVISOR_CONTEXT = ContextPolicy(max_tokens=3000, keep_recent=2, digest_chars=400)
+TEAMS_SUPERVISOR_CONTEXT = ContextPolicy(max_tokens=4000, keep_recent=2, digest_chars=600)
+RESEARCH_AGENT_CONTEXT = ContextPolicy(max_tokens=6000, keep_recent=2, digest_chars=800)
+WRITING_AGENT_CONTEXT = ContextPolicy(max_tokens=12000, keep_recent=4, digest_chars=2000)
+# 交给子团队的输入：原始问题与各团队的结构化结果
+TEAM_HANDOFF_CONTEXT = ContextPolicy(max_tokens=6000, keep_recent=4, digest_chars=1500)
+
+# 推测预取抓取的链接数
+SPECULATION_PREFETCH_URLS = int(os.environ.get("SPECULATION_PREFETCH_URLS", "3"))
+
+# 工作节点压缩上下文时使用的模型（仅 ContextPolicy.summarize 开启时调用）
+summary_llm = get_model("summary")
+
 # async def search_node(state: State) -> Command[Literal["supervisor"]]:
 #     """搜索节点"""
 #     async for cmd in execute_agent_node(search_agent, state, "search", "🔍 联网搜索"):
 #         yield cmd
 
+# 预取用到的工具与抓取引擎在首次预取时导入，与智能体一样不随图加载
+async def _prefetch_search(state: State, on_used: Callable[[], None]) -> None:
+    # 搜索智能体通常以用户问题作为首个查询
+    import tools
+
+    question = find_user_question(state["messages"])
+    if question is not None:
+        await tools.tavily_tool.prefetch(query=question.content, on_used=on_used)
+
+async def _prefetch_scrape(state: State, on_used: Callable[[], None]) -> None:
+    # 抓取智能体通常抓取搜索结果中靠前的链接
+    from scraper import scrape_engine
+
+    urls = (state.get("sources") or [])[:SPECULATION_PREFETCH_URLS]
+    if urls:
+        await scrape_engine.prefetch(urls, on_used=on_used)
+
 async def search_node(state: State) -> Command[Literal["supervisor"]]:
     """搜索节点"""
-    return await execute_agent_node(search_agent, state, "search", "🔍 搜索节点")
+    return await execute_agent_node(agents.search_agent, state, "search", "🔍 搜索节点",
+                                    RESEARCH_AGENT_CONTEXT, summary_llm)
 
 async def web_scraper_node(state: State) -> Command[Literal["supervisor"]]:
     """网页抓取节点"""
-    return await execute_agent_node(web_scraper_agent, state, "web_scraper", "🌐 网页抓取节点")
+    return await execute_agent_node(agents.web_scraper_agent, state, "web_scraper", "🌐 网页抓取节点",
+                                    RESEARCH_AGENT_CONTEXT, summary_llm)
 
 # 调研监督节点
-research_supervisor_node = make_supervisor_node(llm, ["search", "web_scraper"], is_top_level=False)
+research_supervisor_node = make_supervisor_node(
+    get_model("router"), ["search", "web_scraper"], is_top_level=False, context_policy=RESEARCH_SUPERVISOR_CONTEXT,
+    answer_llm=get_model("answer"),
+    speculative={"search": _prefetch_search, "web_scraper": _prefetch_scrape},
+)
 
 async def doc_writing_node(state: State) -> Command[Literal["supervisor"]]:
     """写文档节点"""
-    return await execute_agent_node(doc_writer_agent, state, "doc_writer", "📁 写文档节点")
+    return await execute_agent_node(agents.doc_writer_agent, state, "doc_writer", "📁 写文档节点",
+                                    WRITING_AGENT_CONTEXT, summary_llm)
 
 async def note_taking_node(state: State) -> Command[Literal["supervisor"]]:
     """写大纲节点"""
-    return await execute_agent_node(note_taking_agent, state, "note_taker", "📄 写大纲节点")
+    return await execute_agent_node(agents.note_taking_agent, state, "note_taker", "📄 写大纲节点",
+                                    WRITING_AGENT_CONTEXT, summary_llm)
 
 async def chart_generating_node(state: State) -> Command[Literal["supervisor"]]:
     """写图表代码节点"""
-    return await execute_agent_node(chart_generating_agent, state, "chart_generator", "📈 写图表代码节点")
+    return await execute_agent_node(agents.chart_generating_agent, state, "chart_generator", "📈 写图表代码节点",
+                                    WRITING_AGENT_CONTEXT, summary_llm)
 
 # 写作监督节点
-doc_writing_supervisor_node = make_supervisor_node(llm, ["doc_writer", "note_taker", "chart_generator"], is_top_level=False)
+doc_writing_supervisor_node = make_supervisor_node(
+    get_model("router"), ["doc_writer", "note_taker", "chart_generator"], is_top_level=False, context_policy=WRITING_SUPERVISOR_CONTEXT,
+    answer_llm=get_model("answer"),
+)
 
 # 创建顶层监督者节点：管理 research_team 和 writing_team 两个子团队
-teams_supervisor_node = make_supervisor_node(llm, ["research_team", "writing_team"], is_top_level=True)
+# 预测派给调研团队时，预取其第一跳（搜索）的结果；写作团队会写文档，不参与推测
+teams_supervisor_node = make_supervisor_node(
+    get_model("router"), ["research_team", "writing_team"], is_top_level=True, context_policy=TEAMS_SUPERVISOR_CONTEXT,
+    answer_llm=get_model("answer"),
+    speculative={"research_team": _prefetch_search},
+)
@@ -11,4 +11,4 @@ paper_writing_builder.add_node("chart_generator", chart_generating_node)
 
 paper_writing_builder.add_edge(START, "supervisor")
 
-paper_writing_graph = paper_writing_builder.compile()
\ No newline at end of file
+paper_writing_graph = paper_writing_builder.compile(checkpointer=None)  # 继承顶层图的检查点存储
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""先规划后执行：一次规划调用生成工作智能体之间的依赖 DAG，按依赖并行执行各步骤，
+只有步骤失败或输出为空时才重新规划，最后生成回答。替代每一跳都调用一次监督者的 super_graph。
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Literal, Optional
+from langchain_core.callbacks.manager import adispatch_custom_event
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Command
+from llm import get_model
+from logs import fields
+from session import get_session_id
+from utils.context import find_user_question
+from .events import FINAL_ANSWER_EVENT, TEAM_KEY
+from .notes import (
+    chart_generating_node,
+    doc_writing_node,
+    generate_final_answer_stream,
+    note_taking_node,
+    search_node,
+    web_scraper_node,
+)
+from .state import State
+
+logger = logging.getLogger(__name__)
+
+# 单个计划的最大步骤数、允许的重新规划次数
+MAX_PLAN_STEPS = int(os.environ.get("PLAN_MAX_STEPS", "8"))
+MAX_REPLANS = int(os.environ.get("PLAN_MAX_REPLANS", "1"))
+
+# 可编排的工作智能体：名称 -> (节点函数, 能力说明)
+WORKERS = {
+    "search": (search_node, "联网搜索，获取与问题相关的资料和链接"),
+    "web_scraper": (web_scraper_node, "抓取网页正文，需要先有链接"),
+    "note_taker": (note_taking_node, "根据资料撰写文档大纲并保存"),
+    "doc_writer": (doc_writing_node, "根据大纲和资料撰写、编辑文档"),
+    "chart_generator": (chart_generating_node, "编写并执行生成图表的 Python 代码"),
+}
+
+# 规划结果无法解析时使用的默认计划：调研后写作
+DEFAULT_PLAN = [
+    {"id": "s1", "worker": "search", "task": "搜索与问题相关的资料", "depends_on": []},
+    {"id": "s2", "worker": "web_scraper", "task": "抓取搜索结果中最相关的网页", "depends_on": ["s1"]},
+    {"id": "s3", "worker": "note_taker", "task": "根据资料撰写大纲", "depends_on": ["s2"]},
+    {"id": "s4", "worker": "doc_writer", "task": "根据大纲撰写文档", "depends_on": ["s3"]},
+]
+
+# 计划执行时的团队名，标记转发给前端的工作智能体事件来源
+PLAN_TEAM = "plan"
+
+_PLANNER_PROMPT = (
+    "你是规划者，需要把用户的问题拆分为由以下工作智能体完成的步骤：\n{workers}\n"
+    "要求：\n"
+    "1. 每个步骤只交给一个工作智能体，task 写清该步骤要做什么；\n"
+    "2. depends_on 列出必须先完成的步骤 id，互不依赖的步骤会并行执行；\n"
+    "3. 步骤数不超过 {max_steps}，只安排回答问题所必需的步骤；\n"
+    "4. 输出格式：仅返回JSON {{\"steps\": [{{\"id\": \"s1\", \"worker\": \"search\", \"task\": \"...\", "
+    "\"depends_on\": []}}]}}，无其他内容。"
+)
+_REPLAN_PROMPT = (
+    "已执行的步骤：\n{report}\n"
+    "请只为尚未完成的工作重新规划，步骤 id 不要与上面重复；"
+    "新步骤可以在 depends_on 中引用上面已完成的步骤 id，其输出会交给该步骤。"
+)
+# 重新规划的提示词中每个已完成步骤输出的预览长度
+REPLAN_OUTPUT_PREVIEW = int(os.environ.get("PLAN_REPLAN_OUTPUT_PREVIEW", "300"))
+_JSON_PATTERN = re.compile(r"\{.*\}", re.S)
+
+class PlanState(State):
+    plan: List[dict]  # 当前计划的步骤
+    plan_results: Dict[str, dict]  # 各轮计划已执行的步骤 id -> {"worker", "task", "output", "ok"}
+    replans: int
+
+class PlanError(ValueError):
+    """重新规划的结果无法解析"""
+
+def validate_plan(steps: object, completed: frozenset = frozenset()) -> Optional[List[dict]]:
+    """检查步骤格式、工作智能体名称与依赖；依赖可以指向计划内的步骤或 completed 中已完成的步骤，
+    存在未知依赖或环时返回 None。重新规划（completed 非空）时允许空计划，表示没有需要补做的工作"""
+    if not isinstance(steps, list) or (not steps and not completed):
+        return None
+    plan, ids = [], set()
+    for step in steps[:MAX_PLAN_STEPS]:
+        if not isinstance(step, dict) or step.get("worker") not in WORKERS:
+            return None
+        step_id = str(step.get("id") or f"s{len(plan) + 1}")
+        if step_id in ids:
+            return None
+        ids.add(step_id)
+        plan.append({
+            "id": step_id,
+            "worker": step["worker"],
+            "task": str(step.get("task") or ""),
+            "depends_on": [str(d) for d in step.get("depends_on") or []],
+        })
+    # 依赖必须指向计划内或已完成的步骤，且按拓扑序能全部排完（无环）
+    done = set(completed) - ids
+    remaining = list(plan)
+    while remaining:
+        ready = [s for s in remaining if set(s["depends_on"]) <= done]
+        if not ready:
+            return None
+        done.update(s["id"] for s in ready)
+        remaining = [s for s in remaining if s["id"] not in done]
+    return plan
+
+def parse_plan(text: str, completed: frozenset = frozenset()) -> Optional[List[dict]]:
+    match = _JSON_PATTERN.search(text)
+    if not match:
+        return None
+    try:
+        return validate_plan(json.loads(match.group(0)).get("steps"), completed)
+    except (ValueError, AttributeError):
+        return None
+
+def _preview(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= REPLAN_OUTPUT_PREVIEW else text[:REPLAN_OUTPUT_PREVIEW] + "…"
+
+def _results_messages(results: Dict[str, dict]) -> List[BaseMessage]:
+    return [
+        HumanMessage(content=r["output"], name=r["worker"])
+        for r in results.values() if r["ok"] and r["output"]
+    ]
+
+async def planner_node(state: PlanState) -> Command[Literal["executor"]]:
+    """生成（或重新生成）计划；重新规划时只安排尚未完成的工作"""
+    history = state["messages"]
+    question = find_user_question(history)
+    results = state.get("plan_results") or {}
+    workers = "\n".join(f"- {name}：{desc}" for name, (_, desc) in WORKERS.items())
+    messages = [SystemMessage(content=_PLANNER_PROMPT.format(workers=workers, max_steps=MAX_PLAN_STEPS))]
+    messages += [question] if question else []
+    if results:
+        report = "\n".join(
+            f"- {step_id}（{r['worker']}）{'完成' if r['ok'] else '失败或无输出'}：{r['task']}"
+            + (f"\n  输出：{_preview(r['output'])}" if r["ok"] else "")
+            for step_id, r in results.items()
+        )
+        messages.append(HumanMessage(content=_REPLAN_PROMPT.format(report=report)))
+
+    response = []
+    async for chunk in get_model("planner").with_config(run_name="plan").astream(messages):
+        if chunk.content:
+            response.append(chunk.content)
+    completed = frozenset(step_id for step_id, r in results.items() if r["ok"])
+    plan = parse_plan("".join(response), completed)
+    if plan is None:
+        if results:
+            # 重新规划失败时不静默结束：已完成的步骤保留在检查点中，运行以错误结束
+            raise PlanError("重新规划的结果无法解析")
+        logger.warning("计划无法解析，使用默认计划")
+        plan = DEFAULT_PLAN
+    if results:
+        # 新计划的步骤 id 加上轮次前缀，不会与已执行的步骤冲突；指向已完成步骤的依赖保持原样
+        prefix = f"r{state.get('replans') or 0}-"
+        ids = {s["id"] for s in plan}
+        plan = [
+            {**s, "id": prefix + s["id"], "depends_on": [prefix + d if d in ids else d for d in s["depends_on"]]}
+            for s in plan
+        ]
+    logger.info("执行计划", extra=fields(steps=len(plan), replan=bool(results)))
+    return Command(goto="executor", update={"plan": plan})
+
+def _step_inputs(step: dict, plan: List[dict], results: Dict[str, dict]) -> Dict[str, dict]:
+    """交给步骤的前序输出：依赖步骤的输出，以及此前各轮计划中已完成步骤的输出"""
+    current = {s["id"] for s in plan}
+    return {
+        step_id: r for step_id, r in results.items()
+        if step_id in step["depends_on"] or step_id not in current
+    }
+
+async def _run_step(step: dict, state: PlanState, results: Dict[str, dict]) -> dict:
+    """以步骤任务为最后一条消息调用工作节点，前序步骤的输出放在任务之前"""
+    question = find_user_question(state["messages"])
+    inputs = _step_inputs(step, state.get("plan") or [], results)
+    messages = ([question] if question else []) + _results_messages(inputs)
+    messages.append(HumanMessage(content=f"你的任务：{step['task']}"))
+    node, _ = WORKERS[step["worker"]]
+    # 以工作智能体名称包一层，事件流中与 super_graph 一样出现该节点的开始/结束
+    runnable = RunnableLambda(node, name=step["worker"])
+    try:
+        command = await runnable.ainvoke(
+            {"messages": messages, "artifacts": state.get("artifacts") or []},
+            {"metadata": {TEAM_KEY: PLAN_TEAM}},
+        )
+        update = command.update or {}
+        output = "".join(m.content for m in update.get("messages", []) if isinstance(m.content, str)).strip()
+    except Exception as e:
+        logger.warning("步骤 %s 出错: %s", step["id"], e)
+        update, output = {}, ""
+    # execute_agent_node 出错时把错误写入输出，这里同样视为失败
+    ok = bool(output) and "❌" not in output
+    return {
+        "worker": step["worker"],
+        "task": step["task"],
+        "output": output,
+        "ok": ok,
+        "artifacts": update.get("artifacts") or [],
+        "sources": update.get("sources") or [],
+    }
+
+async def executor_node(state: PlanState) -> Command[Literal["executor", "planner", "answer"]]:
+    """并行执行一批依赖已满足的步骤。每批执行完回到本节点，各批之间写入检查点，恢复时不重跑已完成的批次；
+    全部执行完或剩余步骤无法执行时，有步骤失败且仍可重新规划则回到规划节点，否则生成回答"""
+    previous: Dict[str, dict] = state.get("plan_results") or {}
+    results = dict(previous)
+    plan = state.get("plan") or []
+    pending = [s for s in plan if s["id"] not in results]
+    ready = [s for s in pending if all(results.get(d, {}).get("ok") for d in s["depends_on"])]
+    artifacts, sources = [], []
+    if ready:
+        outcomes = await asyncio.gather(*(_run_step(s, state, results) for s in ready))
+        for step, outcome in zip(ready, outcomes):
+            artifacts += outcome.pop("artifacts")
+            sources += outcome.pop("sources")
+            results[step["id"]] = outcome
+
+    update = {
+        "plan_results": results,
+        "messages": _results_messages({k: v for k, v in results.items() if k not in previous}),
+        "artifacts": artifacts,
+        "sources": sources,
+    }
+    pending = [s for s in plan if s["id"] not in results]
+    if any(all(results.get(d, {}).get("ok") for d in s["depends_on"]) for s in pending):
+        return Command(goto="executor", update=update)
+
+    # 本轮计划中有步骤失败，或剩余步骤的依赖失败而无法执行
+    failed = bool(pending) or any(not results[s["id"]]["ok"] for s in plan)
+    replans = state.get("replans") or 0
+    if failed and replans < MAX_REPLANS:
+        logger.info("步骤失败，重新规划", extra=fields(replans=replans + 1))
+        return Command(goto="planner", update={**update, "replans": replans + 1})
+    return Command(goto="answer", update=update)
+
+async def answer_node(state: PlanState, config: RunnableConfig):
+    """与顶层监督者 FINISH 相同：逐 token 发送最终回答事件，结束时一次性写入状态"""
+    answer_parts = []
+    async for chunk in generate_final_answer_stream(get_model("answer"), state["messages"], get_session_id(config)):
+        answer_parts.append(chunk)
+        await adispatch_custom_event(FINAL_ANSWER_EVENT, {"delta": chunk})
+    final_answer = "".join(answer_parts)
+    yield Command(goto=END, update={"messages": [AIMessage(content=final_answer)], "final_answer": final_answer})
+
+planned_builder = StateGraph(PlanState)
+
+planned_builder.add_node("planner", planner_node)
+planned_builder.add_node("executor", executor_node)
+planned_builder.add_node("answer", answer_node)
+
+planned_builder.add_edge(START, "planner")
+
+planned_graph = planned_builder.compile()
@@ -10,4 +10,4 @@ research_builder.add_node("web_scraper", web_scraper_node)
 
 research_builder.add_edge(START, "supervisor")
 
-research_graph = research_builder.compile()
\ No newline at end of file
+research_graph = research_builder.compile(checkpointer=None)  # 继承顶层图的检查点存储
\ No newline at end of file
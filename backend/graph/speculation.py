@@ -0,0 +1,111 @@
+"""监督者决策期间的推测预取：预测下一跳，在路由调用的同时提前执行该成员要用到的工具抓取（搜索、网页抓取），
+结果写入工具缓存，成员随后正式调用工具时直接复用。
+
+只预取工具结果，不运行成员节点与其中的模型调用：预测未命中时只浪费一次无副作用的抓取。
+预取不携带回调，不产生发给前端的事件；命中时成员按常规路径执行，事件照常发出。
+预测的下一跳正确只记为 routed；成员的工具调用实际读到预取结果时才记为 hit，并按预取已运行的时间记节省的秒数。
+
+预测先看本进程记录的路由历史（同一成员列表、同一上一跳下最常见的决策），样本不足时使用按图位置的静态先验。
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+from metrics import registry
+
+SUPERVISOR_SPECULATION = os.environ.get("SUPERVISOR_SPECULATION", "0") == "1"
+# 同一位置至少记录这么多次决策、且最常见决策的占比不低于该值时才按历史预测
+SPECULATION_MIN_SAMPLES = int(os.environ.get("SPECULATION_MIN_SAMPLES", 5))
+SPECULATION_MIN_CONFIDENCE = float(os.environ.get("SPECULATION_MIN_CONFIDENCE", 0.6))
+
+# (成员列表, 上一跳) -> 决策；上一跳为 None 表示刚收到任务
+STATIC_PRIOR = {
+    (("search", "web_scraper"), None): "search",
+    (("search", "web_scraper"), "search"): "web_scraper",
+    (("research_team", "writing_team"), None): "research_team",
+}
+
+SPECULATION_TOTAL = registry.counter("speculation_total", "推测预取次数", ("node", "outcome"))
+SPECULATION_WASTED_SECONDS = registry.histogram("speculation_wasted_seconds", "未命中而被取消的预取已运行时间", ("node",))
+SPECULATION_SAVED_SECONDS = registry.histogram("speculation_saved_seconds", "预取结果被读取时预取已运行的时间", ("node",))
+
+Position = Tuple[Tuple[str, ...], Optional[str]]
+
+class RoutePredictor:
+    """按 (成员列表, 上一跳) 统计监督者的历史决策"""
+
+    def __init__(self, prior: Dict[Position, str] = STATIC_PRIOR):
+        self.prior = prior
+        self._counts: Dict[Position, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def predict(self, members: Sequence[str], last_node: Optional[str]) -> Optional[str]:
+        position = (tuple(members), last_node)
+        with self._lock:
+            counts = dict(self._counts.get(position, {}))
+        total = sum(counts.values())
+        if total >= SPECULATION_MIN_SAMPLES:
+            decision, hits = max(counts.items(), key=lambda item: item[1])
+            return decision if hits / total >= SPECULATION_MIN_CONFIDENCE else None
+        return self.prior.get(position)
+
+    def record(self, members: Sequence[str], last_node: Optional[str], decision: str) -> None:
+        position = (tuple(members), last_node)
+        with self._lock:
+            counts = self._counts.setdefault(position, {})
+            counts[decision] = counts.get(decision, 0) + 1
+
+route_predictor = RoutePredictor()
+
+def _retrieve(task: asyncio.Task) -> None:
+    # 预取失败只影响命中率，成员正式调用工具时会重新抓取
+    if not task.cancelled():
+        task.exception()
+
+class Speculation:
+    """在独立任务中执行预测成员的工具预取，由监督者在路由结果出来后结算。
+
+    预取函数接收状态与 on_used 回调，工具层在正式调用读到预取结果时调用 on_used。
+    """
+
+    def __init__(self, member: str, prefetch: Callable[[dict, Callable[[], None]], Awaitable[None]], state: dict):
+        self.member = member
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.settled = False
+        self.routed = False
+        self.used = False
+        self.task = asyncio.create_task(prefetch(state, self._on_used))
+        self.task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self.finished = time.perf_counter()
+        _retrieve(task)
+
+    def _on_used(self) -> None:
+        # 只统计路由命中后的首次读取；节省的时间是读取时预取已运行的时间，预取已完成时取其总耗时
+        if not self.routed or self.used:
+            return
+        self.used = True
+        SPECULATION_TOTAL.inc(1, self.member, "hit")
+        SPECULATION_SAVED_SECONDS.observe((self.finished or time.perf_counter()) - self.started, self.member)
+
+    async def settle(self, decision: str) -> None:
+        """预测正确时让预取继续完成（结果被读取时记为命中），否则取消"""
+        if decision != self.member:
+            await self.cancel()
+            return
+        self.settled = True
+        self.routed = True
+        SPECULATION_TOTAL.inc(1, self.member, "routed")
+
+    async def cancel(self) -> None:
+        if self.settled:
+            return
+        self.settled = True
+        wasted = time.perf_counter() - self.started
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        SPECULATION_TOTAL.inc(1, self.member, "miss")
+        SPECULATION_WASTED_SECONDS.observe(wasted, self.member)
@@ -1,4 +1,30 @@
+from typing import Annotated, List, TypedDict
 from langgraph.graph import MessagesState
 
+# 交接时保留的引用链接上限，避免来源列表随跳数无限增长
+MAX_SOURCES = 30
+
+class TeamResult(TypedDict):
+    """团队完成后交回上级的结构化结果，代替把子图的全部输出塞进历史"""
+    team: str
+    summary: str  # 团队监督者生成的总结
+    artifacts: List[str]  # 写入或编辑过的文档名
+    sources: List[str]  # 搜索、抓取过的网页链接
+
+def merge_unique(left: List[str], right: List[str]) -> List[str]:
+    """按出现顺序去重合并，并行分支同时写入时结果确定"""
+    merged = list(left or [])
+    for item in right or []:
+        if item not in merged:
+            merged.append(item)
+    return merged[-MAX_SOURCES:]
+
+def append_results(left: List[TeamResult], right: List[TeamResult]) -> List[TeamResult]:
+    return list(left or []) + list(right or [])
+
 class State(MessagesState):
-    next: str
\ No newline at end of file
+    next: str
+    final_answer: str  # 监督者 FINISH 时生成的回答（子团队为团队总结）
+    artifacts: Annotated[List[str], merge_unique]
+    sources: Annotated[List[str], merge_unique]
+    team_results: Annotated[List[TeamResult], append_results]
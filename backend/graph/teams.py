@@ -4,11 +4,12 @@ from graph.state import State
 from .research_graph import research_graph
 from .paper_writing_graph import paper_writing_graph
 from utils import call_team
+from .notes import TEAM_HANDOFF_CONTEXT
 
 async def call_research_team(state: State) -> Command[Literal["supervisor"]]:
     """调用研究团队"""
-    return await call_team(research_graph, state, "research_team", "🔬 研究团队")
+    return await call_team(research_graph, state, "research_team", "🔬 研究团队", TEAM_HANDOFF_CONTEXT)
 
 async def call_paper_writing_team(state: State) -> Command[Literal["supervisor"]]:
     """调用写作团队"""
-    return await call_team(paper_writing_graph, state, "writing_team", "📝 写作团队")
\ No newline at end of file
+    return await call_team(paper_writing_graph, state, "writing_team", "📝 写作团队", TEAM_HANDOFF_CONTEXT)
\ No newline at end of file
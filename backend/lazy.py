@@ -0,0 +1,27 @@
+"""模块级延迟属性（PEP 562）：首次访问时构建并缓存到模块命名空间，之后按普通属性读取。
+
+先对模块属性赋值（如基准测试替换 llm.llm）即可跳过构建。
+"""
+import os
+import threading
+from typing import Callable, Dict
+
+def lazy_attributes(namespace: dict, builders: Dict[str, Callable[[], object]]) -> Callable[[str], object]:
+    """返回模块的 __getattr__，用法：__getattr__ = lazy_attributes(globals(), {"name": build})"""
+    lock = threading.RLock()
+
+    def __getattr__(name: str):
+        builder = builders.get(name)
+        if builder is None:
+            raise AttributeError(f"module {namespace['__name__']!r} has no attribute {name!r}")
+        with lock:
+            if name not in namespace:
+                namespace[name] = builder()
+        return namespace[name]
+
+    return __getattr__
+
+def require_env(*names: str) -> None:
+    missing = [name for name in names if not os.environ.get(name)]
+    if missing:
+        raise ValueError(f"Missing required environment variable: {', '.join(missing)}")
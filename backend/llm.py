@@ -1,19 +1,275 @@
+import hashlib
+import json
 import os
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from cache import CACHE_DIRECTORY, MISSING, TTLCache
+from lazy import lazy_attributes, require_env
 
 # 加载.env文件中的环境变量
 load_dotenv()
 
-# 检查必要的环境变量
-required_env_vars = ["DEEPSEEK_API_KEY", "TAVILY_API_KEY", "DEEPSEEK_BASE_URL"]
-for var in required_env_vars:
-    if not os.environ.get(var):
-        raise ValueError(f"Missing required environment variable: {var}")
-
-llm = ChatOpenAI(
-    model="deepseek-chat",  # DeepSeek对话模型
-    temperature=0,
-    api_key=os.environ["DEEPSEEK_API_KEY"],
-    base_url=os.environ["DEEPSEEK_BASE_URL"],
-)
\ No newline at end of file
+# 必要的环境变量，在首次使用模型时检查
+required_env_vars = ["DEEPSEEK_API_KEY", "DEEPSEEK_BASE_URL"]
+
+# 模型响应缓存：默认关闭，LLM_CACHE=1 开启
+LLM_CACHE = os.environ.get("LLM_CACHE", "0") == "1"
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", str(CACHE_DIRECTORY / "llm.sqlite"))
+LLM_CACHE_MAX_MB = float(os.environ.get("LLM_CACHE_MAX_MB", 256))
+
+def _dump_chunk(chunk: ChatGenerationChunk) -> dict:
+    message = chunk.message
+    return {
+        "content": message.content,
+        "additional_kwargs": message.additional_kwargs,
+        "response_metadata": message.response_metadata,
+        "tool_call_chunks": list(getattr(message, "tool_call_chunks", [])),
+        "usage_metadata": getattr(message, "usage_metadata", None),
+    }
+
+def _load_chunk(data: dict) -> ChatGenerationChunk:
+    return ChatGenerationChunk(message=AIMessageChunk(**{k: v for k, v in data.items() if v is not None}))
+
+class CachedChatModel(BaseChatModel):
+    """为聊天模型加响应缓存，流式调用命中时按原分块回放。
+
+    键为消息与模型参数的哈希。单个调用点可用 without_cache(model) 跳过缓存；
+    提前关闭的流不会写入不完整的结果；监督者提前退出路由在开启缓存时会读完剩余输出再关闭，以便写入缓存。
+    """
+
+    model: BaseChatModel
+    response_cache: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.model._llm_type}"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        # 由被包装模型负责转换工具格式，再把参数绑定到缓存层
+        return self.bind(**self.model.bind_tools(tools, **kwargs).kwargs)
+
+    def _cache_key(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict) -> str:
+        params = {
+            "model": self.model._identifying_params,
+            "stop": stop,
+            "kwargs": kwargs,
+        }
+        # 消息 id 每次运行都不同，只取影响输出的字段
+        content = [
+            {
+                "type": msg.type,
+                "content": msg.content,
+                "name": msg.name,
+                "tool_calls": getattr(msg, "tool_calls", None),
+                "tool_call_id": getattr(msg, "tool_call_id", None),
+            }
+            for msg in messages
+        ]
+        payload = json.dumps([content, params], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _replay(self, cached: list) -> Iterator[ChatGenerationChunk]:
+        for data in cached:
+            yield _load_chunk(data)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        use_cache = kwargs.pop("use_cache", True)
+        key = self._cache_key(messages, stop, kwargs) if use_cache else None
+        cached = self.response_cache.get(key) if key else MISSING
+        if cached is not MISSING:
+            for chunk in self._replay(cached):
+                if run_manager and chunk.message.content:
+                    run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+                yield chunk
+            return
+
+        collected = []
+        for chunk in self.model._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            collected.append(_dump_chunk(chunk))
+            yield chunk
+        if key:
+            self.response_cache.set(key, collected)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        use_cache = kwargs.pop("use_cache", True)
+        key = self._cache_key(messages, stop, kwargs) if use_cache else None
+        cached = await self.response_cache.aget(key) if key else MISSING
+        if cached is not MISSING:
+            for chunk in self._replay(cached):
+                if run_manager and chunk.message.content:
+                    await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+                yield chunk
+            return
+
+        collected = []
+        async for chunk in self.model._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            collected.append(_dump_chunk(chunk))
+            yield chunk
+        if key:
+            await self.response_cache.aset(key, collected)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = None
+        for chunk in self._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            message = chunk.message if message is None else message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=message_chunk_to_message(message))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = None
+        async for chunk in self._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            message = chunk.message if message is None else message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=message_chunk_to_message(message))])
+
+llm_cache = TTLCache(
+    "llm",
+    ttl=LLM_CACHE_TTL,
+    max_entries=256,
+    db_path=LLM_CACHE_PATH if LLM_CACHE and LLM_CACHE_PATH else None,
+    max_disk_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+)
+
+def with_llm_cache(model: BaseChatModel) -> BaseChatModel:
+    """LLM_CACHE 开启时返回带缓存的模型，否则原样返回"""
+    return CachedChatModel(model=model, response_cache=llm_cache) if LLM_CACHE else model
+
+def without_cache(model):
+    """调用点级别跳过缓存（如需要新鲜结果的调用）"""
+    return model.bind(use_cache=False) if isinstance(model, CachedChatModel) else model
+
+# 按角色配置模型：每个角色可设置 LLM_<角色>_MODEL / _BASE_URL / _API_KEY / _TEMPERATURE / _MAX_TOKENS，
+# 未设置的项沿用上级角色，最终回落到 default（deepseek-chat，DEEPSEEK_API_KEY / DEEPSEEK_BASE_URL）。
+# 例如 LLM_ROUTER_MODEL 指定路由用的小模型，LLM_WRITER_* 同时作用于写作团队与最终回答。
+ROLE_PARENTS = {
+    "router": "default",  # 监督者路由
+    "summary": "router",  # 上下文压缩摘要
+    "worker": "default",
+    "search": "worker",
+    "web_scraper": "worker",
+    "writer": "default",
+    "doc_writer": "writer",
+    "note_taker": "writer",
+    "chart_generator": "writer",
+    "answer": "writer",  # 顶层最终回答与子团队总结
+    "planner": "default",  # 先规划后执行模式的规划调用
+}
+
+@dataclass(frozen=True)
+class ModelConfig:
+    """单个角色解析后的模型配置，相同配置的角色共用一个模型实例"""
+    model: str
+    base_url: str
+    api_key: str
+    temperature: float = 0.0
+    max_tokens: Optional[int] = None
+
+def _role_chain(role: str) -> List[str]:
+    chain = [role]
+    while chain[-1] != "default":
+        chain.append(ROLE_PARENTS.get(chain[-1], "default"))
+    return chain
+
+def _role_setting(role: str, key: str) -> Optional[str]:
+    for name in _role_chain(role):
+        value = os.environ.get(f"LLM_{name.upper()}_{key}")
+        if value:
+            return value
+    return None
+
+def model_config(role: str = "default") -> ModelConfig:
+    require_env(*required_env_vars)
+    max_tokens = _role_setting(role, "MAX_TOKENS")
+    return ModelConfig(
+        model=_role_setting(role, "MODEL") or "deepseek-chat",  # DeepSeek对话模型
+        base_url=_role_setting(role, "BASE_URL") or os.environ["DEEPSEEK_BASE_URL"],
+        api_key=_role_setting(role, "API_KEY") or os.environ["DEEPSEEK_API_KEY"],
+        temperature=float(_role_setting(role, "TEMPERATURE") or 0),
+        max_tokens=int(max_tokens) if max_tokens else None,
+    )
+
+_http_clients = None
+_config_models: Dict[ModelConfig, BaseChatModel] = {}
+# 显式指定的角色模型（基准测试替身等），对其下级角色同样生效
+_role_models: Dict[str, BaseChatModel] = {}
+_models_lock = threading.RLock()
+
+def _build_model(config: ModelConfig) -> BaseChatModel:
+    from langchain_openai import ChatOpenAI
+    from transport import make_http_clients, with_transport
+
+    global _http_clients
+    if _http_clients is None:
+        _http_clients = make_http_clients()
+    http_client, http_async_client = _http_clients
+    # 缓存在传输层之外：命中缓存的调用不占用限流额度
+    return with_llm_cache(with_transport(ChatOpenAI(
+        model=config.model,
+        temperature=config.temperature,
+        max_tokens=config.max_tokens,
+        api_key=config.api_key,
+        base_url=config.base_url,
+        stream_usage=True,  # 流式调用也返回 token 用量，供指标统计
+        max_retries=0,  # 重试由传输层按运行预算统一处理
+        http_client=http_client,
+        http_async_client=http_async_client,
+    ), endpoint=config.base_url))
+
+def _build_llm() -> BaseChatModel:
+    with _models_lock:
+        config = model_config("default")
+        if config not in _config_models:
+            _config_models[config] = _build_model(config)
+        return _config_models[config]
+
+def set_model(role: str, model: BaseChatModel) -> None:
+    """为角色（及其下级角色）指定模型实例，需在图编译、智能体创建之前调用"""
+    with _models_lock:
+        _role_models[role] = model
+
+def get_model(role: str = "default") -> BaseChatModel:
+    """按角色返回模型；与 default 配置相同的角色返回 llm.llm 本身"""
+    with _models_lock:
+        for name in _role_chain(role):
+            if name in _role_models:
+                return _role_models[name]
+        config = model_config(role)
+        if config != model_config("default"):
+            if config not in _config_models:
+                _config_models[config] = _build_model(config)
+            return _config_models[config]
+    # 经模块属性读取（在锁外，避免与延迟属性的锁交叉），基准测试替换 llm.llm 后未分档的角色一并生效
+    return sys.modules[__name__].llm
+
+# 模型在首次访问 llm.llm 时创建，导入本模块不加载 langchain_openai
+__getattr__ = lazy_attributes(globals(), {"llm": _build_llm})
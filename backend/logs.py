@@ -0,0 +1,48 @@
+"""结构化日志：LOG_LEVEL 控制级别（默认 WARNING），LOG_FORMAT=json 时按行输出 JSON。
+
+调用方式：logger.info("路由决策", extra=fields(node=..., latency_ms=...))；
+高频调用（如逐 token）先用 logger.isEnabledFor 判断，关闭时不做任何格式化。
+"""
+import json
+import logging
+import os
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+
+# 结构化字段统一放在该属性下，避免与 LogRecord 自身的属性冲突
+_FIELDS = "fields"
+
+def fields(**values) -> dict:
+    return {_FIELDS: values}
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        values = getattr(record, _FIELDS, None)
+        if values:
+            line += " " + " ".join(f"{key}={value}" for key, value in values.items())
+        return line
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, _FIELDS, {}),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(KeyValueFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
@@ -1,14 +1,30 @@
-
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import Literal, Optional 
-from graph import super_graph as app
-import requests
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, model_validator
+from typing import Dict, Literal, Optional 
+import graph
 import json
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict, deque
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from llm import llm
+import llm
+from sandbox import repl_pool
+from session import new_session_id
+from sse import Broadcast, encode_frame
+from cache import normalize_query
+from runlog import ACTIVE_STATUSES
+from runner import execute_run, open_checkpointer as open_run_checkpointer, run_log, sweep_interrupted_runs
+from metrics import registry
+from logs import configure_logging, fields
+import logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # FastAPI 应用
 api_app = FastAPI(title="Chat API", version="1.0.0")
@@ -20,11 +36,166 @@ api_app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Run-Id"],
 )
 
+_checkpoint_conn = None
+_sweeper: Optional[asyncio.Task] = None
+
+# 执行模式：inline 在 API 进程内执行图；queue 只把运行写入队列，由 executor.py 启动的执行进程领取执行，
+# API 进程从运行日志读取事件推送，API 进程与执行进程可分别扩缩
+EXECUTION_MODE = os.environ.get("EXECUTION_MODE", "inline")
+# 队列模式下读取运行日志的轮询间隔（秒）：有新事件时按最短间隔，空闲时逐次加倍直到上限
+RUN_POLL_INTERVAL = float(os.environ.get("RUN_POLL_INTERVAL", 0.05))
+RUN_POLL_MAX_INTERVAL = float(os.environ.get("RUN_POLL_MAX_INTERVAL", 0.5))
+
+# 启动时预先编译图并创建模型、工具与智能体（默认关闭，首个请求时再初始化）
+WARM_UP = os.environ.get("WARM_UP", "0") == "1"
+
+@api_app.on_event("startup")
+async def warm_up():
+    if EXECUTION_MODE == "queue":
+        return
+    # 预热代码执行进程，首个图表请求无需等待进程启动与导入
+    await asyncio.to_thread(repl_pool.warm)
+    if WARM_UP:
+        start = time.perf_counter()
+        await asyncio.to_thread(graph.warm_up)
+        logger.info("预热完成", extra=fields(ms=round((time.perf_counter() - start) * 1000, 1)))
+
+@api_app.on_event("startup")
+async def open_checkpointer():
+    # 检查点存储须在事件循环内创建；队列模式下由执行进程各自打开
+    global _checkpoint_conn, _sweeper
+    if EXECUTION_MODE != "queue":
+        _checkpoint_conn = await open_run_checkpointer()
+        # 内联执行时由 API 进程清理中断超时的运行；队列模式下由执行进程清理
+        _sweeper = asyncio.create_task(sweep_interrupted_runs())
+
+@api_app.on_event("shutdown")
+async def shut_down():
+    if _sweeper is not None:
+        _sweeper.cancel()
+    repl_pool.shutdown()
+    if _checkpoint_conn is not None:
+        await _checkpoint_conn.close()
+
+# 运行准入配置：全局并发、单客户端并发（运行中 + 排队中）、排队上限
+MAX_CONCURRENT_RUNS = int(os.environ.get("MAX_CONCURRENT_RUNS", 4))
+MAX_RUNS_PER_CLIENT = int(os.environ.get("MAX_RUNS_PER_CLIENT", 2))
+MAX_QUEUED_RUNS = int(os.environ.get("MAX_QUEUED_RUNS", 16))
+
+class RunTicket:
+    """一次运行的准入凭证"""
+
+    def __init__(self, client: str):
+        self.client = client
+        self.granted = asyncio.Event()
+        self.started_at: Optional[float] = None
+        self.released = False
+
+class RunManager:
+    """图运行的准入控制：超出全局并发的请求进入有界 FIFO 队列，队列或单客户端额度满时拒绝"""
+
+    def __init__(self, max_running: int, max_per_client: int, max_queued: int):
+        self.max_running = max_running
+        self.max_per_client = max_per_client
+        self.max_queued = max_queued
+        self._running = 0
+        self._per_client = defaultdict(int)
+        self._queue: deque = deque()
+        # 运行时长的滑动平均，用于估算 Retry-After
+        self._avg_run_seconds = 30.0
+
+    def retry_after(self) -> int:
+        waves = (len(self._queue) + self._running) / max(1, self.max_running)
+        return max(1, math.ceil(self._avg_run_seconds * max(1.0, waves)))
+
+    def admit(self, client: str) -> RunTicket:
+        """登记一次运行；额度已满时抛出 429"""
+        if self._per_client[client] >= self.max_per_client:
+            raise HTTPException(
+                status_code=429,
+                detail="该客户端同时进行的请求过多",
+                headers={"Retry-After": str(self.retry_after())},
+            )
+        if self._running >= self.max_running and len(self._queue) >= self.max_queued:
+            raise HTTPException(
+                status_code=429,
+                detail="服务繁忙，请稍后重试",
+                headers={"Retry-After": str(self.retry_after())},
+            )
+        ticket = RunTicket(client)
+        self._per_client[client] += 1
+        self._queue.append(ticket)
+        self._dispatch()
+        return ticket
+
+    def position(self, ticket: RunTicket) -> int:
+        """前面排队的请求数"""
+        try:
+            return self._queue.index(ticket)
+        except ValueError:
+            return 0
+
+    def release(self, ticket: RunTicket) -> None:
+        """运行结束或客户端断开：归还额度并放行下一个排队请求（可重复调用）"""
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted.is_set():
+            self._running -= 1
+            if ticket.started_at is not None:
+                elapsed = time.monotonic() - ticket.started_at
+                self._avg_run_seconds = 0.8 * self._avg_run_seconds + 0.2 * elapsed
+        elif ticket in self._queue:
+            self._queue.remove(ticket)
+        self._per_client[ticket.client] -= 1
+        if self._per_client[ticket.client] <= 0:
+            del self._per_client[ticket.client]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._queue and self._running < self.max_running:
+            ticket = self._queue.popleft()
+            self._running += 1
+            ticket.started_at = time.monotonic()
+            ticket.granted.set()
+
+    def stats(self) -> dict:
+        return {"running": self._running, "queued": len(self._queue), "clients": len(self._per_client)}
+
+run_manager = RunManager(MAX_CONCURRENT_RUNS, MAX_RUNS_PER_CLIENT, MAX_QUEUED_RUNS)
+
+async def wait_for_slot(ticket: RunTicket):
+    """排队期间推送队列位置，位置变化时才发送新帧"""
+    last_position = None
+    while not ticket.granted.is_set():
+        position = run_manager.position(ticket)
+        if position != last_position:
+            last_position = position
+            yield encode_frame(f"排队中，前面还有 {position} 个请求", "info", tool_name="排队")
+        try:
+            await asyncio.wait_for(ticket.granted.wait(), timeout=1.0)
+        except asyncio.TimeoutError:
+            pass
+
 # 请求/响应模型
 class QuestionRequest(BaseModel):
-    question: str
+    question: str = ""
+    # 断线重连时携带，配合请求头 Last-Event-ID 补发遗漏的事件并从检查点继续运行
+    run_id: Optional[str] = None
+    # lean：过滤并批量发送事件；verbose：逐事件发送并打印（调试用）
+    stream_mode: Literal["lean", "verbose"] = "lean"
+    # supervisor：监督者逐跳路由；plan：一次规划出任务 DAG 后按依赖并行执行
+    graph_mode: Literal["supervisor", "plan"] = "supervisor"
+
+    @model_validator(mode="after")
+    def require_question(self) -> "QuestionRequest":
+        # 只有重连已有运行时可以不带问题，空问题不启动新的运行
+        if not self.run_id and not self.question.strip():
+            raise ValueError("question 不能为空")
+        return self
 
 class QuestionResponse(BaseModel):
     answer: str
@@ -33,9 +204,19 @@ class QuestionResponse(BaseModel):
 # 流式响应模型
 class StreamResponse(BaseModel):
     content: str  # 流式输出内容（工具日志或回答片段）
-    status: Literal["streaming", "tool_start", "tool_end", "info", "success", "error"]  # 状态标识
+    status: Literal[
+        "streaming", "tool_start", "tool_end", "info", "success", "error",
+        "agent_delta", "agent_tool_start", "agent_tool_end",  # 工作智能体的输出片段与工具调用
+    ]  # 状态标识
     is_final: bool = False  # 是否为最终回答片段
     tool_name: Optional[str] = None  # 工具/团队名称（状态为tool_start/tool_end时有效）
+    source: Optional[dict] = None  # 工作智能体所属的团队与节点（agent_* 帧）
+    trace: Optional[dict] = None  # 运行耗时与用量摘要（仅 success 帧）
+
+@api_app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式的节点、模型与工具耗时直方图"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @api_app.get("/api")
 async def root():
@@ -51,7 +232,7 @@ async def chat_stream(request: QuestionRequest):
         ]
         
         final_content = ""
-        async for chunk in llm.astream(messages):
+        async for chunk in llm.llm.astream(messages):
             # 获取chunk内容
             if hasattr(chunk, 'content') and chunk.content:
                 content = chunk.content
@@ -84,126 +265,225 @@ async def chat_stream(request: QuestionRequest):
         }
     )
 
-# 工具节点状态映射字典
-TOOL_NODE_MAPPING = {
-    # 监督决策类
-    "supervisor": "分析",
+# 相同问题的并发请求在该时间窗口（秒）内合并到同一次运行
+COALESCE_WINDOW = float(os.environ.get("COALESCE_WINDOW", 30))
 
-    # 信息检索类
-    "search": "搜索",
-    "web_scraper": "网页抓取",
-    
-    # 文档写作类
-    "doc_writer": "文档写作",
-    "note_taker": "笔记整理", 
-    "chart_generator": "图表生成",
-    
-    # 团队节点
-    "research_team": "调研团队",
-    "writing_team": "写作团队",
-}
+class LiveRun:
+    """本进程中正在执行的一次运行。图在独立任务中执行，结果经 Broadcast 分发给所有订阅的请求，
+    最后一个订阅者断开时取消运行。"""
 
-def get_tool_status(event_type: str, node_name: str) -> dict:
-    """
-    根据事件类型和节点名称获取工具状态信息
-    
-    Args:
-        event_type: 事件类型 ('on_chain_stream', 'on_chain_end' 等)
-        node_name: 节点名称
-    
-    Returns:
-        dict: 包含状态信息的字典
+    def __init__(self, run: dict, key: Optional[str]):
+        self.run_id = run["run_id"]
+        self.question = run["question"]
+        self.key = key
+        self.started = time.monotonic()
+        self.broadcast = Broadcast()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+# 正在本进程中执行的运行：按运行 ID 与合并键索引
+_live_runs: Dict[str, LiveRun] = {}
+_live_by_key: Dict[str, LiveRun] = {}
+
+def coalesce_key(request: QuestionRequest) -> Optional[str]:
+    # 调试模式逐事件输出，不参与合并
+    if request.stream_mode != "lean":
+        return None
+    return f"{request.stream_mode}:{request.graph_mode}:{normalize_query(request.question)}"
+
+async def run_live(live: LiveRun, ticket: RunTicket, stream_mode: str, graph_mode: str) -> None:
+    """排队等待额度后在本进程内执行运行，数据块广播给所有订阅者"""
+    try:
+        async for frame in wait_for_slot(ticket):
+            live.broadcast.publish(frame)
+        await execute_run(live.run_id, live.question, stream_mode, live.broadcast.publish, graph_mode)
+    finally:
+        run_manager.release(ticket)
+        _live_runs.pop(live.run_id, None)
+        if live.key is not None and _live_by_key.get(live.key) is live:
+            del _live_by_key[live.key]
+        live.broadcast.close()
+
+def start_run(run: dict, ticket: RunTicket, stream_mode: str, key: Optional[str], graph_mode: str) -> LiveRun:
+    live = LiveRun(run, key)
+    _live_runs[live.run_id] = live
+    if key is not None:
+        _live_by_key[key] = live
+    live.task = asyncio.create_task(run_live(live, ticket, stream_mode, graph_mode))
+    return live
+
+class Subscription:
+    """一个请求对运行的订阅：先补发日志中 Last-Event-ID 之后的事件，再实时接收"""
+
+    def __init__(self, run_id: str, live: Optional[LiveRun], last_event_id: int):
+        self.live = live
+        self.closed = False
+        # 日志快照与广播位置在同一时刻取得，二者之间不会遗漏或重复
+        self.replay = run_log.events_after(run_id, last_event_id)
+        self.start = len(live.broadcast.items) if live else 0
+        if live is not None:
+            live.subscribers += 1
+
+    async def stream(self):
+        try:
+            for seq, data in self.replay:
+                yield f"id: {seq}\n{data}"
+            if self.live is not None:
+                async for item in self.live.broadcast.subscribe(self.start):
+                    yield item
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """可重复调用；最后一个订阅者离开时取消运行及其进行中的 HTTP 调用"""
+        if self.closed or self.live is None:
+            return
+        self.closed = True
+        self.live.subscribers -= 1
+        if self.live.subscribers <= 0 and self.live.task is not None and not self.live.task.done():
+            self.live.task.cancel()
+
+class QueuedSubscription:
+    """队列模式下对运行的订阅：轮询运行日志推送 Last-Event-ID 之后的事件，排队期间推送队列位置。
+
+    订阅数记录在运行队列中，最后一个订阅者离开时由执行进程取消运行。
+    运行日志的读取是同步的 SQLite 查询，放到线程中执行，不阻塞事件循环。
     """
-    # 获取节点中文名称
-    chinese_name = TOOL_NODE_MAPPING.get(node_name, '思考')
-    
-    # 根据事件类型确定状态
-    if event_type == 'on_chain_stream':
-        status = "streaming"
-        content = f"{chinese_name}中..."
-    elif event_type == 'on_chain_start':
-        status = "tool_start" 
-        content = f"开始{chinese_name}"
-    elif event_type == 'on_chain_end':
-        status = "tool_end"
-        content = f"完成{chinese_name}"
-    else:
-        status = "info"
-        content = f"{chinese_name}处理中"
-    
-    return {
-        "content": content,
-        "status": status,
-        "tool_name": node_name,
-        "chinese_name": chinese_name,
-        "is_final": False
-    }
-
-# 在 main.py 中使用示例
-@api_app.post("/api/chat")
-async def chatting(request: QuestionRequest):
-    async def generate_stream():
+
+    def __init__(self, run_id: str, last_event_id: int):
+        self.run_id = run_id
+        self.last_event_id = last_event_id
+        self.closed = False
+        run_log.subscribe(run_id, 1)
+
+    async def _pending(self) -> list:
+        events = await asyncio.to_thread(run_log.events_after, self.run_id, self.last_event_id)
+        if events:
+            self.last_event_id = events[-1][0]
+        return [f"id: {seq}\n{data}" for seq, data in events]
+
+    async def stream(self):
+        last_position = None
+        interval = RUN_POLL_INTERVAL
         try:
-            inputs = {"messages": [HumanMessage(content=request.question)]}
-            
-            async for event in app.astream_events(
-                inputs,
-                version="v1", 
-                config={"recursion_limit": 150}
-            ):
-                event_type = event['event']
-                node_name = event.get('name', '')
-                
-                print(f"事件类型: {event_type}, 节点名称: {node_name}")
-                
-                # 处理监督者的流式输出
-                if (event_type == 'on_chain_stream' and 
-                    event.get('name') == 'supervisor'):
-                    # print("event['data']", event['data'])
-                    
-                    chunk = event['data']['chunk']
-                    
-                    if hasattr(chunk, 'update') and chunk.update:
-                        update_data = chunk.update
-                        is_top_level = update_data.get("is_top_level", False)
-                        
-                        if is_top_level and "messages" in update_data and update_data["messages"]:
-                            messages = update_data["messages"]
-                            
-                            for msg in messages:
-                                if isinstance(msg, AIMessage) and msg.content:
-                                    print(f"📤 发送AI消息: '{msg.content}'")
-                                    
-                                    chunk_data = StreamResponse(
-                                        content=msg.content,
-                                        status="streaming", 
-                                        is_final=False
-                                    )
-                                    yield f"data: {json.dumps(chunk_data.model_dump(), ensure_ascii=False)}\n\n"
-                
-                # 处理其他节点的状态通知
-                elif event_type in ['on_chain_start', 'on_chain_stream', 'on_chain_end']:
-                    # 获取工具状态信息
-                    tool_status = get_tool_status(event_type, node_name)
-                    
-                    # 发送工具状态到前端
-                    status_data = StreamResponse(
-                        content=tool_status["content"],
-                        status=tool_status["status"],
-                        tool_name=tool_status["chinese_name"],
-                        is_final=tool_status["is_final"]
-                    )
-                    yield f"data: {json.dumps(status_data.model_dump(), ensure_ascii=False)}\n\n"
-            
-            # 最终完成
-            final_data = StreamResponse(content="", status="success", is_final=True)
-            yield f"data: {json.dumps(final_data.model_dump(), ensure_ascii=False)}\n\n"
-            
-        except Exception as e:
-            error_data = StreamResponse(content=f"错误: {str(e)}", status="error", is_final=True)
-            yield f"data: {json.dumps(error_data.model_dump(), ensure_ascii=False)}\n\n"
-    
-    return StreamingResponse(generate_stream(), media_type="text/event-stream")
+            while True:
+                chunks = await self._pending()
+                if chunks:
+                    interval = RUN_POLL_INTERVAL
+                    for chunk in chunks:
+                        yield chunk
+                    continue
+                run = await asyncio.to_thread(run_log.get_run, self.run_id)
+                if run["status"] not in ACTIVE_STATUSES:
+                    # 终态在最后一帧写入日志之后才更新，再读一次即可取完
+                    for chunk in await self._pending():
+                        yield chunk
+                    return
+                if run["status"] == "queued":
+                    position = await asyncio.to_thread(run_log.queue_position, self.run_id)
+                    if position != last_position:
+                        last_position = position
+                        yield encode_frame(f"排队中，前面还有 {position} 个请求", "info", tool_name="排队")
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, RUN_POLL_MAX_INTERVAL)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        run_log.subscribe(self.run_id, -1)
+
+def admit_queued(client: str) -> None:
+    """队列模式的准入：按运行队列中的计数检查单客户端额度与排队上限，额度已满时抛出 429"""
+    if sum(run_log.count_active(client)) >= MAX_RUNS_PER_CLIENT:
+        raise HTTPException(
+            status_code=429,
+            detail="该客户端同时进行的请求过多",
+            headers={"Retry-After": str(run_manager.retry_after())},
+        )
+    queued, _ = run_log.count_active()
+    if queued >= MAX_QUEUED_RUNS:
+        raise HTTPException(
+            status_code=429,
+            detail="服务繁忙，请稍后重试",
+            headers={"Retry-After": str(run_manager.retry_after())},
+        )
+
+def enqueue_chat(request: QuestionRequest, client: str) -> str:
+    """队列模式：新问题写入运行队列，重连时把中断的运行重新排队，返回运行 ID"""
+    if request.run_id:
+        run = run_log.get_run(request.run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="运行不存在")
+        if run["status"] == "interrupted":
+            # 所有订阅者曾断开而中断的运行：重新排队，执行进程从检查点继续
+            run_log.requeue(request.run_id)
+        return request.run_id
+
+    key = coalesce_key(request)
+    run_id = run_log.find_active(key, time.time() - COALESCE_WINDOW) if key is not None else None
+    if run_id is None:
+        admit_queued(client)
+        run_id = new_session_id()
+        run_log.create_run(run_id, request.question, status="queued", client=client,
+                           coalesce_key=key, stream_mode=request.stream_mode, graph_mode=request.graph_mode)
+    return run_id
+
+@api_app.post("/api/chat")
+async def chatting(request: QuestionRequest, http_request: Request):
+    try:
+        last_event_id = int(http_request.headers.get("last-event-id") or 0)
+    except ValueError:
+        last_event_id = 0
+    client = http_request.client.host if http_request.client else "unknown"
+
+    if EXECUTION_MODE == "queue":
+        run_id = enqueue_chat(request, client)
+        subscription = QueuedSubscription(run_id, last_event_id)
+        return StreamingResponse(
+            subscription.stream(),
+            media_type="text/event-stream",
+            headers={"X-Run-Id": run_id},
+            background=BackgroundTask(subscription.close),
+        )
+
+    live = None
+    if request.run_id:
+        live = _live_runs.get(request.run_id)
+        run = run_log.get_run(request.run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="运行不存在")
+        if live is None and run["status"] in ("running", "interrupted"):
+            # 中断的运行（或执行它的进程已退出）：从检查点恢复
+            ticket = run_manager.admit(client)
+            run_log.set_status(request.run_id, "running")
+            # 沿用运行创建时的图模式，检查点只对同一张图有效
+            live = start_run(run, ticket, request.stream_mode, None, run["graph_mode"])
+    else:
+        key = coalesce_key(request)
+        candidate = _live_by_key.get(key) if key is not None else None
+        if candidate is not None and time.monotonic() - candidate.started <= COALESCE_WINDOW:
+            # 相同问题的运行正在进行：作为订阅者加入，先收到已发出的事件再继续实时接收
+            live = candidate
+            run = {"run_id": live.run_id}
+        else:
+            # 准入检查在返回流之前完成，额度已满时直接返回 429
+            ticket = run_manager.admit(client)
+            run = {"run_id": new_session_id(), "question": request.question, "status": "running"}
+            run_log.create_run(run["run_id"], request.question, client=client,
+                               stream_mode=request.stream_mode, graph_mode=request.graph_mode)
+            live = start_run(run, ticket, request.stream_mode, key, request.graph_mode)
+
+    subscription = Subscription(run["run_id"], live, last_event_id)
+    # 生成器未开始就断开时 finally 不会执行，由后台任务兜底
+    return StreamingResponse(
+        subscription.stream(),
+        media_type="text/event-stream",
+        headers={"X-Run-Id": run["run_id"]},
+        background=BackgroundTask(subscription.close),
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,312 @@
+"""运行指标：节点耗时、模型首 token 时间与 token 用量、工具耗时。
+
+指标以直方图/计数器形式汇总到进程级的 registry，由 /metrics 以 Prometheus 文本格式输出；
+同一份数据按运行累计到 RunTrace，运行结束时随 success 帧返回摘要。
+采集通过 LangChain 回调完成，节点与工具代码无需改动。
+"""
+import asyncio
+import bisect
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from utils.context import estimate_tokens
+
+# 每百万 token 的价格，用于估算单次运行成本（默认按 deepseek-chat 标价，单位元）
+LLM_PRICE_PROMPT = float(os.environ.get("LLM_PRICE_PROMPT", 2))
+LLM_PRICE_COMPLETION = float(os.environ.get("LLM_PRICE_COMPLETION", 8))
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value:g}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # 标签值 -> [各桶计数（非累计）..., 总和, 次数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(series[-1] for series in self._series.values())
+
+    def sum(self) -> float:
+        with self._lock:
+            return sum(series[-2] for series in self._series.values())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {series[-2]:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {series[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+RUN_SECONDS = registry.histogram("agent_run_duration_seconds", "单次运行总耗时", ("status",))
+RUN_TTFT_SECONDS = registry.histogram("agent_run_ttft_seconds", "运行开始到最终回答首个 token 的时间")
+NODE_SECONDS = registry.histogram("agent_node_duration_seconds", "图节点单次执行耗时", ("graph", "node"))
+LLM_TTFT_SECONDS = registry.histogram("llm_ttft_seconds", "模型调用首 token 时间", ("call_site",))
+# status：ok 正常结束，closed 调用方提前关闭流（如监督者提前退出路由）或被取消，error 出错
+LLM_SECONDS = registry.histogram("llm_duration_seconds", "模型调用总耗时", ("call_site", "status"))
+LLM_TOKENS = registry.histogram("llm_tokens", "单次模型调用的 token 数", ("call_site", "kind"), TOKEN_BUCKETS)
+LLM_TOKENS_TOTAL = registry.counter("llm_tokens_total", "累计 token 数", ("call_site", "kind"))
+LLM_COST_TOTAL = registry.counter("llm_cost_total", "按 LLM_PRICE_* 估算的累计成本")
+TOOL_SECONDS = registry.histogram("tool_duration_seconds", "工具调用耗时", ("tool", "status"))
+
+def _node_path(metadata: Optional[dict]) -> Tuple[str, str]:
+    """由 LangGraph 元数据得到 (所在图路径, 节点名)，如 ("research_team", "search")"""
+    metadata = metadata or {}
+    node = metadata.get("langgraph_node") or ""
+    namespace = metadata.get("checkpoint_ns") or ""
+    parents = [part.split(":")[0] for part in namespace.split("|") if part][:-1]
+    return "/".join(parents) or "root", node
+
+def _usage(response) -> Tuple[Optional[int], Optional[int]]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens"), usage.get("output_tokens")
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+def _response_text(response) -> str:
+    return "".join(g.text for generations in response.generations for g in generations)
+
+class RunTrace:
+    """单次运行的耗时与用量汇总"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.nodes: Dict[str, list] = {}  # 节点 -> [次数, 秒]
+        self.llm: Dict[str, list] = {}  # 调用点 -> [次数, 秒, 首 token 秒, 输入 token, 输出 token]
+        self.tools: Dict[str, list] = {}  # 工具 -> [次数, 秒, 失败次数]
+
+    def add_node(self, key: str, seconds: float) -> None:
+        entry = self.nodes.setdefault(key, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def add_llm(self, key: str, seconds: float, ttft: Optional[float], prompt: int, completion: int) -> None:
+        entry = self.llm.setdefault(key, [0, 0.0, 0.0, 0, 0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += ttft or 0.0
+        entry[3] += prompt
+        entry[4] += completion
+
+    def add_tool(self, name: str, seconds: float, failed: bool) -> None:
+        entry = self.tools.setdefault(name, [0, 0.0, 0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += failed
+
+    def mark_first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+            RUN_TTFT_SECONDS.observe(self.ttft)
+
+    def finish(self, status: str) -> None:
+        RUN_SECONDS.observe(time.perf_counter() - self.started, status)
+
+    def summary(self) -> dict:
+        prompt = sum(entry[3] for entry in self.llm.values())
+        completion = sum(entry[4] for entry in self.llm.values())
+        ms = lambda seconds: round(seconds * 1000, 1)
+        return {
+            "wall_ms": ms(time.perf_counter() - self.started),
+            "ttft_ms": ms(self.ttft) if self.ttft is not None else None,
+            "nodes": {key: {"calls": n, "ms": ms(s)} for key, (n, s) in self.nodes.items()},
+            "llm": {
+                key: {"calls": n, "ms": ms(s), "avg_ttft_ms": ms(t / n), "prompt_tokens": p, "completion_tokens": c}
+                for key, (n, s, t, p, c) in self.llm.items()
+            },
+            "tools": {key: {"calls": n, "ms": ms(s), "errors": e} for key, (n, s, e) in self.tools.items()},
+            "tokens": {"prompt": prompt, "completion": completion},
+            "cost": round(estimate_cost(prompt, completion), 6),
+        }
+
+def estimate_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    return (prompt_tokens * LLM_PRICE_PROMPT + completion_tokens * LLM_PRICE_COMPLETION) / 1_000_000
+
+class MetricsCallback(BaseCallbackHandler):
+    """记录节点、模型调用与工具的耗时和用量，同时写入全局指标与本次运行的 RunTrace。
+
+    以同步方式在事件循环内直接执行（run_inline），每个回调只做字典读写。
+    """
+
+    run_inline = True
+
+    def __init__(self, trace: Optional[RunTrace] = None, answer_event: Optional[str] = None):
+        self.trace = trace or RunTrace()
+        # 该自定义事件首次出现的时间记为本次运行的首 token 时间
+        self.answer_event = answer_event
+        self._nodes: Dict[UUID, Tuple[str, str, float]] = {}
+        # 模型调用：run_id -> [调用点, 开始时间, 首 token 时间, 输入消息]
+        self._llm: Dict[UUID, list] = {}
+        self._tools: Dict[UUID, Tuple[str, float]] = {}
+
+    # 节点：只统计名称与 langgraph_node 相同的链，即节点本身
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        if metadata and kwargs.get("name") == metadata.get("langgraph_node"):
+            graph, node = _node_path(metadata)
+            self._nodes[run_id] = (graph, node, time.perf_counter())
+
+    def _end_node(self, run_id: UUID) -> None:
+        started = self._nodes.pop(run_id, None)
+        if started is not None:
+            graph, node, start = started
+            seconds = time.perf_counter() - start
+            NODE_SECONDS.observe(seconds, graph, node)
+            self.trace.add_node(f"{graph}/{node}", seconds)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_node(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # 节点以 Command 跳转上级图时也经由这里结束，同样计入耗时
+        self._end_node(run_id)
+
+    # 模型调用：调用点为 图路径/节点[/运行名]，监督者路由与最终回答以运行名区分
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        graph, node = _node_path(metadata)
+        call_site = f"{graph}/{node}" if node else graph
+        if kwargs.get("name"):
+            call_site = f"{call_site}/{kwargs['name']}"
+        self._llm[run_id] = [call_site, time.perf_counter(), None, messages]
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        call = self._llm.get(run_id)
+        if call is not None and call[2] is None:
+            call[2] = time.perf_counter()
+            LLM_TTFT_SECONDS.observe(call[2] - call[1], call[0])
+
+    def _end_llm(self, run_id: UUID, status: str, response=None) -> None:
+        call = self._llm.pop(run_id, None)
+        if call is None:
+            return
+        call_site, start, first, messages = call
+        now = time.perf_counter()
+        LLM_SECONDS.observe(now - start, call_site, status)
+        prompt, completion = _usage(response) if response is not None else (None, None)
+        # 未返回用量时（如提前取消的流）按文本估算
+        if prompt is None:
+            prompt = sum(estimate_tokens(str(m.content)) for batch in messages for m in batch)
+        if completion is None:
+            completion = estimate_tokens(_response_text(response)) if response is not None else 0
+        for kind, count in (("prompt", prompt), ("completion", completion)):
+            LLM_TOKENS.observe(count, call_site, kind)
+            LLM_TOKENS_TOTAL.inc(count, call_site, kind)
+        LLM_COST_TOTAL.inc(estimate_cost(prompt, completion))
+        self.trace.add_llm(call_site, now - start, first - start if first else None, prompt, completion)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_llm(run_id, "ok", response)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # 提前退出的路由调用关闭流（GeneratorExit）与被取消的调用也会走到这里，不计为错误
+        closed = isinstance(error, (GeneratorExit, asyncio.CancelledError))
+        self._end_llm(run_id, "closed" if closed else "error")
+
+    # 工具：搜索、抓取、代码执行与文档工具
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs: Any) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._tools[run_id] = (name, time.perf_counter())
+
+    def _end_tool(self, run_id: UUID, failed: bool) -> None:
+        started = self._tools.pop(run_id, None)
+        if started is not None:
+            name, start = started
+            seconds = time.perf_counter() - start
+            TOOL_SECONDS.observe(seconds, name, "error" if failed else "ok")
+            self.trace.add_tool(name, seconds, failed)
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_tool(run_id, False)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_tool(run_id, True)
+
+    def on_custom_event(self, name: str, data: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if name == self.answer_event:
+            self.trace.mark_first_token()
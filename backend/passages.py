@@ -0,0 +1,184 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from runlog import RUN_DATA_DIR
+
+# 抓取、搜索到的正文编入本次运行的段落索引，工具结果只返回来源编号与预览，写作智能体按需检索原文；
+# 设为 0 时工具结果恢复为完整正文
+PASSAGE_INDEX = os.environ.get("PASSAGE_INDEX", "1") == "1"
+# 段落切分长度（字符）、每个会话最多索引的段落数、工具结果中每个来源的预览长度
+PASSAGE_CHARS = int(os.environ.get("PASSAGE_CHARS", 600))
+PASSAGE_MAX_PER_RUN = int(os.environ.get("PASSAGE_MAX_PER_RUN", 5000))
+PASSAGE_PREVIEW_CHARS = int(os.environ.get("PASSAGE_PREVIEW_CHARS", 200))
+# 抓取结果中每个网页的开头预览，只用于辨认来源；正文细节通过 search_passages 检索
+PASSAGE_LEAD_CHARS = int(os.environ.get("PASSAGE_LEAD_CHARS", 80))
+# 已索引的来源原文保存在共享的运行数据目录中，运行被其他执行进程接手时据此重建索引
+PASSAGE_DB_PATH = Path(os.environ.get("PASSAGE_DB_PATH", str(RUN_DATA_DIR / "passages.sqlite")))
+
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# 英文/数字按词，连续的汉字取单字与相邻二字组合
+_TERM_PATTERN = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+
+def tokenize(text: str) -> List[str]:
+    terms = []
+    for word in _TERM_PATTERN.findall(text.lower()):
+        if "\u4e00" <= word[0] <= "\u9fff":
+            terms.extend(word)
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word)
+    return terms
+
+def split_passages(text: str, size: int = PASSAGE_CHARS) -> List[str]:
+    """按行切分，短行合并到接近 size，超长的行按 size 硬切"""
+    passages, current = [], ""
+    for paragraph in text.splitlines():
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 1 > size:
+            passages.append(current)
+            current = ""
+        while len(paragraph) > size:
+            passages.append(paragraph[:size])
+            paragraph = paragraph[size:]
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+@dataclass
+class Passage:
+    id: str  # 来源 id + 段落序号，如 S2.3
+    source_id: str
+    title: str
+    url: str
+    text: str
+
+class PassageIndex:
+    """单个会话的段落索引：倒排表 + BM25 打分，同一 URL 只索引一次。
+    on_add 在新来源编入索引时以 (来源 id, url, 标题, 原文) 调用，用于持久化。"""
+
+    def __init__(self, on_add: Optional[Callable[[str, str, str, str], None]] = None):
+        self.passages: List[Passage] = []
+        self.sources: Dict[str, str] = {}  # url -> 来源 id
+        self._postings: Dict[str, Dict[int, int]] = {}  # 词 -> {段落下标: 词频}
+        self._lengths: List[int] = []
+        self._on_add = on_add
+        self._lock = threading.Lock()
+
+    def add(self, url: str, title: str, text: str) -> Tuple[str, int]:
+        """索引一个来源，返回 (来源 id, 段落数)；已索引过的 URL 直接返回已有的来源 id"""
+        with self._lock:
+            if url in self.sources:
+                source_id = self.sources[url]
+                return source_id, sum(1 for p in self.passages if p.source_id == source_id)
+            source_id = f"S{len(self.sources) + 1}"
+            if self._on_add is not None:
+                self._on_add(source_id, url, title, text)
+            return source_id, self._index(source_id, url, title, text)
+
+    def _index(self, source_id: str, url: str, title: str, text: str) -> int:
+        # 调用方持有锁
+        self.sources[url] = source_id
+        chunks = split_passages(text)[:max(0, PASSAGE_MAX_PER_RUN - len(self.passages))]
+        for i, chunk in enumerate(chunks, 1):
+            index = len(self.passages)
+            self.passages.append(Passage(f"{source_id}.{i}", source_id, title, url, chunk))
+            terms = Counter(tokenize(chunk))
+            self._lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[index] = tf
+        return len(chunks)
+
+    def restore(self, sources: List[Tuple[str, str, str, str]]) -> None:
+        """按编入顺序重建已持久化的来源 [(来源 id, url, 标题, 原文)]，不再触发 on_add"""
+        with self._lock:
+            for source_id, url, title, text in sources:
+                if url not in self.sources:
+                    self._index(source_id, url, title, text)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[Passage, float]]:
+        with self._lock:
+            total = len(self.passages)
+            if not total:
+                return []
+            avg_length = sum(self._lengths) / total
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for index, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[index] / avg_length)
+                    scores[index] = scores.get(index, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self.passages[index], score) for index, score in ranked]
+
+class PassageStore:
+    """按会话隔离的段落索引。倒排表在内存中，来源原文写入 SQLite：
+    本进程中没有该会话的索引时（如运行由其他执行进程接手）从库中重建。会话结束时释放。
+    读写库的方法会做同步 I/O，工具中经 asyncio.to_thread 调用。"""
+
+    def __init__(self, db_path: Path = PASSAGE_DB_PATH):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._indexes: Dict[str, PassageIndex] = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        # 多个进程共用同一个库，写锁冲突时等待而不是立即失败
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sources "
+            "(session_id TEXT, source_id TEXT, url TEXT, title TEXT, text TEXT, PRIMARY KEY (session_id, url))"
+        )
+        self._db.commit()
+
+    def _persist(self, session_id: str, source_id: str, url: str, title: str, text: str) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO sources VALUES (?, ?, ?, ?, ?)", (session_id, source_id, url, title, text)
+            )
+            self._db.commit()
+
+    def index(self, session_id: str) -> PassageIndex:
+        with self._lock:
+            index = self._indexes.get(session_id)
+            if index is None:
+                index = PassageIndex(
+                    on_add=lambda source_id, url, title, text: self._persist(session_id, source_id, url, title, text)
+                )
+                with self._db_lock:
+                    rows = self._db.execute(
+                        "SELECT source_id, url, title, text FROM sources WHERE session_id = ? ORDER BY rowid",
+                        (session_id,),
+                    ).fetchall()
+                index.restore(rows)
+                self._indexes[session_id] = index
+            return index
+
+    def suspend(self, session_id: str) -> None:
+        """会话中断：只丢弃内存中的索引，恢复时从来源库重建"""
+        with self._lock:
+            self._indexes.pop(session_id, None)
+
+    def release(self, session_id: str) -> None:
+        with self._lock:
+            self._indexes.pop(session_id, None)
+        with self._db_lock:
+            self._db.execute("DELETE FROM sources WHERE session_id = ?", (session_id,))
+            self._db.commit()
+
+def preview(text: str, limit: int = PASSAGE_PREVIEW_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
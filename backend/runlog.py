@@ -0,0 +1,309 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 运行数据目录：检查点与事件日志都存放在这里
+RUN_DATA_DIR = Path(os.environ.get("RUN_DATA_DIR", str(Path(__file__).parent / ".data")))
+CHECKPOINT_PATH = RUN_DATA_DIR / "checkpoints.sqlite"
+RUN_LOG_PATH = RUN_DATA_DIR / "runs.sqlite"
+# 队列模式下执行进程的租约：超过该时间（秒）未续约的运行视为执行进程已退出，可被重新领取
+RUN_LEASE_SECONDS = float(os.environ.get("RUN_LEASE_SECONDS", 30))
+# 事件由后台线程批量写入：每隔该时间（秒）或积累该数量的数据块时提交一次
+RUN_LOG_FLUSH_INTERVAL = float(os.environ.get("RUN_LOG_FLUSH_INTERVAL", 0.05))
+RUN_LOG_BATCH_SIZE = int(os.environ.get("RUN_LOG_BATCH_SIZE", 256))
+# 中断的运行保留检查点与会话资源的时间（秒），超时仍未恢复时标记为 expired 并释放
+RUN_RESUME_TTL = float(os.environ.get("RUN_RESUME_TTL", 3600))
+
+# 未结束的运行状态；其余为终态 done / error / interrupted（可恢复）/ expired（中断超时，不可恢复）
+ACTIVE_STATUSES = ("queued", "running")
+
+# 队列模式使用的列，旧库启动时补齐
+_QUEUE_COLUMNS = {
+    "client": "TEXT",
+    "coalesce_key": "TEXT",
+    "stream_mode": "TEXT DEFAULT 'lean'",
+    "graph_mode": "TEXT DEFAULT 'supervisor'",
+    "worker": "TEXT",
+    "heartbeat": "REAL",
+    "cancel": "INTEGER DEFAULT 0",
+    "subscribers": "INTEGER DEFAULT 0",
+}
+
+class RunLog:
+    """按运行记录问题、状态与已发送的 SSE 数据块（只追加），用于断线重连后补发。
+
+    队列模式下 runs 表同时是持久化的运行队列：API 进程写入 queued 状态的运行，
+    执行进程领取后续约心跳，并通过 run_events 把事件交给 API 进程推送。
+
+    append 只在内存中分配序号并放入待写队列，不在调用方（事件循环）上做磁盘 I/O；
+    后台线程按批写入并提交。本进程内的读取与状态更新先写完待写的事件，其他进程最多晚一个提交间隔看到。
+    """
+
+    def __init__(self, db_path: Path):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # 多个进程共用同一个库，写锁冲突时等待而不是立即失败
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS runs "
+            "(run_id TEXT PRIMARY KEY, question TEXT, status TEXT, created REAL, updated REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS run_events "
+            "(run_id TEXT, seq INTEGER, data TEXT, PRIMARY KEY (run_id, seq))"
+        )
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(runs)")}
+        for column, definition in _QUEUE_COLUMNS.items():
+            if column not in existing:
+                self._db.execute(f"ALTER TABLE runs ADD COLUMN {column} {definition}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS runs_status ON runs (status, created)")
+        self._db.commit()
+
+        # 待写入的事件与各运行在本进程中分配到的最后序号
+        self._pending: List[Tuple[str, int, str]] = []
+        self._seqs: Dict[str, int] = {}
+        self._pending_lock = threading.Lock()
+        # 保证先取出的批次先写入，flush 返回时之前追加的事件都已提交
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="runlog-writer", daemon=True)
+        self._writer.start()
+        # 进程正常退出时写完尚未提交的事件
+        atexit.register(self.flush)
+
+    def _write_loop(self) -> None:
+        while not self._closed:
+            self._wake.wait(RUN_LOG_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # 本批事件丢失，断线重连时无法补发，但不影响运行本身
+                logger.exception("运行日志写入失败")
+
+    def flush(self) -> None:
+        """写入并提交所有待写的事件"""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            with self._lock:
+                self._db.executemany("INSERT INTO run_events VALUES (?, ?, ?)", batch)
+                self._db.commit()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self._writer.join()
+        self.flush()
+
+    def _forget(self, run_id: str) -> None:
+        # 运行可能被其他进程接手，之后在本进程追加时重新从库中读取序号
+        self.flush()
+        with self._pending_lock:
+            self._seqs.pop(run_id, None)
+
+    def create_run(
+        self,
+        run_id: str,
+        question: str,
+        status: str = "running",
+        client: Optional[str] = None,
+        coalesce_key: Optional[str] = None,
+        stream_mode: str = "lean",
+        graph_mode: str = "supervisor",
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO runs (run_id, question, status, created, updated, client, coalesce_key, stream_mode, "
+                "graph_mode) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, question, status, now, now, client, coalesce_key, stream_mode, graph_mode),
+            )
+            self._db.commit()
+
+    def get_run(self, run_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT question, status, stream_mode, heartbeat, graph_mode FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "run_id": run_id,
+            "question": row[0],
+            "status": row[1],
+            "stream_mode": row[2],
+            "heartbeat": row[3],
+            "graph_mode": row[4] or "supervisor",
+        }
+
+    def set_status(self, run_id: str, status: str) -> None:
+        # 先写完该运行之前的事件：读取方看到终态时事件已全部可见
+        self._forget(run_id)
+        with self._lock:
+            self._db.execute(
+                "UPDATE runs SET status = ?, updated = ? WHERE run_id = ?", (status, time.time(), run_id)
+            )
+            self._db.commit()
+
+    def append(self, run_id: str, data: str) -> int:
+        """追加一个数据块，返回其序号（即 SSE 事件 id）；数据块由后台线程批量写入"""
+        with self._pending_lock:
+            last = self._seqs.get(run_id)
+        if last is None:
+            # 本进程首次为该运行追加（新运行或从检查点恢复），从库中读取已有的最后序号
+            with self._lock:
+                last = self._db.execute(
+                    "SELECT COALESCE(MAX(seq), 0) FROM run_events WHERE run_id = ?", (run_id,)
+                ).fetchone()[0]
+        with self._pending_lock:
+            seq = max(self._seqs.get(run_id, 0), last) + 1
+            self._seqs[run_id] = seq
+            self._pending.append((run_id, seq, data))
+            if len(self._pending) >= RUN_LOG_BATCH_SIZE:
+                self._wake.set()
+        return seq
+
+    def events_after(self, run_id: str, last_event_id: int) -> List[Tuple[int, str]]:
+        self.flush()
+        with self._lock:
+            return self._db.execute(
+                "SELECT seq, data FROM run_events WHERE run_id = ? AND seq > ? ORDER BY seq",
+                (run_id, last_event_id),
+            ).fetchall()
+
+    # 以下为队列模式使用的方法
+
+    def claim(self, worker: str, lease: float = RUN_LEASE_SECONDS) -> Optional[dict]:
+        """领取最早的排队运行（或租约已过期的运行），标记为由该执行进程执行"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT run_id, question, stream_mode, graph_mode FROM runs "
+                    "WHERE cancel = 0 AND (status = 'queued' "
+                    "OR (status = 'running' AND worker IS NOT NULL AND heartbeat < ?)) "
+                    "ORDER BY created LIMIT 1",
+                    (now - lease,),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE runs SET status = 'running', worker = ?, heartbeat = ?, updated = ? WHERE run_id = ?",
+                        (worker, now, now, row[0]),
+                    )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        if row is None:
+            return None
+        return {"run_id": row[0], "question": row[1], "stream_mode": row[2] or "lean", "graph_mode": row[3] or "supervisor"}
+
+    def heartbeat(self, worker: str, run_ids: List[str]) -> List[str]:
+        """为执行中的运行续约，返回其中被请求取消的运行"""
+        if not run_ids:
+            return []
+        marks = ",".join("?" * len(run_ids))
+        with self._lock:
+            self._db.execute(
+                f"UPDATE runs SET heartbeat = ? WHERE worker = ? AND run_id IN ({marks})",
+                (time.time(), worker, *run_ids),
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                f"SELECT run_id FROM runs WHERE cancel = 1 AND run_id IN ({marks})", run_ids
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def expire_interrupted(self, ttl: float = RUN_RESUME_TTL) -> List[str]:
+        """把中断超过 ttl 秒仍未恢复的运行标记为 expired 并返回；多个进程同时清理时每个运行只返回一次"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT run_id FROM runs WHERE status = 'interrupted' AND updated < ?", (now - ttl,)
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE runs SET status = 'expired', updated = ? WHERE run_id = ?", [(now, row[0]) for row in rows]
+                )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return [row[0] for row in rows]
+
+    def requeue(self, run_id: str) -> None:
+        """把中断的运行重新排队，由执行进程从检查点继续"""
+        self._forget(run_id)
+        with self._lock:
+            self._db.execute(
+                "UPDATE runs SET status = 'queued', worker = NULL, cancel = 0, created = ?, updated = ? "
+                "WHERE run_id = ?",
+                (time.time(), time.time(), run_id),
+            )
+            self._db.commit()
+
+    def subscribe(self, run_id: str, delta: int) -> None:
+        """增减订阅数；最后一个订阅者离开时取消排队中的运行，并请求执行进程取消执行中的运行，
+        执行进程响应之前有订阅者重新连上时撤回取消请求"""
+        with self._lock:
+            self._db.execute("UPDATE runs SET subscribers = subscribers + ? WHERE run_id = ?", (delta, run_id))
+            if delta > 0:
+                self._db.execute(
+                    "UPDATE runs SET cancel = 0 WHERE run_id = ? AND subscribers > 0 AND status = 'running'",
+                    (run_id,),
+                )
+            else:
+                self._db.execute(
+                    "UPDATE runs SET status = 'interrupted', updated = ? "
+                    "WHERE run_id = ? AND subscribers <= 0 AND status = 'queued'",
+                    (time.time(), run_id),
+                )
+                self._db.execute(
+                    "UPDATE runs SET cancel = 1 WHERE run_id = ? AND subscribers <= 0 AND status = 'running'",
+                    (run_id,),
+                )
+            self._db.commit()
+
+    def find_active(self, coalesce_key: str, since: float) -> Optional[str]:
+        """since 之后创建、尚未结束且合并键相同的运行"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT run_id FROM runs WHERE coalesce_key = ? AND status IN ('queued', 'running') "
+                "AND created >= ? ORDER BY created DESC LIMIT 1",
+                (coalesce_key, since),
+            ).fetchone()
+        return row[0] if row else None
+
+    def queue_position(self, run_id: str) -> int:
+        """排在该运行之前的排队运行数"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM runs WHERE status = 'queued' AND created < "
+                "(SELECT created FROM runs WHERE run_id = ?)",
+                (run_id,),
+            ).fetchone()[0]
+
+    def count_active(self, client: Optional[str] = None) -> Tuple[int, int]:
+        """(排队数, 执行数)，指定 client 时只统计该客户端"""
+        query = "SELECT status, COUNT(*) FROM runs WHERE status IN ('queued', 'running')"
+        params: tuple = ()
+        if client is not None:
+            query += " AND client = ?"
+            params = (client,)
+        with self._lock:
+            counts = dict(self._db.execute(query + " GROUP BY status", params).fetchall())
+        return counts.get("queued", 0), counts.get("running", 0)
@@ -0,0 +1,289 @@
+"""图的执行：事件转换为 SSE 数据块、写入运行日志，以及检查点存储。
+
+API 进程（EXECUTION_MODE=inline）与独立执行进程（executor.py）共用这里的实现。
+"""
+import asyncio
+import logging
+import os
+from functools import lru_cache
+from typing import Callable, List, Optional
+from langchain_core.messages import HumanMessage
+import graph
+from graph import FINAL_ANSWER_EVENT, TEAM_KEY, WORKER_KEY, WORKER_STREAM_TAG, attach_checkpointer
+from artifacts import artifact_store
+from session import SESSION_KEY, end_session, suspend_session
+from sse import FrameBatcher, coalesce, encode_frame
+from runlog import CHECKPOINT_PATH, RUN_LOG_PATH, RUN_RESUME_TTL, RunLog
+from metrics import MetricsCallback, RunTrace
+from transport import start_retry_budget
+from logs import fields
+
+logger = logging.getLogger(__name__)
+
+# 是否把工作智能体的模型 token 与工具调用实时转发给前端（默认开启）
+STREAM_WORKER_EVENTS = os.environ.get("STREAM_WORKER_EVENTS", "1") == "1"
+
+# 清理中断超时运行的间隔（秒）
+RUN_SWEEP_INTERVAL = float(os.environ.get("RUN_SWEEP_INTERVAL", 300))
+
+# 每次运行的问题、状态与已发送事件，断线重连时据此补发；队列模式下同时充当运行队列
+run_log = RunLog(RUN_LOG_PATH)
+
+async def open_checkpointer():
+    """创建检查点存储并挂到当前事件循环的图上，返回需在退出时关闭的连接（须在事件循环内调用）"""
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    CHECKPOINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = await aiosqlite.connect(str(CHECKPOINT_PATH))
+    saver = AsyncSqliteSaver(conn)
+    await saver.setup()
+    attach_checkpointer(saver)
+    return conn
+
+# 工具节点状态映射字典
+TOOL_NODE_MAPPING = {
+    # 监督决策类
+    "supervisor": "分析",
+
+    # 信息检索类
+    "search": "搜索",
+    "web_scraper": "网页抓取",
+    
+    # 文档写作类
+    "doc_writer": "文档写作",
+    "note_taker": "笔记整理", 
+    "chart_generator": "图表生成",
+    
+    # 团队节点
+    "research_team": "调研团队",
+    "writing_team": "写作团队",
+
+    # 先规划后执行模式
+    "planner": "规划",
+    "executor": "执行计划",
+}
+
+# 图模式 -> graph 包中的图名称：supervisor 每一跳由监督者路由，plan 一次规划后按依赖并行执行
+GRAPH_MODES = {"supervisor": "super_graph", "plan": "planned_graph"}
+
+def graph_for(graph_mode: str):
+    """按图模式取顶层图，挂载当前事件循环的检查点存储"""
+    return graph.bound_graph(GRAPH_MODES.get(graph_mode, "super_graph"))
+
+def get_tool_status(event_type: str, node_name: str) -> dict:
+    """
+    根据事件类型和节点名称获取工具状态信息
+    
+    Args:
+        event_type: 事件类型 ('on_chain_stream', 'on_chain_end' 等)
+        node_name: 节点名称
+    
+    Returns:
+        dict: 包含状态信息的字典
+    """
+    # 获取节点中文名称
+    chinese_name = TOOL_NODE_MAPPING.get(node_name, '思考')
+    
+    # 根据事件类型确定状态
+    if event_type == 'on_chain_stream':
+        status = "streaming"
+        content = f"{chinese_name}中..."
+    elif event_type == 'on_chain_start':
+        status = "tool_start" 
+        content = f"开始{chinese_name}"
+    elif event_type == 'on_chain_end':
+        status = "tool_end"
+        content = f"完成{chinese_name}"
+    else:
+        status = "info"
+        content = f"{chinese_name}处理中"
+    
+    return {
+        "content": content,
+        "status": status,
+        "tool_name": node_name,
+        "chinese_name": chinese_name,
+        "is_final": False
+    }
+
+# 精简模式只订阅这些名称的事件：图节点的开始/结束与顶层最终回答的增量
+LEAN_EVENT_NAMES = [*TOOL_NODE_MAPPING, FINAL_ANSWER_EVENT]
+LEAN_STATUS_EVENTS = ("on_chain_start", "on_chain_end")
+# 带工作智能体标签的事件中只转发模型 token 与工具开始/结束；标签会传给智能体内部的全部子运行，
+# 提示词模板与输出解析器的事件在源头排除，内部链的事件在编码前按类型丢弃
+WORKER_EVENT_TYPES = frozenset(("on_chat_model_stream", "on_tool_start", "on_tool_end"))
+LEAN_EXCLUDE_TYPES = ["prompt", "parser"]
+
+@lru_cache(maxsize=None)
+def status_frame(event_type: str, node_name: str) -> str:
+    """状态帧只取决于事件类型和节点名称，编码一次后复用"""
+    tool_status = get_tool_status(event_type, node_name)
+    return encode_frame(tool_status["content"], tool_status["status"], tool_name=tool_status["chinese_name"])
+
+def _source(event: dict) -> dict:
+    metadata = event.get('metadata') or {}
+    return {"team": metadata.get(TEAM_KEY), "node": metadata.get(WORKER_KEY)}
+
+def worker_frame(event: dict, batcher: Optional[FrameBatcher] = None) -> Optional[str]:
+    """工作智能体内部的事件：模型 token 写入 batcher（未给出时直接返回整帧），工具开始/结束返回状态帧"""
+    event_type = event['event']
+    source = _source(event)
+    node_name = TOOL_NODE_MAPPING.get(source["node"], source["node"])
+    if event_type == 'on_chat_model_stream':
+        text = event['data']['chunk'].content
+        if not text or not isinstance(text, str):
+            return None
+        if batcher is None:
+            return encode_frame(text, "agent_delta", tool_name=node_name, source=source)
+        batcher.add_delta(text, "agent_delta", tool_name=node_name, source=source)
+    elif event_type == 'on_tool_start':
+        return encode_frame(f"调用工具 {event['name']}", "agent_tool_start", tool_name=node_name, source=source)
+    elif event_type == 'on_tool_end':
+        return encode_frame(f"工具 {event['name']} 完成", "agent_tool_end", tool_name=node_name, source=source)
+    return None
+
+def _handle_lean_event(event: dict, batcher: FrameBatcher) -> None:
+    event_type = event['event']
+    if WORKER_STREAM_TAG in event.get('tags', ()):
+        if event_type not in WORKER_EVENT_TYPES:
+            return
+        frame = worker_frame(event, batcher)
+        if frame:
+            batcher.add_status(frame)
+    elif event_type == 'on_custom_event':
+        if event['name'] == FINAL_ANSWER_EVENT:
+            batcher.add_delta(event['data']['delta'])
+    elif event_type in LEAN_STATUS_EVENTS:
+        batcher.add_status(status_frame(event_type, event['name']))
+
+async def lean_stream(inputs: dict, config: dict, app=None):
+    """在源头按节点名称（及工作智能体标签）过滤事件，状态与文本片段合并后按时间间隔/字节阈值批量发送。
+    名称与标签两个条件是“或”的关系，带标签的事件再按类型筛选"""
+    include_tags = [WORKER_STREAM_TAG] if STREAM_WORKER_EVENTS else None
+    events = (app or graph_for("supervisor")).astream_events(
+        inputs, version="v2", config=config, include_names=LEAN_EVENT_NAMES, include_tags=include_tags,
+        exclude_types=LEAN_EXCLUDE_TYPES,
+    )
+    async for chunk in coalesce(events, _handle_lean_event):
+        yield chunk
+
+async def verbose_stream(inputs: dict, config: dict, app=None):
+    """逐事件发送，便于调试"""
+    async for event in (app or graph_for("supervisor")).astream_events(inputs, version="v2", config=config):
+        event_type = event['event']
+        node_name = event.get('name', '')
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("事件", extra=fields(event=event_type, node=node_name))
+        
+        # 工作智能体内部：转发模型 token 与工具调用，其余内部链的事件不发送
+        if STREAM_WORKER_EVENTS and WORKER_STREAM_TAG in event.get('tags', ()):
+            frame = worker_frame(event)
+            if frame:
+                yield frame
+
+        # 顶层最终回答：仅转发增量 token
+        elif event_type == 'on_custom_event' and node_name == FINAL_ANSWER_EVENT:
+            yield encode_frame(event['data']['delta'], "streaming")
+
+        # 监督者自身的流式输出不再转发给前端
+        elif event_type == 'on_chain_stream' and node_name == 'supervisor':
+            continue
+        
+        # 处理其他节点的状态通知
+        elif event_type in ['on_chain_start', 'on_chain_stream', 'on_chain_end']:
+            # 获取工具状态信息
+            tool_status = get_tool_status(event_type, node_name)
+            
+            # 发送工具状态到前端
+            yield encode_frame(tool_status["content"], tool_status["status"], tool_name=tool_status["chinese_name"])
+
+async def resume_inputs(config: dict, question: str, app=None) -> Optional[dict]:
+    """已有检查点时从最后完成的节点继续（输入为 None），否则从头开始"""
+    app = app or graph_for("supervisor")
+    if app.checkpointer is not None:
+        snapshot = await app.aget_state(config)
+        if snapshot.values:
+            return None
+    return {"messages": [HumanMessage(content=question)]}
+
+async def execute_run(
+    run_id: str, question: str, stream_mode: str, publish: Callable[[str], None], graph_mode: str = "supervisor"
+) -> None:
+    """执行一次运行：每个数据块先写入事件日志，再以带 id 的形式交给 publish。
+
+    正常结束或出错时写入终态并释放会话资源；被取消时标记为 interrupted，保留检查点与持久化的会话内容以便恢复，
+    只丢弃本进程内存中的会话状态并回收代码执行进程，超过 RUN_RESUME_TTL 仍未恢复时由 sweep_interrupted_runs 释放。
+    终态在最后一帧写入日志之后才更新，读取日志的一方看到终态时事件已全部可见。
+    """
+    finished = False
+    trace = RunTrace()
+    # 本次运行内所有模型调用共用的重试预算（运行在独立任务中执行，不影响其他运行）
+    start_retry_budget()
+
+    def logged(chunk: str) -> None:
+        seq = run_log.append(run_id, chunk)
+        publish(f"id: {seq}\n{chunk}")
+
+    try:
+        # 运行 ID 同时作为会话 ID 与检查点 thread_id，恢复时沿用同一会话的文档
+        config = {
+            "recursion_limit": 150,
+            "configurable": {SESSION_KEY: run_id, "thread_id": run_id},
+            "callbacks": [MetricsCallback(trace, answer_event=FINAL_ANSWER_EVENT)],
+        }
+        app = graph_for(graph_mode)
+        inputs = await resume_inputs(config, question, app)
+        stream = verbose_stream if stream_mode == "verbose" else lean_stream
+
+        async for chunk in stream(inputs, config, app):
+            logged(chunk)
+
+        # 最终完成
+        finished = True
+        trace.finish("done")
+        summary = trace.summary()
+        # 大段工具输出存入存储与留在消息中的字节数，会话结束释放前读取
+        summary["artifacts"] = artifact_store.stats(run_id)
+        logger.info("运行完成", extra=fields(run_id=run_id, wall_ms=summary["wall_ms"], ttft_ms=summary["ttft_ms"],
+                                          tokens=summary["tokens"], cost=summary["cost"],
+                                          artifact_bytes=summary["artifacts"]["stored_bytes"],
+                                          inline_bytes=summary["artifacts"]["inline_bytes"]))
+        logged(encode_frame("", "success", is_final=True, trace=summary))
+        run_log.set_status(run_id, "done")
+
+    except Exception as e:
+        finished = True
+        trace.finish("error")
+        logger.exception("运行失败", extra=fields(run_id=run_id))
+        logged(encode_frame(f"错误: {str(e)}", "error", is_final=True))
+        run_log.set_status(run_id, "error")
+    finally:
+        if finished:
+            end_session(run_id)
+        else:
+            trace.finish("cancelled")
+            run_log.set_status(run_id, "interrupted")
+            suspend_session(run_id)
+
+async def expire_interrupted_runs(ttl: float = RUN_RESUME_TTL) -> List[str]:
+    """中断超过 ttl 秒仍未恢复的运行不再可恢复：释放会话资源并删除检查点，返回这些运行"""
+    expired = await asyncio.to_thread(run_log.expire_interrupted, ttl)
+    checkpointer = graph.current_checkpointer()
+    for run_id in expired:
+        end_session(run_id)
+        if checkpointer is not None:
+            await checkpointer.adelete_thread(run_id)
+    if expired:
+        logger.info("清理中断超时的运行", extra=fields(runs=len(expired)))
+    return expired
+
+async def sweep_interrupted_runs(interval: float = RUN_SWEEP_INTERVAL) -> None:
+    """后台定期清理中断超时的运行（内联执行的 API 进程与各执行进程中运行，直到被取消）"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await expire_interrupted_runs()
+        except Exception:
+            logger.exception("清理中断运行失败")
@@ -0,0 +1,164 @@
+"""在独立进程中执行 Python 代码的工作进程池。
+
+每个会话独占一个工作进程，解释器状态在会话内保留、会话间隔离；
+工作进程预先导入 numpy / matplotlib，超时或崩溃时直接杀掉并补充新进程。
+本模块只依赖标准库，供 spawn 出的子进程导入。
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows 无 resource 模块，不做内存限制
+    resource = None
+
+# 进程池配置：预热进程数、单次执行超时（秒）、单进程内存上限（MB，0 表示不限）
+REPL_POOL_SIZE = int(os.environ.get("REPL_POOL_SIZE", 2))
+REPL_TIMEOUT = float(os.environ.get("REPL_TIMEOUT", 30))
+REPL_MEMORY_MB = int(os.environ.get("REPL_MEMORY_MB", 2048))
+# 等待新进程完成预热导入的最长时间（秒）
+REPL_STARTUP_TIMEOUT = 60
+
+PREWARM_MODULES = ["numpy", "matplotlib", "matplotlib.pyplot"]
+
+_context = multiprocessing.get_context("spawn")
+
+def _worker_main(conn, memory_mb: int) -> None:
+    """子进程入口：预热导入后循环执行收到的代码，返回标准输出"""
+    if memory_mb and resource is not None:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    for name in PREWARM_MODULES:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+    namespace = {"__name__": "__main__"}
+    conn.send("ready")
+    while True:
+        try:
+            code = conn.recv()
+        except EOFError:
+            break
+        if code is None:
+            break
+        buffer = io.StringIO()
+        try:
+            with redirect_stdout(buffer), redirect_stderr(buffer):
+                exec(code, namespace)
+            output = buffer.getvalue()
+        except BaseException as e:
+            # 与 PythonREPL.run 一致：代码异常作为输出返回
+            output = repr(e)
+        try:
+            conn.send(output)
+        except Exception:
+            conn.send(traceback.format_exc())
+
+class _Worker:
+    def __init__(self, memory_mb: int):
+        self.conn, child_conn = _context.Pipe()
+        self.process = _context.Process(target=_worker_main, args=(child_conn, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def call(self, code: str, timeout: float) -> str:
+        """在子进程中执行代码；超时或进程退出时抛出异常"""
+        with self.lock:
+            if not self.ready:
+                if not self.conn.poll(REPL_STARTUP_TIMEOUT):
+                    raise TimeoutError("工作进程启动超时")
+                self.conn.recv()
+                self.ready = True
+            self.conn.send(code)
+            if not self.conn.poll(timeout):
+                raise TimeoutError(f"执行超过 {timeout:g} 秒")
+            return self.conn.recv()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+class ReplPool:
+    """会话粘滞的 Python 执行进程池"""
+
+    def __init__(self, size: int = REPL_POOL_SIZE, timeout: float = REPL_TIMEOUT, memory_mb: int = REPL_MEMORY_MB):
+        self.size = size
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self._idle: List[_Worker] = []
+        self._sessions: Dict[str, _Worker] = {}
+        self._lock = threading.Lock()
+
+    def warm(self) -> None:
+        """补足空闲进程，使新会话无需等待进程启动与导入"""
+        with self._lock:
+            missing = self.size - len(self._idle)
+        for _ in range(max(0, missing)):
+            worker = _Worker(self.memory_mb)
+            with self._lock:
+                self._idle.append(worker)
+
+    def _refill(self) -> None:
+        threading.Thread(target=self.warm, daemon=True).start()
+
+    def _acquire(self, session_id: str) -> _Worker:
+        with self._lock:
+            worker = self._sessions.get(session_id)
+            if worker is None:
+                worker = self._idle.pop(0) if self._idle else None
+                if worker is not None:
+                    self._sessions[session_id] = worker
+        if worker is None:
+            worker = _Worker(self.memory_mb)
+            with self._lock:
+                self._sessions[session_id] = worker
+        self._refill()
+        return worker
+
+    def _discard(self, session_id: str, worker: _Worker) -> None:
+        with self._lock:
+            if self._sessions.get(session_id) is worker:
+                del self._sessions[session_id]
+        worker.kill()
+
+    def run_sync(self, session_id: str, code: str) -> str:
+        worker = self._acquire(session_id)
+        try:
+            return worker.call(code, self.timeout)
+        except (TimeoutError, EOFError, OSError):
+            # 超时或进程崩溃（如超出内存上限）：杀掉进程，会话状态随之丢弃
+            self._discard(session_id, worker)
+            raise
+
+    async def run(self, session_id: str, code: str) -> str:
+        """在线程中等待子进程结果，不阻塞事件循环"""
+        return await asyncio.to_thread(self.run_sync, session_id, code)
+
+    def release(self, session_id: str) -> None:
+        """会话结束：销毁其工作进程"""
+        with self._lock:
+            worker = self._sessions.pop(session_id, None)
+        if worker is not None:
+            worker.kill()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers = self._idle + list(self._sessions.values())
+            self._idle, self._sessions = [], {}
+        for worker in workers:
+            worker.kill()
+
+repl_pool = ReplPool()
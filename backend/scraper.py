@@ -0,0 +1,243 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from bs4 import BeautifulSoup
+
+from cache import CACHE_DIRECTORY
+
+# 抓取配置：全局/单站点并发、超时（秒）、单个响应最大字节数、单篇正文最大字符数
+SCRAPE_MAX_CONNECTIONS = int(os.environ.get("SCRAPE_MAX_CONNECTIONS", 16))
+SCRAPE_PER_HOST = int(os.environ.get("SCRAPE_PER_HOST", 2))
+SCRAPE_TIMEOUT = float(os.environ.get("SCRAPE_TIMEOUT", 10))
+# 单个页面下载的总耗时上限（秒）；SCRAPE_TIMEOUT 只限制单次读写，持续慢速回传的站点需要靠它中止
+SCRAPE_TOTAL_TIMEOUT = float(os.environ.get("SCRAPE_TOTAL_TIMEOUT", 30))
+SCRAPE_MAX_BYTES = int(os.environ.get("SCRAPE_MAX_BYTES", 2 * 1024 * 1024))
+SCRAPE_MAX_CHARS = int(os.environ.get("SCRAPE_MAX_CHARS", 20000))
+# 推测预取的页面在该时间（秒）内可被正式抓取直接复用
+SCRAPE_PREFETCH_TTL = float(os.environ.get("SCRAPE_PREFETCH_TTL", 60))
+# 网页缓存路径，设为空字符串则不缓存
+SCRAPE_CACHE_PATH = os.environ.get("SCRAPE_CACHE_PATH", str(CACHE_DIRECTORY / "pages.sqlite"))
+
+# 正文之外的模板元素
+_BOILERPLATE_TAGS = ["script", "style", "noscript", "nav", "header", "footer", "aside", "form", "iframe", "svg"]
+
+@dataclass
+class Page:
+    url: str
+    title: str = ""
+    text: str = ""
+    error: Optional[str] = None
+    from_cache: bool = False
+
+def extract_text(html: str) -> tuple[str, str]:
+    """去除导航、脚本等模板元素，返回 (标题, 正文)"""
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    for tag in soup(_BOILERPLATE_TAGS):
+        tag.decompose()
+    root = soup.find("article") or soup.find("main") or soup.body or soup
+    text = root.get_text("\n", strip=True)
+    return title, re.sub(r"\n{3,}", "\n\n", text)
+
+class PageCache:
+    """按 URL 存储已抽取的正文及 ETag / Last-Modified，用于条件请求再验证"""
+
+    def __init__(self, db_path: Path):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages "
+            "(url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, title TEXT, text TEXT, fetched REAL)"
+        )
+        self._db.commit()
+
+    def get(self, url: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, title, text FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "title": row[2], "text": row[3]}
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], title: str, text: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, title, text, time.time()),
+            )
+            self._db.commit()
+
+class ScrapeEngine:
+    """异步抓取引擎：复用连接池，限制全局与单站点并发，限制超时与响应大小。
+
+    客户端与信号量绑定到创建它们的事件循环，换循环时自动重建。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = SCRAPE_MAX_CONNECTIONS,
+        per_host: int = SCRAPE_PER_HOST,
+        timeout: float = SCRAPE_TIMEOUT,
+        total_timeout: float = SCRAPE_TOTAL_TIMEOUT,
+        max_bytes: int = SCRAPE_MAX_BYTES,
+        cache: Optional[PageCache] = None,
+    ):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = timeout
+        self.total_timeout = total_timeout
+        self.max_bytes = max_bytes
+        self.cache = cache
+        self._loop = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        # 推测预取中或已完成的抓取：URL -> (开始时间, 任务, 被取走时的回调)，正式抓取时取走复用
+        self._prefetched: Dict[str, Tuple[float, asyncio.Task, Optional[Callable[[], None]]]] = {}
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                headers={"User-Agent": os.environ.get("USER_AGENT", "Mozilla/5.0 (compatible; agent-scraper)")},
+            )
+            self._global = asyncio.Semaphore(self.max_connections)
+            self._hosts = {}
+        return self._client
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    async def fetch(self, url: str) -> Page:
+        task = self._take_prefetched(url)
+        if task is not None:
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # 只有预取本身被取消时才自行抓取，调用方被取消时照常抛出
+                if not task.cancelled():
+                    raise
+        return await self._fetch(url)
+
+    def _take_prefetched(self, url: str) -> Optional[asyncio.Task]:
+        entry = self._prefetched.pop(url, None)
+        if entry is None:
+            return None
+        started, task, on_used = entry
+        if task.get_loop() is not asyncio.get_running_loop() or time.monotonic() - started > SCRAPE_PREFETCH_TTL:
+            return None
+        if on_used is not None:
+            on_used()
+        return task
+
+    async def prefetch(self, urls: List[str], on_used: Optional[Callable[[], None]] = None) -> None:
+        """推测预取：提前抓取页面，随后的 fetch 直接复用结果；被取消时取消尚未被取走的抓取。
+
+        on_used 在正式抓取取走本次预取的页面时调用。
+        """
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        for url, (started, _, _) in list(self._prefetched.items()):
+            if now - started > SCRAPE_PREFETCH_TTL:
+                del self._prefetched[url]
+        owned = {}
+        for url in urls:
+            if url not in self._prefetched:
+                owned[url] = loop.create_task(self._fetch(url))
+                self._prefetched[url] = (now, owned[url], on_used)
+        try:
+            # wait 被取消时不会取消各抓取任务，已被 fetch 取走的抓取不受影响
+            if owned:
+                await asyncio.wait(owned.values())
+        except asyncio.CancelledError:
+            for url, task in owned.items():
+                entry = self._prefetched.get(url)
+                if entry is not None and entry[1] is task:
+                    del self._prefetched[url]
+                    task.cancel()
+            raise
+
+    async def _fetch(self, url: str) -> Page:
+        client = self._ensure_client()
+        # SQLite 读写放到线程中执行，避免阻塞事件循环
+        cached = await asyncio.to_thread(self.cache.get, url) if self.cache else None
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            # 先占用站点名额再占全局名额，避免慢站点排队时占满全局并发
+            async with self._host_semaphore(url), self._global:
+                # 总耗时从拿到名额后开始计算，排队时间不计入
+                download = await asyncio.wait_for(
+                    self._download(client, url, headers, cached is not None), self.total_timeout
+                )
+        except Exception as e:
+            if cached:
+                # 站点不可用时退回到缓存内容
+                return Page(url, cached["title"], cached["text"], from_cache=True)
+            if isinstance(e, asyncio.TimeoutError):
+                return Page(url, error=f"TimeoutError: 下载超过 {self.total_timeout:g} 秒")
+            return Page(url, error=f"{type(e).__name__}: {e}")
+        if download is None:
+            return Page(url, cached["title"], cached["text"], from_cache=True)
+
+        body, encoding, etag, last_modified = download
+        html = body.decode(encoding, errors="replace")
+        # 解析较耗 CPU，放到线程中执行，避免阻塞事件循环
+        title, text = await asyncio.to_thread(extract_text, html)
+        if self.cache and (etag or last_modified):
+            await asyncio.to_thread(self.cache.put, url, etag, last_modified, title, text)
+        return Page(url, title, text)
+
+    async def _download(
+        self, client: httpx.AsyncClient, url: str, headers: dict, revalidate: bool
+    ) -> Optional[Tuple[bytearray, str, Optional[str], Optional[str]]]:
+        """下载响应体，返回 (正文字节, 编码, ETag, Last-Modified)；缓存仍有效（304）时返回 None"""
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and revalidate:
+                return None
+            response.raise_for_status()
+            body = bytearray()
+            async for data in response.aiter_bytes():
+                body.extend(data)
+                # 超过上限时只保留前 max_bytes 字节
+                if len(body) >= self.max_bytes:
+                    del body[self.max_bytes:]
+                    break
+            return (
+                body,
+                response.encoding or "utf-8",
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+
+    async def fetch_all(self, urls: List[str]) -> List[Page]:
+        """并发抓取，结果顺序与输入一致；单个站点失败或超时不影响其他页面"""
+        return await asyncio.gather(*[self.fetch(url) for url in urls])
+
+scrape_engine = ScrapeEngine(cache=PageCache(Path(SCRAPE_CACHE_PATH)) if SCRAPE_CACHE_PATH else None)
@@ -0,0 +1,45 @@
+import logging
+import uuid
+from typing import Callable, List, Optional
+
+# 单次运行的会话 ID 存放在 config["configurable"] 中，工具通过注入的 config 读取
+SESSION_KEY = "session_id"
+DEFAULT_SESSION = "default"
+
+logger = logging.getLogger(__name__)
+
+_end_hooks: List[Callable[[str], None]] = []
+_suspend_hooks: List[Callable[[str], None]] = []
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+def get_session_id(config: Optional[dict]) -> str:
+    """从 RunnableConfig 中取会话 ID，未设置时返回默认会话"""
+    configurable = (config or {}).get("configurable") or {}
+    return configurable.get(SESSION_KEY) or DEFAULT_SESSION
+
+def on_session_end(hook: Callable[[str], None]) -> Callable[[str], None]:
+    """注册会话结束时的清理函数"""
+    _end_hooks.append(hook)
+    return hook
+
+def on_session_suspend(hook: Callable[[str], None]) -> Callable[[str], None]:
+    """注册会话中断时的清理函数：只丢弃本进程内存中的状态，持久化的内容保留以便恢复"""
+    _suspend_hooks.append(hook)
+    return hook
+
+def _run_hooks(hooks: List[Callable[[str], None]], session_id: str) -> None:
+    for hook in hooks:
+        try:
+            hook(session_id)
+        except Exception as e:
+            logger.warning("会话 %s 清理失败: %s", session_id, e)
+
+def end_session(session_id: str) -> None:
+    """运行结束时调用，释放该会话占用的资源"""
+    _run_hooks(_end_hooks, session_id)
+
+def suspend_session(session_id: str) -> None:
+    """运行被中断时调用；运行可能由其他进程恢复，本进程内存中的状态不再保留"""
+    _run_hooks(_suspend_hooks, session_id)
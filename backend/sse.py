@@ -0,0 +1,157 @@
+import asyncio
+import json
+from json.encoder import encode_basestring
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+# 批量发送：距上次发送超过该间隔（秒）或待发送字节数超过阈值时合并成一次写出
+SSE_FLUSH_INTERVAL = 0.05
+SSE_FLUSH_BYTES = 4096
+
+# 与 StreamResponse.model_dump() 的字段顺序一致，前端解析方式不变
+_PREFIX = 'data: {"content": '
+_NULL = "null"
+
+def encode_frame(
+    content: str,
+    status: str,
+    is_final: bool = False,
+    tool_name: Optional[str] = None,
+    trace: Optional[dict] = None,
+    source: Optional[dict] = None,
+) -> str:
+    """不经过 Pydantic 直接拼接一帧 SSE 数据；trace 只出现在 success 帧末尾，source 标明工作智能体所属的团队与节点"""
+    extra = f', "source": {json.dumps(source, ensure_ascii=False)}' if source is not None else ""
+    if trace is not None:
+        extra += f', "trace": {json.dumps(trace, ensure_ascii=False)}'
+    return (
+        f'{_PREFIX}{encode_basestring(content)}, "status": "{status}", '
+        f'"is_final": {"true" if is_final else "false"}, '
+        f'"tool_name": {encode_basestring(tool_name) if tool_name is not None else _NULL}{extra}}}\n\n'
+    )
+
+class FrameBatcher:
+    """合并待发送的帧：同一来源相邻的文本片段拼接为一帧，相邻的状态只保留最新一条"""
+
+    def __init__(self):
+        # (类型, 内容或整帧, 片段的帧参数)；类型为 "delta" 或 "status"
+        self._pending: List[Tuple[str, object, Optional[tuple]]] = []
+        self.size = 0
+
+    def add_delta(
+        self, text: str, status: str = "streaming", tool_name: Optional[str] = None, source: Optional[dict] = None
+    ) -> None:
+        """status 默认 streaming 即最终回答；工作智能体的输出带 tool_name 与 source，前端不会并入回答"""
+        key = (status, tool_name, source)
+        if self._pending and self._pending[-1][0] == "delta" and self._pending[-1][2] == key:
+            self._pending[-1][1].append(text)
+        else:
+            self._pending.append(("delta", [text], key))
+        self.size += len(text)
+
+    def add_status(self, frame: str) -> None:
+        if self._pending and self._pending[-1][0] == "status":
+            self.size -= len(self._pending[-1][1])
+            self._pending[-1] = ("status", frame, None)
+        else:
+            self._pending.append(("status", frame, None))
+        self.size += len(frame)
+
+    def drain(self) -> str:
+        parts = []
+        for kind, value, key in self._pending:
+            if kind == "delta":
+                status, tool_name, source = key
+                parts.append(encode_frame("".join(value), status, tool_name=tool_name, source=source))
+            else:
+                parts.append(value)
+        self._pending = []
+        self.size = 0
+        return "".join(parts)
+
+async def coalesce(
+    events: AsyncIterator,
+    handle: Callable[[object, FrameBatcher], None],
+    interval: float = SSE_FLUSH_INTERVAL,
+    max_bytes: int = SSE_FLUSH_BYTES,
+) -> AsyncIterator[str]:
+    """消费事件流，由 handle 把事件写入 FrameBatcher，按时间间隔或字节阈值输出合并后的数据块。
+
+    事件在独立任务中读取，等待发送时机不会取消上游迭代器。
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def produce():
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    batcher = FrameBatcher()
+    loop = asyncio.get_running_loop()
+    deadline = None
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield batcher.drain()
+                deadline = None
+                continue
+            if event is done:
+                break
+            if isinstance(event, Exception):
+                if batcher.size:
+                    yield batcher.drain()
+                raise event
+            handle(event, batcher)
+            if batcher.size >= max_bytes:
+                yield batcher.drain()
+                deadline = None
+            elif batcher.size and deadline is None:
+                deadline = loop.time() + interval
+        if batcher.size:
+            yield batcher.drain()
+    finally:
+        producer.cancel()
+
+class Broadcast:
+    """单生产者、多订阅者的只追加广播。
+
+    每个订阅者持有自己的读取位置，慢客户端只会落后于自身，不会阻塞生产者或其他订阅者；
+    从位置 0 订阅即可先收到已发布的全部内容再继续实时接收。
+    """
+
+    def __init__(self):
+        self.items: list = []
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def publish(self, item) -> None:
+        self.items.append(item)
+        self._notify()
+
+    def close(self) -> None:
+        self.closed = True
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self, start: int = 0) -> AsyncIterator:
+        cursor = start
+        while True:
+            if cursor < len(self.items):
+                item = self.items[cursor]
+                cursor += 1
+                yield item
+            elif self.closed:
+                return
+            else:
+                await self._changed.wait()
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 后端模块按顶层模块导入（与在 backend 目录下运行应用一致）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# 导入图时会校验的环境变量给出占位值；运行数据写入临时目录，不访问外部服务
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+os.environ.setdefault("DEEPSEEK_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+os.environ.setdefault("RUN_DATA_DIR", tempfile.mkdtemp(prefix="test-runs-"))
+os.environ.setdefault("SEARCH_CACHE_PATH", "")
+os.environ.setdefault("SCRAPE_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE_PATH", "")
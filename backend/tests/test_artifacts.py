@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from artifacts import ARTIFACT_INLINE_CHARS, ArtifactStore, content_id
+
+
+def big(text="x"):
+    return text * (ARTIFACT_INLINE_CHARS + 1)
+
+
+def test_short_output_stays_inline(tmp_path):
+    store = ArtifactStore(tmp_path)
+    assert store.offload("s1", "short") == "short"
+    assert store.stats("s1")["artifacts"] == 0
+
+
+def test_long_output_is_replaced_by_handle(tmp_path):
+    store = ArtifactStore(tmp_path)
+    text = big()
+    handle = store.offload("s1", text)
+
+    assert f'id="{content_id(text)}"' in handle
+    assert len(handle) < len(text)
+    assert store.get("s1", content_id(text)) == text
+    assert store.expand("s1", f"before {handle} after", budget=len(text)) == f"before {text} after"
+
+
+def test_content_is_persisted_for_other_processes(tmp_path):
+    text = big()
+    artifact_id = ArtifactStore(tmp_path).put("s1", text)
+
+    # 另一个进程中的存储实例（内存为空）从共享目录读取
+    assert ArtifactStore(tmp_path, memory_bytes=0).get("s1", artifact_id) == text
+
+
+def test_lookup_is_scoped_to_session(tmp_path):
+    store = ArtifactStore(tmp_path)
+    artifact_id = store.put("s1", big())
+
+    assert store.get("s2", artifact_id) is None
+    handle = store.offload("s1", big())
+    assert store.expand("s2", handle) == handle
+
+
+def test_release_keeps_content_shared_with_other_sessions(tmp_path):
+    store = ArtifactStore(tmp_path)
+    shared, own = big("a"), big("b")
+    shared_id = store.put("s1", shared)
+    store.put("s2", shared)
+    own_id = store.put("s1", own)
+
+    store.release("s1")
+    assert store.get("s1", shared_id) is None
+    assert store.get("s2", shared_id) == shared
+    assert not (tmp_path / own_id[:2] / own_id).exists()
+
+    store.release("s2")
+    assert not (tmp_path / shared_id[:2] / shared_id).exists()
+
+
+def test_memory_cache_is_bounded(tmp_path):
+    store = ArtifactStore(tmp_path, memory_bytes=ARTIFACT_INLINE_CHARS * 2)
+    ids = [store.put("s1", big(c)) for c in "abc"]
+
+    assert store._in_memory <= ARTIFACT_INLINE_CHARS * 2 + 2
+    assert [store.get("s1", artifact_id)[0] for artifact_id in ids] == list("abc")
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from cache import MISSING, TTLCache
+
+
+def make_cache(tmp_path=None):
+    return TTLCache("test", ttl=60, db_path=tmp_path / "cache.sqlite" if tmp_path else None)
+
+
+def test_concurrent_callers_share_one_computation():
+    cache = make_cache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"value": 1}
+
+    async def main():
+        return await asyncio.gather(*(cache.aget_or_compute("k", compute) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert results == [{"value": 1}] * 5
+    assert calls == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_owner_cancellation_does_not_fail_waiters():
+    cache = make_cache()
+    release = None
+
+    async def compute():
+        await release.wait()
+        return "done"
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        owner = asyncio.create_task(cache.aget_or_compute("k", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.aget_or_compute("k", compute))
+        await asyncio.sleep(0)
+        owner.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await waiter
+
+    assert asyncio.run(main()) == "done"
+    # 发起者被取消后计算仍完成并写入缓存
+    assert cache.get("k") == "done"
+
+
+def test_cancelled_sole_caller_still_fills_cache():
+    cache = make_cache()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        return "late"
+
+    async def main():
+        task = asyncio.create_task(cache.aget_or_compute("k", compute))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert cache.get("k") == "late"
+
+
+def test_failure_reaches_every_waiter_and_can_be_retried():
+    cache = make_cache()
+    attempts = 0
+
+    async def compute():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0.01)
+        if attempts == 1:
+            raise RuntimeError("boom")
+        return "ok"
+
+    async def main():
+        results = await asyncio.gather(
+            *(cache.aget_or_compute("k", compute) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        return await cache.aget_or_compute("k", compute)
+
+    assert asyncio.run(main()) == "ok"
+    assert attempts == 2
+
+
+def test_uncacheable_results_are_not_stored():
+    cache = make_cache()
+
+    async def compute():
+        return {"error": "rate limited"}
+
+    asyncio.run(cache.aget_or_compute("k", compute, lambda value: "error" not in value))
+    assert cache.get("k") is MISSING
+
+
+def test_disk_layer_survives_new_instance(tmp_path):
+    make_cache(tmp_path).set("k", [1, 2])
+    assert make_cache(tmp_path).get("k") == [1, 2]
+
+
+def test_async_paths_read_and_write_the_disk_layer(tmp_path):
+    async def compute():
+        return {"value": 1}
+
+    asyncio.run(make_cache(tmp_path).aget_or_compute("k", compute))
+    fresh = make_cache(tmp_path)
+    assert asyncio.run(fresh.aget("k")) == {"value": 1}
+    assert fresh.stats()["disk_hits"] == 1
+
+
+def test_expired_rows_are_pruned_at_most_once_per_interval(tmp_path, monkeypatch):
+    cache = TTLCache("test", ttl=-1, db_path=tmp_path / "cache.sqlite")
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # 第一次写入时已清理过一次，间隔内的写入不再扫描过期条目
+    assert cache._db.execute('SELECT COUNT(*) FROM "test"').fetchone()[0] == 1
+
+    monkeypatch.setattr(cache, "_last_prune", 0.0)
+    cache.set("c", 3)
+    assert cache._db.execute('SELECT COUNT(*) FROM "test"').fetchone()[0] == 0
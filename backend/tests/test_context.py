@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from utils.context import ContextPolicy, build_context, message_tokens
+
+
+class FakeSummarizer:
+    """记录调用次数，返回固定摘要"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        return SimpleNamespace(content=" 要点 ")
+
+
+def build(history, policy, llm=None):
+    return asyncio.run(build_context(history, policy, llm))
+
+
+def test_without_policy_history_is_unchanged():
+    history = [HumanMessage(content="问题"), AIMessage(content="回答")]
+    assert build(history, None) == history
+
+
+def test_older_outputs_are_truncated_and_recent_ones_kept():
+    question = HumanMessage(content="问题")
+    old = HumanMessage(content="a" * 50, name="search")
+    recent = HumanMessage(content="b" * 50, name="web_scraper")
+    policy = ContextPolicy(max_tokens=10_000, keep_recent=1, digest_chars=10)
+
+    context = build([question, old, recent], policy)
+    assert context[0] is question
+    assert context[1].content.startswith("a" * 10 + "\n…[已截断")
+    assert context[2] is recent
+
+
+def test_over_budget_drops_earliest_messages_but_keeps_question():
+    question = HumanMessage(content="问题")
+    history = [question] + [AIMessage(content=str(i) * 40) for i in range(5)]
+    policy = ContextPolicy(max_tokens=message_tokens(question) + 2 * message_tokens(history[1]), keep_recent=5)
+
+    context = build(history, policy)
+    assert context == [question, history[4], history[5]]
+
+
+def test_window_never_starts_with_orphan_tool_result():
+    question = HumanMessage(content="问题")
+    call = AIMessage(content="x" * 400)
+    result = ToolMessage(content="结果", tool_call_id="1")
+    last = AIMessage(content="结论")
+    budget = message_tokens(question) + message_tokens(result) + message_tokens(last)
+
+    context = build([question, call, result, last], ContextPolicy(max_tokens=budget, keep_recent=3))
+    assert context == [question, last]
+
+
+def test_summaries_are_cached_by_content():
+    llm = FakeSummarizer()
+    policy = ContextPolicy(keep_recent=0, digest_chars=10, summarize=True)
+    history = [HumanMessage(content="问题"), HumanMessage(content="摘要缓存测试" * 10, name="search")]
+
+    first = build(history, policy, llm)
+    second = build(history, policy, llm)
+    assert first[1].content == second[1].content == "[摘要] 要点"
+    assert llm.calls == 1
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from documents import DocumentStore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_ranged_read_returns_only_requested_lines(tmp_path):
+    store = DocumentStore(tmp_path)
+    run(store.write("s", "doc.txt", "一\n二\n三\n四"))
+
+    assert run(store.read("s", "doc.txt", 1, 3)) == ["二\n", "三\n"]
+    assert run(store.read("s", "doc.txt", -1)) == ["四"]
+    assert run(store.read("s", "doc.txt", 5)) == []
+
+
+def test_inserts_match_line_list_semantics(tmp_path):
+    store = DocumentStore(tmp_path)
+    run(store.write("s", "doc.txt", "a\nb\nc\n"))
+    lines = ["a\n", "b\n", "c\n"]
+    inserts = {2: "x", 4: "y", 6: "z"}
+    for line_number, text in sorted(inserts.items()):
+        lines.insert(line_number - 1, text + "\n")
+
+    assert run(store.insert("s", "doc.txt", inserts)) is None
+    assert run(store.read("s", "doc.txt")) == lines
+    assert (tmp_path / "s" / "doc.txt").read_text() == "".join(lines)
+
+
+def test_out_of_range_insert_leaves_document_unchanged(tmp_path):
+    store = DocumentStore(tmp_path)
+    run(store.write("s", "doc.txt", "a\n"))
+
+    assert run(store.insert("s", "doc.txt", {2: "b", 9: "c"})) == 9
+    assert (tmp_path / "s" / "doc.txt").read_text() == "a\n"
+
+
+def test_index_is_rebuilt_after_suspend(tmp_path):
+    store = DocumentStore(tmp_path)
+    run(store.write("s", "doc.txt", "标题\n"))
+    run(store.insert("s", "doc.txt", {2: "正文"}))
+    store.suspend("s")
+
+    assert run(DocumentStore(tmp_path).read("s", "doc.txt")) == ["标题\n", "正文\n"]
+    assert run(store.read("s", "doc.txt", 1)) == ["正文\n"]
+
+
+def test_sessions_are_isolated_and_released(tmp_path):
+    store = DocumentStore(tmp_path)
+    run(store.write("a", "../doc.txt", "A"))
+    run(store.write("b", "doc.txt", "B"))
+    store.release("a")
+
+    with pytest.raises(FileNotFoundError):
+        run(store.read("a", "doc.txt"))
+    assert run(store.read("b", "doc.txt")) == ["B"]
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from cache import TTLCache
+from llm import CachedChatModel, without_cache
+
+
+def cached_model(*replies):
+    # 假模型每次调用消耗一条回复，命中缓存时不会再调用它
+    inner = GenericFakeChatModel(messages=iter([AIMessage(content=reply) for reply in replies]))
+    return CachedChatModel(model=inner, response_cache=TTLCache("test", ttl=60)), inner
+
+
+def test_ainvoke_result_is_served_from_cache():
+    model, _ = cached_model("你好 世界")
+    messages = [HumanMessage(content="问候")]
+
+    async def main():
+        return [await model.ainvoke(messages) for _ in range(2)]
+
+    first, second = asyncio.run(main())
+    assert first.content == second.content == "你好 世界"
+    assert model.response_cache.stats()["hits"] == 1
+
+
+def test_astream_replays_cached_chunks():
+    model, _ = cached_model("你好 世界")
+    messages = [HumanMessage(content="问候")]
+
+    async def collect():
+        return [chunk.content async for chunk in model.astream(messages)]
+
+    async def main():
+        return await collect(), await collect()
+
+    first, second = asyncio.run(main())
+    assert "".join(first) == "你好 世界"
+    assert second == first
+    assert model.response_cache.stats()["hits"] == 1
+
+
+def test_without_cache_calls_the_model_again():
+    model, _ = cached_model("一", "二")
+    messages = [HumanMessage(content="问候")]
+    fresh = without_cache(model)
+
+    async def main():
+        return [(await fresh.ainvoke(messages)).content for _ in range(2)]
+
+    assert asyncio.run(main()) == ["一", "二"]
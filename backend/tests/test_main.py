@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("langgraph")
+
+from main import QuestionRequest, api_app
+
+
+def post_chat(body):
+    async def main():
+        transport = httpx.ASGITransport(app=api_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/chat", json=body)
+
+    return asyncio.run(main())
+
+
+def test_new_run_requires_a_question():
+    for body in ({}, {"question": "  "}):
+        assert post_chat(body).status_code == 422
+
+
+def test_reconnect_may_omit_the_question():
+    assert QuestionRequest(run_id="abc").question == ""
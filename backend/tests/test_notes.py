@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip("langgraph")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from graph.notes import _build_answer_prompt
+
+
+def test_answer_prompt_contains_the_user_question():
+    history = [
+        HumanMessage(content="检索结果", name="search"),
+        HumanMessage(content="什么是检索增强生成？"),
+        AIMessage(content="回答"),
+    ]
+    assert "用户原始问题：什么是检索增强生成？" in _build_answer_prompt(history, "s")
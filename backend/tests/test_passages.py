@@ -0,0 +1,44 @@
+from passages import PassageIndex, PassageStore, split_passages
+
+
+def test_split_passages_merges_short_lines_and_cuts_long_ones():
+    text = "a" * 10 + "\n" + "b" * 10 + "\n\n" + "c" * 25
+    assert split_passages(text, size=22) == ["a" * 10 + "\n" + "b" * 10, "c" * 22, "c" * 3]
+
+
+def test_search_ranks_matching_passages_first():
+    index = PassageIndex()
+    index.add("https://a", "A", "transformer attention mechanism")
+    index.add("https://b", "B", "gardening tips for spring")
+
+    hits = index.search("attention", k=2)
+    assert hits[0][0].id == "S1.1"
+    assert all(passage.source_id != "S2" for passage, _ in hits)
+
+
+def test_same_url_is_indexed_once():
+    index = PassageIndex()
+    assert index.add("https://a", "A", "one") == ("S1", 1)
+    assert index.add("https://a", "A", "one") == ("S1", 1)
+    assert len(index.passages) == 1
+
+
+def test_index_is_rebuilt_in_another_process(tmp_path):
+    path = tmp_path / "passages.sqlite"
+    PassageStore(path).index("run").add("https://a", "A", "检索增强生成")
+
+    restored = PassageStore(path).index("run")
+    assert restored.sources == {"https://a": "S1"}
+    assert restored.search("检索")[0][0].id == "S1.1"
+    assert restored.add("https://b", "B", "other") == ("S2", 1)
+
+
+def test_release_drops_persisted_sources(tmp_path):
+    path = tmp_path / "passages.sqlite"
+    store = PassageStore(path)
+    store.index("run").add("https://a", "A", "text")
+    store.index("other").add("https://a", "A", "text")
+
+    store.release("run")
+    assert PassageStore(path).index("run").passages == []
+    assert PassageStore(path).index("other").sources == {"https://a": "S1"}
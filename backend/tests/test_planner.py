@@ -0,0 +1,150 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from langchain_core.messages import HumanMessage
+
+from graph import planner
+from graph.planner import PlanError, executor_node, planner_node, validate_plan
+
+
+class FakePlanner:
+    """按顺序返回预设的规划结果，并记录收到的消息"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def with_config(self, **kwargs):
+        return self
+
+    async def astream(self, messages):
+        self.calls.append(messages)
+        yield SimpleNamespace(content=self.responses.pop(0))
+
+
+def step(step_id, worker="search", depends_on=()):
+    return {"id": step_id, "worker": worker, "task": step_id, "depends_on": list(depends_on)}
+
+
+def result(ok=True, output="out"):
+    return {"worker": "search", "task": "t", "output": output if ok else "", "ok": ok}
+
+
+def test_validate_plan_allows_dependencies_on_completed_steps():
+    steps = [step("s1", depends_on=["old"])]
+    assert validate_plan(steps) is None
+    assert validate_plan(steps, frozenset({"old"}))[0]["depends_on"] == ["old"]
+
+
+def test_validate_plan_rejects_cycles_and_empty_first_plan():
+    assert validate_plan([step("a", depends_on=["b"]), step("b", depends_on=["a"])]) is None
+    assert validate_plan([]) is None
+    assert validate_plan([], frozenset({"s1"})) == []
+
+
+def test_replan_carries_completed_results(monkeypatch):
+    fake = FakePlanner(json.dumps({"steps": [
+        step("s1", "web_scraper"),
+        step("s2", "note_taker", ["s1"]),
+    ]}))
+    monkeypatch.setattr(planner, "get_model", lambda role: fake)
+    state = {
+        "messages": [HumanMessage(content="问题")],
+        "plan_results": {"s1": result(output="搜索到的链接"), "s2": result(ok=False)},
+        "replans": 1,
+    }
+    # 新计划中的 s1 与已完成的 s1 重名：计划内的依赖指向新步骤
+    command = asyncio.run(planner_node(state))
+    assert [s["id"] for s in command.update["plan"]] == ["r1-s1", "r1-s2"]
+    assert command.update["plan"][1]["depends_on"] == ["r1-s1"]
+    assert "搜索到的链接" in fake.calls[0][-1].content
+
+
+def test_replan_keeps_dependencies_on_earlier_steps(monkeypatch):
+    fake = FakePlanner(json.dumps({"steps": [step("s3", "web_scraper", ["s1"])]}))
+    monkeypatch.setattr(planner, "get_model", lambda role: fake)
+    state = {"messages": [HumanMessage(content="问题")], "plan_results": {"s1": result()}, "replans": 1}
+
+    command = asyncio.run(planner_node(state))
+    # 只有 id 加前缀，任务描述保持原样
+    assert command.update["plan"] == [{"id": "r1-s3", "worker": "web_scraper", "task": "s3", "depends_on": ["s1"]}]
+
+
+def test_unparseable_replan_is_an_error(monkeypatch):
+    monkeypatch.setattr(planner, "get_model", lambda role: FakePlanner("无法给出计划"))
+    state = {"messages": [HumanMessage(content="问题")], "plan_results": {"s1": result()}, "replans": 1}
+    with pytest.raises(PlanError):
+        asyncio.run(planner_node(state))
+
+
+def test_unparseable_first_plan_falls_back_to_default(monkeypatch):
+    monkeypatch.setattr(planner, "get_model", lambda role: FakePlanner("无法给出计划"))
+    command = asyncio.run(planner_node({"messages": [HumanMessage(content="问题")]}))
+    assert command.update["plan"] == planner.DEFAULT_PLAN
+
+
+def fake_steps(monkeypatch, failing=()):
+    """用假步骤替换工作节点，记录每批执行的步骤与交给步骤的前序输出"""
+    batches = []
+
+    async def run_step(s, state, results):
+        inputs = planner._step_inputs(s, state.get("plan") or [], results)
+        batches[-1].append((s["id"], sorted(inputs)))
+        ok = s["id"] not in failing
+        return {**result(ok, output=f"{s['id']} 的输出"), "artifacts": [], "sources": []}
+
+    async def execute(state):
+        batches.append([])
+        return await executor_node(state)
+
+    monkeypatch.setattr(planner, "_run_step", run_step)
+    return batches, execute
+
+
+def test_executor_runs_one_batch_per_invocation(monkeypatch):
+    batches, execute = fake_steps(monkeypatch)
+    state = {
+        "messages": [HumanMessage(content="问题")],
+        "plan": [step("a"), step("b"), step("c", depends_on=["a", "b"])],
+        "plan_results": {},
+    }
+
+    command = asyncio.run(execute(state))
+    assert command.goto == "executor"
+    assert sorted(command.update["plan_results"]) == ["a", "b"]
+
+    state["plan_results"] = command.update["plan_results"]
+    command = asyncio.run(execute(state))
+    assert command.goto == "answer"
+    assert batches[1] == [("c", ["a", "b"])]
+    assert [m.content for m in command.update["messages"]] == ["c 的输出"]
+
+
+def test_executor_replans_when_a_step_fails(monkeypatch):
+    _, execute = fake_steps(monkeypatch, failing={"a"})
+    state = {
+        "messages": [HumanMessage(content="问题")],
+        "plan": [step("a"), step("b", depends_on=["a"])],
+        "plan_results": {},
+        "replans": 0,
+    }
+    command = asyncio.run(execute(state))
+    assert command.goto == "planner"
+    assert command.update["replans"] == 1
+
+
+def test_replanned_steps_receive_earlier_outputs(monkeypatch):
+    batches, execute = fake_steps(monkeypatch)
+    state = {
+        "messages": [HumanMessage(content="问题")],
+        "plan": [step("r1-s1")],
+        "plan_results": {"s1": result(), "s2": result(ok=False)},
+        "replans": 1,
+    }
+    asyncio.run(execute(state))
+    assert batches[0] == [("r1-s1", ["s1", "s2"])]
@@ -0,0 +1,159 @@
+import threading
+import time
+
+import pytest
+
+from runlog import RunLog
+
+
+@pytest.fixture
+def make_log():
+    logs = []
+
+    def make(tmp_path):
+        logs.append(RunLog(tmp_path / "runs.sqlite"))
+        return logs[-1]
+
+    yield make
+    for log in logs:
+        log.close()
+
+
+def test_replay_returns_events_after_last_event_id(tmp_path, make_log):
+    log = make_log(tmp_path)
+    log.create_run("a", "q")
+    seqs = [log.append("a", f"chunk {i}") for i in range(5)]
+
+    assert seqs == [1, 2, 3, 4, 5]
+    assert log.events_after("a", 3) == [(4, "chunk 3"), (5, "chunk 4")]
+    assert log.events_after("a", 5) == []
+
+
+def test_appends_are_committed_in_background(tmp_path, make_log):
+    log = make_log(tmp_path)
+    log.create_run("a", "q")
+    log.append("a", "x")
+
+    # 另一个连接（如另一个进程）在后台线程提交后即可读到
+    reader = make_log(tmp_path)
+    deadline = time.monotonic() + 2
+    while not reader.events_after("a", 0) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert reader.events_after("a", 0) == [(1, "x")]
+
+
+def test_sequence_continues_from_log_in_another_process(tmp_path, make_log):
+    first = make_log(tmp_path)
+    first.create_run("a", "q")
+    first.append("a", "one")
+    first.append("a", "two")
+    first.set_status("a", "interrupted")
+
+    second = make_log(tmp_path)
+    assert second.append("a", "three") == 3
+    assert [data for _, data in second.events_after("a", 0)] == ["one", "two", "three"]
+
+
+def test_status_is_written_after_pending_events(tmp_path, make_log):
+    log = make_log(tmp_path)
+    log.create_run("a", "q")
+    for i in range(3):
+        log.append("a", str(i))
+    log.set_status("a", "done")
+
+    reader = make_log(tmp_path)
+    assert reader.get_run("a")["status"] == "done"
+    assert len(reader.events_after("a", 0)) == 3
+
+
+def test_concurrent_appends_get_distinct_sequences(tmp_path, make_log):
+    log = make_log(tmp_path)
+    for run_id in ("a", "b"):
+        log.create_run(run_id, "q")
+
+    def write(run_id):
+        for i in range(200):
+            log.append(run_id, f"{run_id}{i}")
+
+    threads = [threading.Thread(target=write, args=(run_id,)) for run_id in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for run_id in ("a", "b"):
+        events = log.events_after(run_id, 0)
+        assert [seq for seq, _ in events] == list(range(1, 201))
+        assert [data for _, data in events] == [f"{run_id}{i}" for i in range(200)]
+
+
+def test_claim_takes_oldest_queued_run(tmp_path, make_log):
+    log = make_log(tmp_path)
+    log.create_run("a", "q1", status="queued")
+    log.create_run("b", "q2", status="queued")
+
+    run = log.claim("w1")
+    assert run["run_id"] == "a"
+    assert log.get_run("a")["status"] == "running"
+    assert log.claim("w2")["run_id"] == "b"
+    assert log.claim("w3") is None
+
+
+def test_expired_lease_is_reclaimed(tmp_path, make_log):
+    log = make_log(tmp_path)
+    log.create_run("a", "q", status="queued")
+    log.claim("w1")
+
+    assert log.claim("w2") is None
+    time.sleep(0.05)
+    assert log.claim("w2", lease=0.01)["run_id"] == "a"
+
+
+def test_last_subscriber_leaving_interrupts_queued_run(tmp_path, make_log):
+    log = make_log(tmp_path)
+    log.create_run("a", "q", status="queued")
+    log.subscribe("a", 1)
+    log.subscribe("a", -1)
+
+    assert log.get_run("a")["status"] == "interrupted"
+    assert log.claim("w1") is None
+
+
+def test_resubscribing_withdraws_cancel_request(tmp_path, make_log):
+    log = make_log(tmp_path)
+    log.create_run("a", "q", status="queued")
+    log.subscribe("a", 1)
+    log.claim("w1")
+
+    log.subscribe("a", -1)
+    assert log.heartbeat("w1", ["a"]) == ["a"]
+
+    log.subscribe("a", 1)
+    assert log.heartbeat("w1", ["a"]) == []
+    assert log.get_run("a")["status"] == "running"
+
+
+def test_requeue_clears_cancel_and_worker(tmp_path, make_log):
+    log = make_log(tmp_path)
+    log.create_run("a", "q", status="queued")
+    log.subscribe("a", 1)
+    log.claim("w1")
+    log.subscribe("a", -1)
+
+    log.requeue("a")
+    assert log.get_run("a")["status"] == "queued"
+    run = log.claim("w2")
+    assert run["run_id"] == "a"
+    assert log.heartbeat("w2", ["a"]) == []
+
+
+def test_interrupted_runs_expire_once_after_ttl(tmp_path, make_log):
+    log = make_log(tmp_path)
+    log.create_run("a", "q")
+    log.create_run("b", "q")
+    log.set_status("a", "interrupted")
+
+    assert log.expire_interrupted(ttl=3600) == []
+    assert log.expire_interrupted(ttl=0) == ["a"]
+    assert log.get_run("a")["status"] == "expired"
+    assert log.get_run("b")["status"] == "running"
+    assert make_log(tmp_path).expire_interrupted(ttl=0) == []
@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+import runner
+import session
+from graph import WORKER_KEY, WORKER_STREAM_TAG
+from runner import _handle_lean_event
+from sse import FrameBatcher
+
+
+def worker_event(event_type, name="x", **data):
+    return {
+        "event": event_type,
+        "name": name,
+        "tags": [WORKER_STREAM_TAG],
+        "metadata": {WORKER_KEY: "search"},
+        "data": data,
+    }
+
+
+def test_worker_internal_chain_events_are_dropped():
+    batcher = FrameBatcher()
+    for event_type in ("on_chain_start", "on_chain_stream", "on_chain_end", "on_chat_model_start"):
+        _handle_lean_event(worker_event(event_type, name="agent"), batcher)
+    assert batcher.drain() == ""
+
+
+def test_worker_tokens_and_tool_calls_are_forwarded():
+    batcher = FrameBatcher()
+    _handle_lean_event(worker_event("on_chat_model_stream", chunk=SimpleNamespace(content="你好")), batcher)
+    _handle_lean_event(worker_event("on_tool_start", name="tavily_search"), batcher)
+    frames = batcher.drain()
+    assert '"agent_delta"' in frames and "你好" in frames
+    assert '"agent_tool_start"' in frames
+
+
+def test_expired_interrupted_runs_release_their_sessions(monkeypatch):
+    released = []
+    monkeypatch.setattr(session, "_end_hooks", [released.append])
+    runner.run_log.create_run("expire-me", "q")
+    runner.run_log.set_status("expire-me", "interrupted")
+
+    assert asyncio.run(runner.expire_interrupted_runs(ttl=0)) == ["expire-me"]
+    assert released == ["expire-me"]
+    assert runner.run_log.get_run("expire-me")["status"] == "expired"
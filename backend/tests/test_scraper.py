@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("bs4")
+
+from scraper import PageCache, ScrapeEngine
+
+
+def run_with_transport(engine, handler, url):
+    async def main():
+        engine._ensure_client()
+        engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return await engine.fetch(url)
+
+    return asyncio.run(main())
+
+
+def test_slow_drip_response_is_cut_off_by_total_timeout():
+    async def drip():
+        # 每个分片都在单次读超时内到达，整体却永远不会结束
+        while True:
+            await asyncio.sleep(0.01)
+            yield b"x"
+
+    engine = ScrapeEngine(timeout=1, total_timeout=0.1)
+    page = run_with_transport(engine, lambda request: httpx.Response(200, content=drip()), "https://slow")
+    assert page.error and page.error.startswith("TimeoutError")
+
+
+def test_not_modified_response_is_served_from_cache(tmp_path):
+    cache = PageCache(tmp_path / "pages.sqlite")
+    cache.put("https://a", '"v1"', None, "标题", "正文")
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("If-None-Match"))
+        return httpx.Response(304)
+
+    page = run_with_transport(ScrapeEngine(cache=cache), handler, "https://a")
+    assert seen == ['"v1"']
+    assert (page.title, page.text, page.from_cache) == ("标题", "正文", True)
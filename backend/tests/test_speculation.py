@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.tools import BaseTool
+
+from cache import TTLCache
+from graph.speculation import SPECULATION_TOTAL, Speculation
+from tools import CachedSearchTool
+
+
+class CountingSearch(BaseTool):
+    name: str = "search"
+    description: str = "测试用搜索"
+    calls: int = 0
+
+    def _run(self, query: str):
+        raise NotImplementedError
+
+    async def _arun(self, query: str):
+        self.calls += 1
+        return {"query": query, "results": []}
+
+
+def outcomes(member):
+    return {outcome: n for (node, outcome), n in SPECULATION_TOTAL.snapshot().items() if node == member}
+
+
+def speculate(member, decision, tool, query, consume=True):
+    async def prefetch(state, on_used):
+        await tool.prefetch(query=query, on_used=on_used)
+
+    async def main():
+        speculation = Speculation(member, prefetch, {})
+        await asyncio.sleep(0)
+        await speculation.settle(decision)
+        if consume:
+            await tool.ainvoke({"query": query})
+        await speculation.cancel()
+
+    asyncio.run(main())
+
+
+def test_hit_is_counted_when_prefetched_result_is_read():
+    tool = CachedSearchTool(CountingSearch(), TTLCache("test", ttl=60))
+    speculate("hit_member", "hit_member", tool, "问题")
+
+    assert outcomes("hit_member") == {"routed": 1, "hit": 1}
+    assert tool.tool.calls == 1
+
+
+def test_correct_route_without_read_is_not_a_hit():
+    tool = CachedSearchTool(CountingSearch(), TTLCache("test", ttl=60))
+    # 成员实际用了另一个查询，预取结果没有被读取
+    speculate("unused_member", "unused_member", tool, "问题", consume=False)
+
+    assert outcomes("unused_member") == {"routed": 1}
+
+
+def test_wrong_route_is_a_miss():
+    tool = CachedSearchTool(CountingSearch(), TTLCache("test", ttl=60))
+    speculate("miss_member", "other", tool, "问题")
+
+    assert outcomes("miss_member") == {"miss": 1}
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from transport import HedgePolicy, RateLimiter, ResilientChatModel, hedged
+
+
+class SlowFirstModel(BaseChatModel):
+    """第一次请求很慢，之后的请求立即返回"""
+
+    calls: int = 0
+    slow: float = 1.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-first"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        assert "hedge" not in kwargs
+        self.calls += 1
+        if self.calls == 1:
+            await asyncio.sleep(self.slow)
+        yield ChatGenerationChunk(message=AIMessageChunk(content=f"第{self.calls}次"))
+
+
+def transport(inner, hedging=True):
+    return ResilientChatModel(
+        model=inner,
+        limiter=RateLimiter(rps=0, tpm=0),
+        hedge_policy=HedgePolicy(default_delay=0.05),
+        hedging=hedging,
+    )
+
+
+def test_hedged_astream_issues_second_request():
+    inner = SlowFirstModel()
+    model = hedged(transport(inner).bind(max_tokens=16))
+
+    async def main():
+        return [chunk.content async for chunk in model.astream([HumanMessage(content="路由")])]
+
+    started = time.monotonic()
+    assert asyncio.run(main()) == ["第2次"]
+    assert inner.calls == 2
+    assert time.monotonic() - started < inner.slow
+
+
+def test_unhedged_call_makes_one_request():
+    inner = SlowFirstModel(slow=0.1)
+
+    async def main():
+        return await transport(inner).ainvoke([HumanMessage(content="路由")])
+
+    assert asyncio.run(main()).content == "第1次"
+    assert inner.calls == 1
+
+
+def test_hedged_leaves_models_without_transport_unchanged():
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="x")]))
+    assert hedged(model) is model
@@ -1,97 +1,296 @@
-from typing import Annotated, List
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_tavily import TavilySearch
-from langchain_core.tools import tool
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from typing import Annotated, Any, Callable, List
+from langchain_core.tools import BaseTool, tool
 from pathlib import Path
 from tempfile import TemporaryDirectory
 from typing import Dict, Optional
-from langchain_experimental.utilities import PythonREPL
+from langchain_core.runnables import RunnableConfig
+from pydantic import PrivateAttr
+from cache import CACHE_DIRECTORY, TTLCache, normalize_query
+from scraper import SCRAPE_MAX_CHARS, scrape_engine
+from passages import PASSAGE_INDEX, PASSAGE_LEAD_CHARS, PassageStore, preview
+from artifacts import ARTIFACT_INLINE_CHARS, artifact_store
+from sandbox import repl_pool
+from session import get_session_id, on_session_end, on_session_suspend
+from documents import DocumentStore
+from lazy import lazy_attributes, require_env
 
-tavily_tool = TavilySearch(max_results=5)
+# 搜索缓存配置：有效期（秒）、内存条目数、SQLite 路径（设为空字符串则只用内存）
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 24 * 3600))
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 512))
+SEARCH_CACHE_PATH = os.environ.get("SEARCH_CACHE_PATH", str(CACHE_DIRECTORY / "search.sqlite"))
+
+search_cache = TTLCache(
+    "search",
+    ttl=SEARCH_CACHE_TTL,
+    max_entries=SEARCH_CACHE_SIZE,
+    db_path=Path(SEARCH_CACHE_PATH) if SEARCH_CACHE_PATH else None,
+)
+
+# 最多跟踪这么多条尚未被读取的推测预取
+SEARCH_PREFETCH_TRACKED = 256
+
+def _is_cacheable(result: Any) -> bool:
+    # 只缓存正常结果，错误信息下次仍然重新请求
+    return isinstance(result, dict) and "error" not in result
+
+class CachedSearchTool(BaseTool):
+    """为搜索工具加缓存，名称、描述、参数与返回格式与原工具一致"""
+
+    tool: BaseTool
+    cache: Any
+    # 推测预取过的缓存键 -> 正式调用读到该结果时的回调（顶层与调研团队的监督者可能预取同一查询）
+    _prefetched: "OrderedDict[str, List[Callable[[], None]]]" = PrivateAttr(default_factory=OrderedDict)
+
+    def __init__(self, tool: BaseTool, cache: TTLCache):
+        super().__init__(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            tool=tool,
+            cache=cache,
+        )
+
+    def _cache_key(self, kwargs: dict) -> str:
+        params = {k: v for k, v in kwargs.items() if v is not None}
+        params["query"] = normalize_query(params.get("query", ""))
+        # 工具实例上的参数（如 max_results）同样影响结果
+        for attr in ("max_results", "topic", "search_depth", "include_domains", "exclude_domains"):
+            value = getattr(self.tool, attr, None)
+            if value is not None:
+                params.setdefault(attr, value)
+        return json.dumps({"tool": self.name, **params}, ensure_ascii=False, sort_keys=True, default=str)
+
+    def _mark_used(self, key: str) -> None:
+        for on_used in self._prefetched.pop(key, ()):
+            on_used()
+
+    def _run(self, **kwargs):
+        key = self._cache_key(kwargs)
+        self._mark_used(key)
+        return self.cache.get_or_compute(key, lambda: self.tool.invoke(kwargs), _is_cacheable)
+
+    async def _arun(self, **kwargs):
+        key = self._cache_key(kwargs)
+        self._mark_used(key)
+        return await self.cache.aget_or_compute(key, lambda: self.tool.ainvoke(kwargs), _is_cacheable)
+
+    async def prefetch(self, on_used: Optional[Callable[[], None]] = None, **kwargs) -> None:
+        """推测预取：只把结果写入缓存；不经过工具调用，也不带回调，不产生事件。
+
+        on_used 在随后的正式调用读取同一缓存键时调用（预取仍在进行时合并等待同样算作读取）。
+        """
+        key = self._cache_key(kwargs)
+        if on_used is not None:
+            self._prefetched.setdefault(key, []).append(on_used)
+            self._prefetched.move_to_end(key)
+            while len(self._prefetched) > SEARCH_PREFETCH_TRACKED:
+                self._prefetched.popitem(last=False)
+        await self.cache.aget_or_compute(
+            key, lambda: self.tool.ainvoke(kwargs, {"callbacks": []}), _is_cacheable
+        )
+
+# 大段工具输出按内容哈希存放，消息中只保留句柄与预览；最后引用它的会话结束时删除
+on_session_end(artifact_store.release)
+on_session_suspend(artifact_store.suspend)
+
+async def offload(text: str, config: RunnableConfig) -> str:
+    return await asyncio.to_thread(artifact_store.offload, get_session_id(config), text)
+
+# 本次运行抓取、搜索到的正文按会话编入段落索引，会话结束时释放
+passage_store = PassageStore()
+on_session_end(passage_store.release)
+on_session_suspend(passage_store.suspend)
+# search_passages 单次最多返回的段落数
+PASSAGE_MAX_K = 10
+
+class IndexedSearchTool(BaseTool):
+    """把搜索结果的正文编入段落索引，返回给智能体的结果中正文只保留预览并附来源编号"""
+
+    tool: BaseTool
+
+    def __init__(self, tool: BaseTool):
+        super().__init__(name=tool.name, description=tool.description, args_schema=tool.args_schema, tool=tool)
+
+    @staticmethod
+    def _compact(result: Any, config: RunnableConfig) -> Any:
+        if not PASSAGE_INDEX or not isinstance(result, dict) or not isinstance(result.get("results"), list):
+            return result
+        index = passage_store.index(get_session_id(config))
+        results = []
+        for item in result["results"]:
+            text = item.get("raw_content") or item.get("content") or ""
+            source_id, _ = index.add(item.get("url", ""), item.get("title", ""), text)
+            results.append({
+                "source": source_id,
+                "url": item.get("url"),
+                "title": item.get("title"),
+                "content": preview(item.get("content") or text),
+            })
+        return {**result, "results": results}
+
+    def _run(self, config: RunnableConfig, **kwargs):
+        return self._compact(self.tool.invoke(kwargs), config)
+
+    async def _arun(self, config: RunnableConfig, **kwargs):
+        # 编入索引会写入来源库，不在事件循环上执行
+        return await asyncio.to_thread(self._compact, await self.tool.ainvoke(kwargs), config)
+
+    async def prefetch(self, on_used: Optional[Callable[[], None]] = None, **kwargs) -> None:
+        await self.tool.prefetch(on_used=on_used, **kwargs)
+
+def _build_tavily_tool() -> BaseTool:
+    from langchain_tavily import TavilySearch
+
+    require_env("TAVILY_API_KEY")
+    return IndexedSearchTool(CachedSearchTool(TavilySearch(max_results=5), search_cache))
+
+# 搜索工具在首次访问时创建
+__getattr__ = lazy_attributes(globals(), {"tavily_tool": _build_tavily_tool})
+
+@tool
+async def scrape_webpages(urls: List[str], config: RunnableConfig) -> str:
+    """并发爬取指定网页，获取去除导航等模板内容后的正文。"""
+    pages = await scrape_engine.fetch_all(urls)
+    documents = []
+    for page in pages:
+        if page.error:
+            documents.append(f'<Document name="{page.url}">\n抓取失败：{page.error}\n</Document>')
+            continue
+        if PASSAGE_INDEX:
+            # 正文编入段落索引，消息中只保留来源编号与很短的开头预览；链接已在工具调用参数中，不再重复
+            index = await asyncio.to_thread(passage_store.index, get_session_id(config))
+            source_id, count = await asyncio.to_thread(index.add, page.url, page.title, page.text)
+            documents.append(
+                f'<Document source="{source_id}" name="{page.title}" passages="{count}">'
+                f'{preview(page.text, PASSAGE_LEAD_CHARS)}</Document>'
+            )
+            continue
+        text = page.text
+        if len(text) > SCRAPE_MAX_CHARS:
+            text = f"{text[:SCRAPE_MAX_CHARS]}\n…[已截断，原文 {len(page.text)} 字]"
+        documents.append(f'<Document name="{page.title}">\n{text}\n</Document>')
+    if PASSAGE_INDEX:
+        # 原文已在段落索引中：结果只是来源清单，不再存为 artifact，避免提示词里同时出现预览与 artifact 句柄
+        if any(not page.error for page in pages):
+            documents.append("正文已编入段落索引，可用 search_passages 按问题检索原文段落。")
+        return "\n".join(documents)
+    return await offload("\n\n".join(documents), config)
 
 @tool
-def scrape_webpages(urls: List[str]) -> str:
-    """使用 requests 和 bs4 爬取指定网页，获取详细信息。"""
-    loader = WebBaseLoader(urls)
-    docs = loader.load()
+async def search_passages(
+    query: Annotated[str, "要查找的内容，关键词或问题。"],
+    config: RunnableConfig,
+    k: Annotated[int, "返回的段落数，默认值为 5"] = 5,
+) -> str:
+    """在本次调研搜索、抓取到的网页原文中检索最相关的段落，返回段落原文及其来源编号。"""
+    index = await asyncio.to_thread(passage_store.index, get_session_id(config))
+    hits = index.search(query, max(1, min(k, PASSAGE_MAX_K)))
+    if not hits:
+        return "没有找到相关段落。"
     return "\n\n".join(
-        [
-            f'<Document name="{doc.metadata.get("title", "")}">\n{doc.page_content}\n</Document>'
-            for doc in docs
-        ]
+        f'<Passage id="{passage.id}" name="{passage.title}" url="{passage.url}">\n{passage.text}\n</Passage>'
+        for passage, _ in hits
     )
 
-# 系统自动创建临时目录
-_TEMP_DIRECTORY = TemporaryDirectory()
-# 临时目录路径
-WORKING_DIRECTORY = Path(_TEMP_DIRECTORY.name)
+# 文档目录：未设置 DOCUMENT_DIRECTORY 时使用进程退出即删除的临时目录；
+# 多个执行进程需共享同一目录，运行被其他进程接手时仍能读到已写的文档
+DOCUMENT_DIRECTORY = os.environ.get("DOCUMENT_DIRECTORY", "")
+if DOCUMENT_DIRECTORY:
+    WORKING_DIRECTORY = Path(DOCUMENT_DIRECTORY)
+else:
+    # 系统自动创建临时目录
+    _TEMP_DIRECTORY = TemporaryDirectory()
+    # 临时目录路径
+    WORKING_DIRECTORY = Path(_TEMP_DIRECTORY.name)
+
+# 文档按会话存放在 WORKING_DIRECTORY 的子目录中，会话结束时删除
+document_store = DocumentStore(WORKING_DIRECTORY)
+on_session_end(document_store.release)
+on_session_suspend(document_store.suspend)
 
 @tool
-def create_outline(
+async def create_outline(
     points: Annotated[List[str], "主要要点或章节列表。"],
     file_name: Annotated[str, "用于保存大纲的文件路径。"],
+    config: RunnableConfig,
 ) -> Annotated[str, "保存的大纲文件路径。"]:
     """创建并保存大纲。"""
-    with (WORKING_DIRECTORY / file_name).open("w") as file:
-        for i, point in enumerate(points):
-            file.write(f"{i + 1}. {point}\n")
+    content = "".join(f"{i + 1}. {point}\n" for i, point in enumerate(points))
+    await document_store.write(get_session_id(config), file_name, content)
     return f"大纲已保存至 {file_name}"
 
 @tool
-def read_document(
+async def read_document(
     file_name: Annotated[str, "待读取文档的文件路径。"],
+    config: RunnableConfig,
     start: Annotated[Optional[int], "起始行，默认值为 0"] = None,
     end: Annotated[Optional[int], "结束行，默认值为 None"] = None,
 ) -> str:
     """读取指定文档。"""
-    with (WORKING_DIRECTORY / file_name).open("r") as file:
-        lines = file.readlines()
-        if start is None:
-            start = 0
-        return "\n".join(lines[start:end])
+    if start is None:
+        start = 0
+    lines = await document_store.read(get_session_id(config), file_name, start, end)
+    return await offload("\n".join(lines), config)
 
 @tool
-def write_document(
+async def write_document(
     content: Annotated[str, "要写入文档的文本内容。"],
     file_name: Annotated[str, "用于保存文档的文件路径。"],
+    config: RunnableConfig,
 ) -> Annotated[str, "保存的文档文件路径。"]:
     """创建并保存文本文档。"""
-    with (WORKING_DIRECTORY / file_name).open("w") as file:
-        file.write(content)
+    await document_store.write(get_session_id(config), file_name, content)
     return f"文档已保存至 {file_name}"
 
 @tool
-def edit_document(
+async def edit_document(
     file_name: Annotated[str, "待编辑文档的路径。"],
     inserts: Annotated[
         Dict[int, str],
         "字典，键为行号（从 1 开始计数），值为要插入该行的文本。",
     ],
+    config: RunnableConfig,
 ) -> Annotated[str, "编辑后的文档文件路径。"]:
     """通过在特定行号插入文本编辑文档。"""
-    with (WORKING_DIRECTORY / file_name).open("r") as file:
-        lines = file.readlines()
-    sorted_inserts = sorted(inserts.items())
-    for line_number, text in sorted_inserts:
-        if 1 <= line_number <= len(lines) + 1:
-            lines.insert(line_number - 1, text + "\n")
-        else:
-            return f"错误：行号 {line_number} 超出范围。"
-    with (WORKING_DIRECTORY / file_name).open("w") as file:
-        file.writelines(lines)
+    bad_line = await document_store.insert(get_session_id(config), file_name, inserts)
+    if bad_line is not None:
+        return f"错误：行号 {bad_line} 超出范围。"
     return f"文档已编辑并保存至 {file_name}"
 
-# 警告：此工具会在本地执行代码，若未进行沙箱隔离，可能存在安全风险
-repl = PythonREPL()
+# 代码在独立的工作进程中执行，每个会话一个进程，带超时与内存限制
+on_session_end(repl_pool.release)
+on_session_suspend(repl_pool.release)
 
 @tool
-def python_repl_tool(
+async def python_repl_tool(
     code: Annotated[str, "用于生成图表的 Python 代码。"],
+    config: RunnableConfig,
 ):
     """使用此工具执行 Python 代码。若需查看某个值的输出，
     请使用 `print(...)` 打印该值。执行结果对用户可见。"""
     try:
-        result = repl.run(code)
-    except BaseException as e:
+        result = await repl_pool.run(get_session_id(config), code)
+    except Exception as e:
         return f"执行失败。错误信息：{repr(e)}"
-    return f"执行成功：\n```python\n{code}\n```\n标准输出：{result}"
\ No newline at end of file
+    return await offload(f"执行成功：\n```python\n{code}\n```\n标准输出：{result}", config)
+
+@tool
+async def read_artifact(
+    artifact_id: Annotated[str, "工具结果中 <Artifact> 的 id。"],
+    config: RunnableConfig,
+    start: Annotated[Optional[int], "起始字符位置，默认值为 0"] = None,
+    length: Annotated[Optional[int], "读取的字符数，默认值及上限为 4000"] = None,
+) -> str:
+    """读取被折叠的大段工具输出（<Artifact>）的全文或其中一段。"""
+    # 只能读取本次运行存入的内容
+    content = await asyncio.to_thread(artifact_store.get, get_session_id(config), artifact_id.strip())
+    if content is None:
+        return f"错误：Artifact {artifact_id} 不存在或已释放。"
+    start = start or 0
+    end = start + min(length or ARTIFACT_INLINE_CHARS, ARTIFACT_INLINE_CHARS)
+    more = f"\n…[剩余 {len(content) - end} 字，从 start={end} 继续读取]" if end < len(content) else ""
+    return content[start:end] + more
\ No newline at end of file
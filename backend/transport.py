@@ -0,0 +1,405 @@
+"""模型调用的传输层：共享连接池、客户端限流、按运行计的重试预算，以及监督者路由调用的对冲请求。
+
+ResilientChatModel 包装实际的聊天模型（ChatOpenAI 的 max_retries 设为 0，重试统一在这里处理）：
+- 每次请求前从两个令牌桶取额度：请求数/秒与 token 数/分钟，结束后按实际用量校正；
+- 首个分块到达前失败且可重试（429、5xx、连接错误）时按带抖动的指数退避重试，
+  已输出分块后失败不再重试，避免重复内容；
+- 以 hedged(model) 标记的调用（监督者路由）在首个分块迟迟未到（超过近期 p95）时并发发出一份相同请求，
+  先返回的一份胜出，另一份取消。标记是绑定参数 hedge=True，由本层取出，不会转发给服务端；
+  hedged() 只给经本层包装的模型绑定该参数，其他模型原样返回。
+"""
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from metrics import registry
+
+# 连接池：最大连接数、保持空闲连接数、读超时（秒）
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 32))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", 16))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 120))
+# 限流（按进程计，0 表示不限）：每秒请求数及其突发量、每分钟 token 数
+LLM_RPS = float(os.environ.get("LLM_RPS", 10))
+LLM_BURST = float(os.environ.get("LLM_BURST", 10))
+LLM_TPM = float(os.environ.get("LLM_TPM", 1_000_000))
+# 未指定 max_tokens 时预留的输出 token 数，请求结束后按实际用量校正
+LLM_COMPLETION_RESERVE = int(os.environ.get("LLM_COMPLETION_RESERVE", 512))
+# 重试：单次调用最多尝试次数、单次运行的重试总预算、退避基数与上限（秒）
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", 4))
+LLM_RETRY_BUDGET = int(os.environ.get("LLM_RETRY_BUDGET", 8))
+LLM_RETRY_BASE = float(os.environ.get("LLM_RETRY_BASE", 0.5))
+LLM_RETRY_MAX = float(os.environ.get("LLM_RETRY_MAX", 20))
+# 对冲：是否开启、样本不足时的等待时间（秒）、计算 p95 所需的最少样本数
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_DELAY = float(os.environ.get("LLM_HEDGE_DELAY", 1.0))
+LLM_HEDGE_MIN_SAMPLES = 20
+# 开启对冲的调用绑定的参数名
+HEDGE_KWARG = "hedge"
+
+LLM_RETRIES_TOTAL = registry.counter("llm_retries_total", "模型调用重试次数", ("reason",))
+LLM_HEDGES_TOTAL = registry.counter("llm_hedges_total", "对冲请求次数", ("winner",))
+LLM_THROTTLE_SECONDS = registry.histogram("llm_throttle_seconds", "等待限流额度的时间")
+
+class TokenBucket:
+    """令牌桶：按 rate（每秒）补充，容量为 capacity；rate 为 0 时不限流。
+
+    不依赖事件循环对象，多个线程中的事件循环可共用同一个桶。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount: float) -> float:
+        """额度足够时扣除并返回 0，否则返回还需等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    async def acquire(self, amount: float) -> None:
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def adjust(self, delta: float) -> None:
+        """按实际用量校正：delta 为正表示多用（可透支），为负表示退还"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+class RateLimiter:
+    """请求数/秒与 token 数/分钟两个维度的客户端限流"""
+
+    def __init__(self, rps: float = LLM_RPS, burst: float = LLM_BURST, tpm: float = LLM_TPM):
+        self.requests = TokenBucket(rps, max(1.0, burst))
+        self.tokens = TokenBucket(tpm / 60, tpm)
+
+    async def acquire(self, tokens: int) -> None:
+        start = time.monotonic()
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            LLM_THROTTLE_SECONDS.observe(waited)
+
+    def try_acquire(self, tokens: int) -> bool:
+        """不等待地取额度（对冲请求只在有空闲额度时发出）"""
+        if self.requests.try_acquire(1):
+            return False
+        if self.tokens.try_acquire(tokens):
+            self.requests.adjust(-1)
+            return False
+        return True
+
+    def settle(self, reserved: int, used: Optional[int]) -> None:
+        if used is not None:
+            self.tokens.adjust(used - reserved)
+
+class RetryBudget:
+    """单次运行可用的重试次数，运行内所有模型调用共用"""
+
+    def __init__(self, retries: int = LLM_RETRY_BUDGET):
+        self.remaining = retries
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+# 当前运行的重试预算，由 runner 在运行开始时设置；未设置时每次调用只受单次尝试次数限制
+_retry_budget: contextvars.ContextVar[Optional[RetryBudget]] = contextvars.ContextVar("retry_budget", default=None)
+
+def start_retry_budget(retries: int = LLM_RETRY_BUDGET) -> RetryBudget:
+    budget = RetryBudget(retries)
+    _retry_budget.set(budget)
+    return budget
+
+class HedgePolicy:
+    """记录对冲调用的首分块耗时，等待时间取近期 p95"""
+
+    def __init__(self, default_delay: float = LLM_HEDGE_DELAY, window: int = 200):
+        self.default_delay = default_delay
+        self._samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def delay(self) -> float:
+        if len(self._samples) < LLM_HEDGE_MIN_SAMPLES:
+            return self.default_delay
+        ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+def _retry_reason(error: BaseException) -> Optional[str]:
+    """可重试时返回原因（用作指标标签），否则返回 None"""
+    import httpx
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        if status == 429:
+            return "rate_limited"
+        if status in (408, 409) or status >= 500:
+            return "server_error"
+        return None
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return "connection"
+    return None
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+    """全抖动的指数退避；服务端给出 Retry-After 时不早于该时间"""
+    delay = random.uniform(0, min(LLM_RETRY_MAX, LLM_RETRY_BASE * (2 ** attempt)))
+    return max(delay, retry_after or 0.0)
+
+def _estimate_tokens(messages: List[BaseMessage], kwargs: dict) -> int:
+    # 只用于限流预留，按字符数粗估即可，结束后按实际用量校正
+    chars = sum(len(m.content) if isinstance(m.content, str) else len(str(m.content)) for m in messages)
+    return chars // 2 + (kwargs.get("max_tokens") or LLM_COMPLETION_RESERVE)
+
+def _usage_tokens(chunk: ChatGenerationChunk) -> Optional[int]:
+    usage = getattr(chunk.message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+_DONE = object()
+
+class _Attempt:
+    """在独立任务中消费一次请求的流，分块经队列交给调用方"""
+
+    def __init__(self, stream: AsyncIterator[ChatGenerationChunk]):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.started = time.monotonic()
+        self.task = asyncio.create_task(self._pump(stream))
+
+    async def _pump(self, stream: AsyncIterator[ChatGenerationChunk]) -> None:
+        try:
+            async for chunk in stream:
+                await self.queue.put(chunk)
+            await self.queue.put(_DONE)
+        except Exception as e:
+            await self.queue.put(e)
+
+    def cancel(self) -> None:
+        self.task.cancel()
+
+def make_http_clients():
+    """模型调用共用的连接池（同步与异步各一个）"""
+    import httpx
+
+    limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE)
+    timeout = httpx.Timeout(LLM_TIMEOUT, connect=10.0)
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+class ResilientChatModel(BaseChatModel):
+    """为聊天模型加限流、重试与对冲；绑定参数 hedge=True 的调用开启对冲"""
+
+    model: BaseChatModel
+    limiter: Any
+    hedge_policy: Any
+    hedging: bool = LLM_HEDGE
+    max_attempts: int = LLM_MAX_ATTEMPTS
+
+    @property
+    def _llm_type(self) -> str:
+        return f"resilient-{self.model._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict:
+        # 与被包装模型一致，响应缓存的键不受传输层影响
+        return self.model._identifying_params
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self.bind(**self.model.bind_tools(tools, **kwargs).kwargs)
+
+    async def _attempts(
+        self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict, prepaid: bool = False
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """限流 + 重试：只有在尚未输出任何分块时失败才重试。prepaid 表示首次请求的额度已由调用方取得"""
+        budget = _retry_budget.get()
+        reserved = _estimate_tokens(messages, kwargs)
+        for attempt in range(self.max_attempts):
+            if attempt or not prepaid:
+                await self.limiter.acquire(reserved)
+            used = None
+            emitted = False
+            try:
+                async for chunk in self.model._astream(messages, stop=stop, **kwargs):
+                    emitted = True
+                    used = _usage_tokens(chunk) or used
+                    yield chunk
+                return
+            except Exception as e:
+                reason = _retry_reason(e)
+                if (
+                    emitted
+                    or reason is None
+                    or attempt + 1 >= self.max_attempts
+                    or (budget is not None and not budget.take())
+                ):
+                    raise
+                LLM_RETRIES_TOTAL.inc(1, reason)
+                await asyncio.sleep(backoff(attempt, _retry_after(e)))
+            finally:
+                self.limiter.settle(reserved, used)
+
+    async def _hedged(
+        self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        primary = _Attempt(self._attempts(messages, stop, kwargs))
+        attempts = [primary]
+        getters = {asyncio.ensure_future(primary.queue.get()): primary}
+        try:
+            done, _ = await asyncio.wait(getters, timeout=self.hedge_policy.delay())
+            # 首个分块迟迟未到且仍有限流额度时，再发出一份相同的请求（额度在这里已扣除，每份请求只计一次）
+            if not done and self.limiter.try_acquire(_estimate_tokens(messages, kwargs)):
+                hedge = _Attempt(self._attempts(messages, stop, kwargs, prepaid=True))
+                attempts.append(hedge)
+                getters[asyncio.ensure_future(hedge.queue.get())] = hedge
+
+            # 取最先到达首个分块的一份；失败的一份被忽略，全部失败时抛出最后的错误
+            winner, first, error = None, None, None
+            while winner is None and getters:
+                done, _ = await asyncio.wait(getters, return_when=asyncio.FIRST_COMPLETED)
+                for getter in done:
+                    attempt = getters.pop(getter)
+                    item = getter.result()
+                    if isinstance(item, BaseException):
+                        error = item
+                    elif winner is None:
+                        winner, first = attempt, item
+            if winner is None:
+                raise error
+            if len(attempts) > 1:
+                LLM_HEDGES_TOTAL.inc(1, "primary" if winner is primary else "hedge")
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel()
+            self.hedge_policy.record(time.monotonic() - winner.started)
+
+            item = first
+            while item is not _DONE:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+                item = await winner.queue.get()
+        finally:
+            for getter in getters:
+                getter.cancel()
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        # 标记不能放在 config metadata 中：BaseChatModel.astream 调用 _astream 时不传 run_manager
+        hedge = kwargs.pop(HEDGE_KWARG, False) and self.hedging
+        stream = self._hedged(messages, stop, kwargs) if hedge else self._attempts(messages, stop, kwargs)
+        try:
+            # 被包装模型不接收回调，token 事件只对最终采用的分块发送一次
+            async for chunk in stream:
+                if run_manager and chunk.message.content:
+                    await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        # 同步调用只走被包装模型自身的逻辑，图中的调用均为异步
+        kwargs.pop(HEDGE_KWARG, None)
+        yield from self.model._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        kwargs.pop(HEDGE_KWARG, None)
+        return self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        from langchain_core.language_models.chat_models import agenerate_from_stream
+
+        return await agenerate_from_stream(self._astream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+# 限流按接口地址区分：不同档位的模型可能部署在不同服务上，额度互不占用
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def limiter_for(endpoint: str) -> RateLimiter:
+    with _limiters_lock:
+        if endpoint not in _limiters:
+            _limiters[endpoint] = RateLimiter()
+        return _limiters[endpoint]
+
+def _transport_of(model: Runnable) -> Optional[ResilientChatModel]:
+    """沿参数绑定与缓存层向内查找传输层模型"""
+    while not isinstance(model, ResilientChatModel):
+        inner = getattr(model, "bound", None)
+        if inner is None and isinstance(model, BaseChatModel):
+            # 响应缓存等包装模型把被包装模型放在 model 字段中
+            inner = getattr(model, "model", None)
+        if not isinstance(inner, Runnable):
+            return None
+        model = inner
+    return model
+
+def hedged(model: Runnable) -> Runnable:
+    """标记调用开启对冲（LLM_HEDGE=1 时生效）；未经 with_transport 包装的模型原样返回，避免把参数发给服务端"""
+    return model.bind(**{HEDGE_KWARG: True}) if _transport_of(model) is not None else model
+
+def with_transport(model: BaseChatModel, endpoint: str = "") -> BaseChatModel:
+    # 对冲等待时间按模型分别统计，快模型与慢模型的 p95 不混在一起
+    return ResilientChatModel(model=model, limiter=limiter_for(endpoint), hedge_policy=HedgePolicy())
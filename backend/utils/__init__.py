@@ -1,2 +1,3 @@
 # 工具箱
-from .create_streaming_node import execute_agent_node, call_team
\ No newline at end of file
+from .create_streaming_node import execute_agent_node, call_team
+from .context import ContextPolicy, build_context
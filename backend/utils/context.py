@@ -0,0 +1,96 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
+
+@dataclass(frozen=True)
+class ContextPolicy:
+    """单个节点的上下文预算配置"""
+    max_tokens: int = 6000  # 发送给模型的历史消息 token 上限（估算值）
+    keep_recent: int = 4  # 末尾保留原文的消息条数
+    digest_chars: int = 600  # 较早的工具/智能体输出压缩后的最大字符数
+    summarize: bool = False  # True 时用模型生成摘要，否则截取开头
+
+# 摘要缓存：内容哈希 -> 摘要，同一条消息只压缩一次
+_SUMMARY_CACHE_SIZE = 2048
+_summary_cache: "OrderedDict[str, str]" = OrderedDict()
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按 1 个 token，其余按 4 个字符 1 个 token"""
+    cjk = sum(1 for ch in text if "\u2e80" <= ch <= "\u9fff" or "\uf900" <= ch <= "\ufaff")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+def message_tokens(msg: BaseMessage) -> int:
+    content = msg.content if isinstance(msg.content, str) else str(msg.content)
+    return estimate_tokens(content) + 4
+
+def find_user_question(history: List[BaseMessage]) -> Optional[BaseMessage]:
+    """返回用户的原始问题（第一条没有 name 的 HumanMessage）"""
+    for msg in history:
+        if isinstance(msg, HumanMessage) and not msg.name:
+            return msg
+    return None
+
+def _is_output(msg: BaseMessage) -> bool:
+    """工具结果或工作智能体/团队的输出（带 name 的 HumanMessage）"""
+    return isinstance(msg, ToolMessage) or (isinstance(msg, HumanMessage) and bool(msg.name))
+
+async def _digest(content: str, policy: ContextPolicy, llm: Optional[BaseChatModel]) -> str:
+    if len(content) <= policy.digest_chars:
+        return content
+    key = hashlib.sha1(
+        f"{policy.summarize}:{policy.digest_chars}:{content}".encode("utf-8")
+    ).hexdigest()
+    if key in _summary_cache:
+        _summary_cache.move_to_end(key)
+        return _summary_cache[key]
+
+    if policy.summarize and llm is not None:
+        prompt = (
+            f"请将以下内容压缩为不超过{policy.digest_chars}字的摘要，"
+            f"保留关键事实、数据和链接，不要添加评论：\n{content}"
+        )
+        response = await llm.ainvoke([HumanMessage(content=prompt)])
+        summary = f"[摘要] {response.content.strip()}"
+    else:
+        summary = f"{content[:policy.digest_chars]}\n…[已截断，原文 {len(content)} 字]"
+
+    _summary_cache[key] = summary
+    if len(_summary_cache) > _SUMMARY_CACHE_SIZE:
+        _summary_cache.popitem(last=False)
+    return summary
+
+async def build_context(
+    history: List[BaseMessage],
+    policy: Optional[ContextPolicy],
+    llm: Optional[BaseChatModel] = None,
+) -> List[BaseMessage]:
+    """按预算裁剪历史消息：始终保留原始问题，压缩较早的输出，超出预算时从最早的消息开始丢弃"""
+    if policy is None:
+        return list(history)
+
+    question = find_user_question(history)
+    rest = [msg for msg in history if msg is not question]
+    recent_start = max(0, len(rest) - policy.keep_recent)
+
+    # 较早的工具/智能体输出替换为摘要，末尾 keep_recent 条保留原文
+    window = []
+    for i, msg in enumerate(rest):
+        if i < recent_start and _is_output(msg) and isinstance(msg.content, str):
+            digest = await _digest(msg.content, policy, llm)
+            if digest is not msg.content:
+                msg = msg.model_copy(update={"content": digest})
+        window.append(msg)
+
+    budget = policy.max_tokens - (message_tokens(question) if question else 0)
+    total = sum(message_tokens(msg) for msg in window)
+    # 仍超出预算：从最早的消息开始丢弃，至少保留最后一条
+    while len(window) > 1 and total > budget:
+        total -= message_tokens(window.pop(0))
+    # 不能以孤立的工具结果开头
+    while len(window) > 1 and isinstance(window[0], ToolMessage):
+        window.pop(0)
+
+    return ([question] if question else []) + window
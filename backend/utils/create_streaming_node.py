@@ -1,33 +1,61 @@
-from typing import Callable, Literal, TypeVar
+import logging
+from typing import Callable, Literal, Optional, TypeVar
 from langgraph.types import Command
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import HumanMessage
-from graph.state import State
+from graph.state import State, TeamResult, merge_unique
+from graph.events import TEAM_KEY, WORKER_KEY, WORKER_STREAM_TAG
+from logs import fields
+from .context import ContextPolicy, build_context
+from .handoff import collect_references, format_team_result, handoff_messages
 
-async def execute_agent_node(agent, state: State, node_name: str, node_display_name: str) -> Command[Literal["supervisor"]]:
+logger = logging.getLogger(__name__)
+
+async def execute_agent_node(
+    agent,
+    state: State,
+    node_name: str,
+    node_display_name: str,
+    context_policy: Optional[ContextPolicy] = None,
+    summary_llm: Optional[BaseChatModel] = None,
+) -> Command[Literal["supervisor"]]:
     """针对您具体输出格式的专用版本"""
     full_content = ""
-    print(f"\n{node_display_name} 开始工作...")
+    artifacts, sources = [], []
+    logger.info("%s 开始工作", node_display_name)
     
     try:
-        async for chunk in agent.astream(state):
+        # 按预算裁剪后再交给智能体，避免提示词随跳数无限增长
+        messages = await build_context(state["messages"], context_policy, summary_llm)
+        # 带上标签与节点名，智能体内部的模型 token 与工具事件可由事件流转发给前端
+        config = {"tags": [WORKER_STREAM_TAG], "metadata": {WORKER_KEY: node_name}}
+        async for chunk in agent.astream({"messages": messages}, config):
             # 针对您的具体输出格式提取
             content = extract_specific_format(chunk)
             if content:
                 full_content += content + "\n"
-                print(content, end="", flush=True)
+                logger.debug("%s 输出: %s", node_display_name, content)
+            # 记录写入的文档与访问过的链接，随团队结果交回上级
+            for step in chunk.values() if isinstance(chunk, dict) else ():
+                for message in (step or {}).get("messages", ()):
+                    found_artifacts, found_sources = collect_references(message)
+                    artifacts += found_artifacts
+                    sources += found_sources
     
     except Exception as e:
         error_msg = f"\n❌ {node_display_name} 出错: {e}"
         full_content += error_msg
-        print(error_msg)
+        logger.warning("%s 出错: %s", node_display_name, e)
     
-    print(f"\n✅ {node_display_name} 完成")
+    logger.info("%s 完成", node_display_name)
     
     return Command(
         update={
             "messages": [
                 HumanMessage(content=full_content.strip(), name=node_name)
-            ]
+            ],
+            "artifacts": artifacts,
+            "sources": sources,
         },
         goto="supervisor",
     )
@@ -42,84 +70,63 @@ def extract_specific_format(chunk) -> str:
                 return message.content
     return ""
 
-async def call_team(team_graph, state: State, team_name: str, team_display_name: str) -> Command[Literal["supervisor"]]:
-    """调试版本：查看团队完整输出"""
-    full_content = ""
-    print(f"\n{team_display_name} 开始工作...")
-    
+async def call_team(
+    team_graph,
+    state: State,
+    team_name: str,
+    team_display_name: str,
+    context_policy: Optional[ContextPolicy] = None,
+) -> Command[Literal["supervisor"]]:
+    """调用团队子图：输入原始问题与此前的团队结果，逐步合并子图的更新，只保留结构化结果"""
+    logger.info("%s 开始工作", team_display_name)
+    summary = ""
+    last_output = ""
+    artifacts, sources = [], []
+
     try:
-        input_data = {"messages": state["messages"][-1]}
-        all_outputs = []
-        
-        async for chunk in team_graph.astream(input_data):
-            print(f"📦 {team_display_name} 块: {list(chunk.keys())}")
-            
-            # 详细记录每个块的内容
-            chunk_info = {}
-            for key, value in chunk.items():
-                if isinstance(value, dict) and 'messages' in value:
-                    messages_content = []
-                    for msg in value['messages']:
-                        if hasattr(msg, 'content') and msg.content:
-                            messages_content.append(msg.content)
-                    if messages_content:
-                        chunk_info[key] = messages_content
-            
-            all_outputs.append(chunk_info)
-            
-            # 特别关注监督者的最终决策
-            if 'supervisor' in chunk and isinstance(chunk['supervisor'], dict):
-                supervisor_data = chunk['supervisor']
-                print(f"🔍 监督者数据: {supervisor_data}")
-                
-                if supervisor_data.get('next') == '__end__':
-                    print("🎯 找到最终决策点")
-                    # 尝试各种方式提取内容
-                    final_content = extract_final_content(supervisor_data)
-                    if final_content:
-                        full_content = final_content
-                        break
-        
-        # 如果没有找到最终内容，输出调试信息
-        if not full_content:
-            debug_info = f"{team_display_name} 调试信息:\n"
-            for i, output in enumerate(all_outputs):
-                debug_info += f"块{i+1}: {output}\n"
-            full_content = debug_info
-    
+        messages = await handoff_messages(state, context_policy)
+        # 子图需要知道已有的文档，才能在其基础上编辑而不是重写
+        input_data = {"messages": messages, "artifacts": state.get("artifacts") or []}
+
+        # 团队名写入元数据，由团队内所有节点继承，用于标记转发给前端的事件来源
+        async for chunk in team_graph.astream(input_data, {"metadata": {TEAM_KEY: team_name}}, stream_mode="updates"):
+            for node, update in chunk.items():
+                if not isinstance(update, dict):
+                    continue
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("%s 更新", team_display_name, extra=fields(node=node, keys=",".join(update)))
+                artifacts += update.get("artifacts") or []
+                sources += update.get("sources") or []
+                if update.get("final_answer"):
+                    summary = update["final_answer"]
+                for msg in update.get("messages") or []:
+                    if getattr(msg, "content", None):
+                        last_output = msg.content
+
+        if not summary:
+            # 子图未经监督者 FINISH 结束（如达到递归上限）：退回最后一条输出
+            summary = last_output or f"{team_display_name} 未给出结果"
     except Exception as e:
-        error_msg = f"\n❌ {team_display_name} 出错: {e}"
-        full_content = error_msg
-        print(error_msg)
-    
-    print(f"\n✅ {team_display_name} 完成")
-    
+        summary = f"❌ {team_display_name} 出错: {e}"
+        logger.warning("%s 出错: %s", team_display_name, e)
+
+    result = TeamResult(
+        team=team_name,
+        summary=summary.strip(),
+        artifacts=merge_unique([], artifacts),
+        sources=merge_unique([], sources),
+    )
+    logger.info("%s 完成", team_display_name,
+                extra=fields(artifacts=len(result["artifacts"]), sources=len(result["sources"])))
+
     return Command(
         update={
             "messages": [
-                HumanMessage(content=full_content.strip(), name=team_name)
-            ]
+                HumanMessage(content=format_team_result(result), name=team_name)
+            ],
+            "team_results": [result],
+            "artifacts": result["artifacts"],
+            "sources": result["sources"],
         },
         goto="supervisor",
     )
-
-def extract_final_content(supervisor_data: dict) -> str:
-    """调试版最终内容提取"""
-    print("🔍 详细检查监督者数据:")
-    print(f"  keys: {list(supervisor_data.keys())}")
-    
-    if 'update' in supervisor_data:
-        update = supervisor_data['update']
-        print(f"  update: {update}")
-        if 'final_answer' in update:
-            print(f"  final_answer: {update['final_answer']}")
-            return update['final_answer']
-        if 'messages' in update:
-            print(f"  update messages: {update['messages']}")
-    
-    if 'messages' in supervisor_data:
-        print(f"  messages: {supervisor_data['messages']}")
-        for i, msg in enumerate(supervisor_data['messages']):
-            print(f"    消息{i}: {type(msg)}, content: {getattr(msg, 'content', '无')}")
-    
-    return ""
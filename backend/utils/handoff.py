@@ -0,0 +1,49 @@
+import re
+from typing import List, Optional, Tuple
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from graph.state import TeamResult
+from .context import ContextPolicy, build_context, find_user_question
+
+# 写入文档的工具及其文件名参数；read_document 只读，不算产出
+DOCUMENT_TOOLS = ("write_document", "edit_document", "create_outline")
+_URL_PATTERN = re.compile(r"https?://[^\s\"'<>()\[\]{}，。；]+")
+
+def collect_references(message: BaseMessage) -> Tuple[List[str], List[str]]:
+    """从智能体的工具调用与工具结果中提取 (文档名, 链接)"""
+    artifacts, sources = [], []
+    if isinstance(message, AIMessage):
+        for call in message.tool_calls:
+            args = call.get("args") or {}
+            if call["name"] in DOCUMENT_TOOLS and args.get("file_name"):
+                artifacts.append(args["file_name"])
+            elif call["name"] == "scrape_webpages":
+                sources.extend(url for url in args.get("urls") or [] if isinstance(url, str))
+    elif isinstance(message, ToolMessage) and message.name == "tavily_search":
+        sources.extend(_URL_PATTERN.findall(str(message.content)))
+    return artifacts, sources
+
+def format_team_result(result: TeamResult, max_sources: int = 10) -> str:
+    """团队结果写入上级历史时的文本形式：总结在前，产出与来源各占一行"""
+    lines = [result["summary"]]
+    if result["artifacts"]:
+        lines.append("文档：" + "，".join(result["artifacts"]))
+    if result["sources"]:
+        shown = result["sources"][:max_sources]
+        more = len(result["sources"]) - len(shown)
+        lines.append("来源：" + " ".join(shown) + (f" 等 {len(result['sources'])} 个" if more > 0 else ""))
+    return "\n".join(lines)
+
+async def handoff_messages(
+    state: dict, policy: Optional[ContextPolicy], llm: Optional[BaseChatModel] = None
+) -> List[BaseMessage]:
+    """交给子团队的输入：原始问题加上此前各团队的结构化结果，按预算裁剪"""
+    history = state["messages"]
+    question = find_user_question(history)
+    results = state.get("team_results") or []
+    if not results:
+        # 尚无团队结果（首次派发）：沿用上级历史，由预算裁剪
+        return await build_context(history, policy, llm)
+    messages = [question] if question else []
+    messages += [HumanMessage(content=format_team_result(r), name=r["team"]) for r in results]
+    return await build_context(messages, policy, llm)